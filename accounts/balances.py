@@ -0,0 +1,164 @@
+"""Server-maintained running balance of every account.
+
+`balance` stays the opening balance the user entered; `currentBalance` is that
+plus all income minus all expenses, stored as Decimal128 so repeated $inc
+never accumulates float error. Every transaction write moves it with an $inc
+(through apply_rollups), and the reconciliation job recomputes it from the
+transactions collection in batches, repairing any drift:
+
+    python -m accounts.balances [--batch-size 500] [--dry-run]
+"""
+import argparse
+import time
+from decimal import Decimal
+
+from bson import Decimal128
+from pymongo import ASCENDING, UpdateOne
+
+from app import config
+from database import accounts_collection, get_sync_db
+
+
+def to_decimal(value) -> Decimal:
+    """Exact decimal for a stored amount; floats go through their shortest repr"""
+    if value is None:
+        return Decimal(0)
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def _tidy(value: Decimal) -> Decimal:
+    # $toDecimal pads doubles to 15 significant digits; drop the trailing zeros
+    value = value.normalize()
+    return value.quantize(Decimal(1)) if value.as_tuple().exponent > 0 else value
+
+
+def balance_updates(transactions, sign: int = 1):
+    """$inc operations moving each account's currentBalance by the given transactions"""
+    deltas = {}
+    for txn in transactions:
+        if txn.get("type") not in ("income", "expense"):
+            continue
+        amount = to_decimal(txn.get("amount"))
+        delta = amount if txn["type"] == "income" else -amount
+        deltas[txn["accountId"]] = deltas.get(txn["accountId"], Decimal(0)) + sign * delta
+
+    # Accounts that predate running balances are left for the reconciliation job to initialise
+    return [
+        UpdateOne(
+            {"_id": account_id, "currentBalance": {"$exists": True}},
+            {"$inc": {"currentBalance": Decimal128(delta)}},
+        )
+        for account_id, delta in deltas.items()
+        if delta
+    ]
+
+
+async def apply_balances(transactions, sign: int = 1, session=None):
+    updates = balance_updates(transactions, sign)
+    if updates:
+        await accounts_collection.bulk_write(updates, ordered=False, session=session)
+
+
+def opening_balance_update(updates: dict, previous_balance) -> dict:
+    """Update document setting `updates` and shifting currentBalance by the opening balance change"""
+    update = {"$set": updates}
+    delta = to_decimal(updates.get("balance", previous_balance)) - to_decimal(previous_balance)
+    if delta:
+        update["$inc"] = {"currentBalance": Decimal128(delta)}
+    return update
+
+
+def transaction_totals_pipeline(account_ids):
+    # Income and expense summed apart (net is taken client-side), all in Decimal128
+    def total(type):
+        return {"$sum": {"$cond": [{"$eq": ["$type", type]}, {"$toDecimal": "$amount"}, 0]}}
+
+    return [
+        {"$match": {"accountId": {"$in": account_ids}}},
+        {"$group": {"_id": "$accountId", "income": total("income"), "expense": total("expense")}},
+    ]
+
+
+def expected_balances(sync_db, accounts) -> dict:
+    totals = {
+        row["_id"]: _tidy(to_decimal(row["income"]) - to_decimal(row["expense"]))
+        for row in sync_db.transactions.aggregate(transaction_totals_pipeline([acc["_id"] for acc in accounts]))
+    }
+    return {acc["_id"]: to_decimal(acc.get("balance")) + totals.get(acc["_id"], Decimal(0)) for acc in accounts}
+
+
+def find_drift(sync_db, accounts) -> dict:
+    """account _id -> (stored currentBalance, expected balance) for every mismatch"""
+    expected = expected_balances(sync_db, accounts)
+    return {
+        acc["_id"]: (acc.get("currentBalance"), expected[acc["_id"]])
+        for acc in accounts
+        if acc.get("currentBalance") is None or to_decimal(acc["currentBalance"]) != expected[acc["_id"]]
+    }
+
+
+def reconcile_balances(sync_db, batch_size: int = None, settle_seconds: float = None, repair: bool = True):
+    """Verify every account's currentBalance against its transactions and repair drift.
+
+    A transaction write lands in `transactions` a moment before its $inc lands
+    on the account, so a mismatch is re-checked after `settle_seconds` and only
+    repaired if it is still there with the same stored value. The repair is a
+    compare-and-set on that value, so it never overwrites a concurrent $inc.
+    """
+    started = time.monotonic()
+    batch_size = batch_size or config.BALANCE_RECONCILE_BATCH_SIZE
+    settle_seconds = config.BALANCE_RECONCILE_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    stats = {"accounts": 0, "drifted": 0, "repaired": 0}
+    projection = {"balance": 1, "currentBalance": 1}
+
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        accounts = list(sync_db.accounts.find(query, projection).sort("_id", ASCENDING).limit(batch_size))
+        if not accounts:
+            break
+        last_id = accounts[-1]["_id"]
+        stats["accounts"] += len(accounts)
+
+        drift = find_drift(sync_db, accounts)
+        if drift and settle_seconds:
+            time.sleep(settle_seconds)
+            rechecked = list(sync_db.accounts.find({"_id": {"$in": list(drift)}}, projection))
+            again = find_drift(sync_db, rechecked)
+            drift = {
+                account_id: values for account_id, values in again.items()
+                if values[0] == drift[account_id][0]
+            }
+        stats["drifted"] += len(drift)
+
+        if repair and drift:
+            result = sync_db.accounts.bulk_write([
+                UpdateOne(
+                    {"_id": account_id, "currentBalance": stored},
+                    {"$set": {"currentBalance": Decimal128(expected)}},
+                )
+                for account_id, (stored, expected) in drift.items()
+            ], ordered=False)
+            stats["repaired"] += result.modified_count
+        for account_id, (stored, expected) in drift.items():
+            print(f"⚠️ Balance drift on account {account_id}: stored {stored}, expected {expected}")
+
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    print(f"✅ Balance reconciliation finished: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify and repair account running balances")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="report drift without repairing it")
+    args = parser.parse_args()
+    reconcile_balances(get_sync_db(), batch_size=args.batch_size, repair=not args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
-from schemas import AccountCreate, AccountResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from schemas import AccountCreate, AccountResponse, AccountDetailResponse, AccountPageResponse, AccountSummaryResponse
 from database import db
 from datetime import datetime
 from bson import ObjectId
 from decimal import Decimal
-from typing import List, Optional
+from typing import List, Optional, Literal, Union
+import asyncio
 from pydantic import BaseModel
+from app import config
+from transactions.services import (
+    build_transaction_query,
+    decode_cursor,
+    get_transactions_page,
+    link_transaction,
+    month_range,
+)
+from transactions.rollups import apply_rollups, get_month_rollup
+from app.cache import account_tag, cached_json, invalidate, user_tag, versioned_key
+from app.coalesce import single_flight
+from app.ratelimit import limited
+from app.serialization import ACCOUNT_DETAIL_FIELDS, ACCOUNT_PAGE_FIELDS, ACCOUNT_SUMMARY_FIELDS, encode_account
+from accounts.services import account_stats, recent_transactions
+from accounts.balances import opening_balance_update, to_decimal
+from bson import Decimal128
+from pymongo.errors import DuplicateKeyError
 
 
 
@@ -28,19 +46,61 @@ def convert_decimal_to_float(data):
         return data
 
 
-@router.get("/account/{clerkId}", response_model=List[AccountResponse])
-async def getaccounts(clerkId:str):
-    accounts = await db.accounts.find({"clerkUserId": clerkId}).to_list(100)
-
-    response = []
-    for acc in accounts:
-        acc = convert_decimal_to_float(acc)
-        acc["id"] = str(acc.pop("_id"))
-        response.append(AccountResponse(**acc))
-
-    return response
+@router.get(
+    "/account/{clerkId}",
+    response_model=List[Union[AccountDetailResponse, AccountSummaryResponse]],
+    dependencies=limited("reads"),
+)
+async def getaccounts(
+    clerkId:str,
+    request: Request,
+    view: Literal["summary", "detailed"] = "detailed",
+    include: Optional[Literal["transactions"]] = None,
+    limit: int = Query(10, ge=1, le=100, description="Recent transactions per account with include=transactions"),
+):
+    """List a user's accounts with server-computed balance, count and last activity.
+
+    Transaction histories are never loaded; `include=transactions` embeds only
+    the most recent `limit` per account.
+    """
+    async def build():
+        accounts = await db.accounts.find(
+            {"clerkUserId": clerkId}, {"transactions": 0}
+        ).to_list(100)
+        account_ids = [acc["_id"] for acc in accounts]
+
+        stats = await account_stats(account_ids)
+        recent = {}
+        if include == "transactions":
+            pages = await asyncio.gather(*(recent_transactions(i, limit) for i in account_ids))
+            recent = dict(zip(account_ids, pages))
+
+        # Trusted DB documents are encoded directly, without building response models
+        response = []
+        for acc in accounts:
+            acc_stats = stats[acc["_id"]]
+            if acc.get("currentBalance") is None:
+                # Not yet initialised by the reconciliation job
+                acc["currentBalance"] = float(acc.get("balance", 0)) + acc_stats["income"] - acc_stats["expense"]
+            acc["transactionCount"] = acc_stats["count"]
+            acc["lastActivity"] = acc_stats["lastActivity"]
+            acc["transactions"] = recent.get(acc["_id"], [])
+
+            if view == "summary":
+                item = encode_account(acc, ACCOUNT_SUMMARY_FIELDS)
+                if not include:
+                    item.pop("transactions")
+            else:
+                item = encode_account(acc, ACCOUNT_DETAIL_FIELDS)
+            response.append(item)
+
+        return response
+
+    return await cached_json(
+        request, "getaccounts", [user_tag(clerkId)], build, vary=f"{view}:{include}:{limit}"
+    )
 
-@router.post("/account", response_model=AccountResponse)
+@router.post("/account", response_model=AccountResponse, dependencies=limited("writes"))
 async def createaccount(data: AccountCreate):
     # Check for duplicate account name
     existing_account = await db.accounts.find_one({
@@ -58,19 +118,36 @@ async def createaccount(data: AccountCreate):
     # Prepare dict for insertion
     account_data = data.model_dump()
     account_data = convert_decimal_to_float(account_data)  # Fix Decimal -> float
+    transactions = account_data.pop("transactions", None) or []
     account_data["isDefault"] = is_default
+    # Moved by every transaction write from here on
+    account_data["currentBalance"] = Decimal128(to_decimal(account_data["balance"]))
     account_data["createdAt"] = now
     account_data["updatedAt"] = now
 
-    # Insert into DB
-    result = await db.accounts.insert_one(account_data)
+    # Insert into DB; the unique (clerkUserId, name) index catches a concurrent duplicate
+    try:
+        result = await db.accounts.insert_one(account_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Account already exists")
+
+    # Transactions live in their own collection, linked back by accountId
+    if transactions:
+        account_data["_id"] = result.inserted_id
+        linked = [link_transaction(txn, account_data) for txn in transactions]
+        await db.transactions.insert_many(linked)
+        await apply_rollups(linked)
+        account_data.pop("_id")
+    account_data["transactions"] = transactions
+    account_data.pop("currentBalance")
+    await invalidate(user_tag(data.clerkUserId))
 
     # Add the inserted ID for the response
     account_data["id"] = str(result.inserted_id)
 
     return AccountResponse(**account_data)
 
-@router.put("/account/{account_id}", response_model=AccountResponse)
+@router.put("/account/{account_id}", response_model=AccountResponse, dependencies=limited("writes"))
 async def updateaccount(data: AccountCreate, account_id: str):
     if not ObjectId.is_valid(account_id):
         raise HTTPException(status_code=400, detail="Invalid account ID")
@@ -79,23 +156,31 @@ async def updateaccount(data: AccountCreate, account_id: str):
     if not dbdata:
         raise HTTPException(status_code=404, detail="Account not found")
 
-    updatedata = data.model_dump()
+    updatedata = data.model_dump(exclude={"transactions"})
     updatedata = convert_decimal_to_float(updatedata)
     updatedata["updatedAt"] = datetime.utcnow()
 
-    await db.accounts.update_one(
-        {"_id": ObjectId(account_id)},
-        {"$set": updatedata}
+    # Guarded on the old opening balance so the running balance moves by exactly the change
+    result = await db.accounts.update_one(
+        {"_id": ObjectId(account_id), "balance": dbdata.get("balance")},
+        opening_balance_update(updatedata, dbdata.get("balance"))
+    )
+    if not result.matched_count:
+        raise HTTPException(status_code=409, detail="Account was modified concurrently, retry")
+    await invalidate(
+        account_tag(account_id), user_tag(dbdata["clerkUserId"]), user_tag(data.clerkUserId)
     )
 
     # Fetch updated document
-    updated_account = await db.accounts.find_one({"_id": ObjectId(account_id)})
+    updated_account = await db.accounts.find_one(
+        {"_id": ObjectId(account_id)}, {"transactions": 0}
+    )
     updated_account["id"] = str(updated_account.pop("_id"))
 
     return AccountResponse(**updated_account)
 
 
-@router.put("/defaultaccount/{account_id}", response_model=AccountResponse)
+@router.put("/defaultaccount/{account_id}", response_model=AccountResponse, dependencies=limited("writes"))
 async def updatedefaultaccount(data: AccountCreate, account_id: str):
     if not ObjectId.is_valid(account_id):
         raise HTTPException(status_code=400, detail="Invalid account ID")
@@ -108,99 +193,141 @@ async def updatedefaultaccount(data: AccountCreate, account_id: str):
             {"$set": {"isDefault": False}}
         )
 
-    updatedata = convert_decimal_to_float(data.model_dump())
+    updatedata = convert_decimal_to_float(data.model_dump(exclude={"transactions"}))
     updatedata["updatedAt"] = datetime.utcnow()
 
-    await db.accounts.update_one(
-        {"_id": ObjectId(account_id)},
-        {"$set": updatedata}
+    current = await db.accounts.find_one({"_id": ObjectId(account_id)}, {"balance": 1})
+    if not current:
+        raise HTTPException(status_code=404, detail="Account not found")
+    result = await db.accounts.update_one(
+        {"_id": ObjectId(account_id), "balance": current.get("balance")},
+        opening_balance_update(updatedata, current.get("balance"))
+    )
+    if not result.matched_count:
+        raise HTTPException(status_code=409, detail="Account was modified concurrently, retry")
+
+    # isDefault may have flipped on every account of this user
+    user_account_ids = await db.accounts.distinct("_id", {"clerkUserId": data.clerkUserId})
+    await invalidate(
+        user_tag(data.clerkUserId), account_tag(account_id),
+        *(account_tag(acc_id) for acc_id in user_account_ids)
     )
 
-    updated_account = await db.accounts.find_one({"_id": ObjectId(account_id)})
+    updated_account = await db.accounts.find_one(
+        {"_id": ObjectId(account_id)}, {"transactions": 0}
+    )
     updated_account["id"] = str(updated_account.pop("_id"))
 
     return AccountResponse(**updated_account)
 
 
-@router.get("/singleaccount/{account_id}", response_model=AccountResponse)
-async def get_account(account_id: str):
+@router.get("/singleaccount/{account_id}", response_model=AccountPageResponse, dependencies=limited("reads"))
+async def get_account(
+    account_id: str,
+    request: Request,
+    limit: int = Query(config.TRANSACTIONS_PAGE_SIZE, ge=1, le=config.TRANSACTIONS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """The account with one keyset page of its transactions, newest first"""
     if not ObjectId.is_valid(account_id):
         raise HTTPException(status_code=400, detail="Invalid account ID")
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    async def build():
+        account = await db.accounts.find_one(
+            {"_id": ObjectId(account_id)}, {"transactions": 0}
+        )
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
 
-    account = await db.accounts.find_one({"_id": ObjectId(account_id)})
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
-
-    account["id"] = str(account.pop("_id"))
-    return AccountResponse(**account)
+        query = build_transaction_query(account["_id"], after=after)
+        account["transactions"], account["nextCursor"] = await get_transactions_page(query, limit)
+        return encode_account(account, ACCOUNT_PAGE_FIELDS)
 
-@router.get("/useraccount/{user_id}")
-async def get_user_accounts(user_id: str):
-    accounts = await db.accounts.find({"clerkUserId": user_id},{"name": 1}).to_list(100)
-    return [account["name"] for account in accounts]
+    return await cached_json(
+        request, "get_account", [account_tag(account_id)], build, vary=f"{limit}:{cursor}"
+    )
 
-@router.get("/expenses/monthly/{clerk_id}")
-async def get_default_account_expenses(clerk_id: str):
-    # Step 1: Get the default account
-    account = await db.accounts.find_one({
-        "clerkUserId": clerk_id,
-        "isDefault": True
-    })
-    if not account:
+@router.get("/useraccount/{user_id}", dependencies=limited("reads"))
+async def get_user_accounts(user_id: str, request: Request):
+    async def build():
+        accounts = await db.accounts.find({"clerkUserId": user_id},{"name": 1}).to_list(100)
+        return [account["name"] for account in accounts]
+
+    return await cached_json(request, "get_user_accounts", [user_tag(user_id)], build)
+
+@router.get("/expenses/monthly/{clerk_id}", dependencies=limited("reads"))
+async def get_default_account_expenses(
+    clerk_id: str,
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="YYYY-MM, defaults to the current month"),
+):
+    # Step 1: Get the requested month's start and next month start
+    if month:
+        year, month_number = map(int, month.split("-"))
+        if not 1 <= month_number <= 12:
+            raise HTTPException(status_code=400, detail="Invalid month")
+    else:
+        now = datetime.utcnow()
+        year, month_number = now.year, now.month
+    start_date, _ = month_range(year, month_number)
+
+    # Step 2: Get the default account and the month's maintained rollup (a single indexed document)
+    async def load():
+        account = await db.accounts.find_one({
+            "clerkUserId": clerk_id,
+            "isDefault": True
+        }, {"transactions": 0})
+        if not account:
+            return None
+        return account, await get_month_rollup(account["_id"], start_date.strftime("%Y-%m")) or {}
+
+    # Clients poll this several times a second; concurrent identical polls share the reads
+    key = await versioned_key("expenses_monthly", [user_tag(clerk_id)], start_date.strftime("%Y-%m"))
+    loaded = await single_flight(key, load)
+    if loaded is None:
         raise HTTPException(status_code=404, detail="Default account not found")
-
-    # Step 2: Get current month start and next month start
-    now = datetime.utcnow()
-    start_date = datetime(now.year, now.month, 1)
-    next_month = start_date.replace(month=start_date.month % 12 + 1, day=1)
-    end_date = next_month
-
-    # Step 3: Fetch transactions
-    transactions = account.get("transactions", [])
-
-    # Step 4: Filter expense transactions only for this month
-    expense_transactions = []
-    for t in transactions:
-        if t.get("type", "").lower() != "expense":
-            continue
-
-        t_date = t.get("date")
-        if not t_date:
-            continue
-
-        # Ensure datetime object
-        if isinstance(t_date, str):
-            try:
-                t_date = datetime.fromisoformat(t_date)
-            except ValueError:
-                continue
-
-        if start_date <= t_date < end_date:
-            expense_transactions.append(t)
-
-    # Step 5: Calculate total expense amount
-    total_expense = sum(float(t.get("amount", 0)) for t in expense_transactions)
+    account, rollup = loaded
+
+    # Step 3: Expense total and per-category breakdown
+    breakdown = sorted(
+        (
+            {"category": category, "amount": float(totals.get("expense", 0))}
+            for category, totals in rollup.get("categories", {}).items()
+            if totals.get("expense")
+        ),
+        key=lambda c: c["amount"],
+        reverse=True,
+    )
+    total_expense = float(rollup.get("expense", 0))
 
     return {
         "accountName": account["name"],
         "budget": account.get("budget", 0),
         "totalExpense": total_expense,
-        "accountId":str(account["_id"])
+        "accountId":str(account["_id"]),
+        "month": start_date.strftime("%Y-%m"),
+        "categories": breakdown
     }
 
 
 class BudgetUpdate(BaseModel):
     budget: float
 
-@router.post("/budget/{accountId}")
+@router.post("/budget/{accountId}", dependencies=limited("writes"))
 async def update_budget(accountId: str, data: BudgetUpdate):
 
-    result = await db["accounts"].update_one(
-        {"_id": ObjectId(accountId)},
-        {"$set": {"budget": data.budget}}
+    account = await db["accounts"].find_one_and_update(
+        {"_id": ObjectId(accountId), "budget": {"$ne": data.budget}},
+        {"$set": {"budget": data.budget}},
+        projection={"clerkUserId": 1}
     )
 
-    if result.modified_count == 0:
+    if not account:
         raise HTTPException(status_code=404, detail="Account not found or budget unchanged")
 
+    await invalidate(account_tag(accountId), user_tag(account["clerkUserId"]))
+
     return {"message": "Budget updated successfully"}
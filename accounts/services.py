@@ -0,0 +1,44 @@
+import asyncio
+
+from pymongo import DESCENDING
+
+from database import db
+from transactions.services import TRANSACTION_PROJECTION, TRANSACTION_SORT
+
+
+async def account_stats(account_ids):
+    """Totals, transaction count and last activity per account, without reading transactions in bulk"""
+    totals, latest = await asyncio.gather(
+        # Summed over the (few) monthly rollup documents of each account
+        db.account_rollups.aggregate([
+            {"$match": {"accountId": {"$in": account_ids}}},
+            {"$group": {
+                "_id": "$accountId",
+                "income": {"$sum": "$income"},
+                "expense": {"$sum": "$expense"},
+                "count": {"$sum": "$count"},
+            }},
+        ]).to_list(None),
+        # $sort + $group/$first on the accountId_date_id index prefix reads one key per account
+        db.transactions.aggregate([
+            {"$match": {"accountId": {"$in": account_ids}}},
+            {"$sort": {"accountId": 1, "date": DESCENDING}},
+            {"$group": {"_id": "$accountId", "lastActivity": {"$first": "$date"}}},
+        ]).to_list(None),
+    )
+
+    stats = {
+        account_id: {"income": 0, "expense": 0, "count": 0, "lastActivity": None}
+        for account_id in account_ids
+    }
+    for row in totals:
+        stats[row["_id"]].update(income=row["income"], expense=row["expense"], count=row["count"])
+    for row in latest:
+        stats[row["_id"]]["lastActivity"] = row["lastActivity"]
+    return stats
+
+
+async def recent_transactions(account_id, limit: int):
+    return await db.transactions.find(
+        {"accountId": account_id}, TRANSACTION_PROJECTION
+    ).sort(TRANSACTION_SORT).limit(limit).to_list(limit)
@@ -0,0 +1 @@
+from analytics import routes
\ No newline at end of file
@@ -0,0 +1,158 @@
+from datetime import datetime, timezone
+from typing import Literal, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil.relativedelta import relativedelta
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from analytics.services import (
+    budget_history,
+    budget_history_pipeline,
+    category_pipeline,
+    merchants_pipeline,
+    range_match,
+    series_pipeline,
+)
+from app.cache import cached_json, user_tag
+from app.ratelimit import limited
+from database import db
+from transactions.rollups import month_key
+from transactions.services import find_account
+
+router = APIRouter()
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Stored dates are naive UTC; an aware bound can't be compared with them (or utcnow)
+    if value is not None and value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def resolve_scope(clerk_user_id: str, from_date, to_date, account_name):
+    """Default to the last twelve months across all of the user's accounts"""
+    end = naive_utc(to_date) or datetime.utcnow()
+    start = naive_utc(from_date) or end - relativedelta(years=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="`from` must be before `to`")
+
+    account_id = None
+    if account_name:
+        account = await find_account(clerk_user_id, account_name)
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+        account_id = account["_id"]
+    return start, end, account_id
+
+
+def check_time_zone(tz: str) -> str:
+    # MongoDB fails the whole aggregation on a zone it doesn't know
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown time zone: {tz}")
+    return tz
+
+
+def _vary(*parts) -> str:
+    return ":".join("" if part is None else str(part) for part in parts)
+
+
+@router.get("/series/{clerkUserId}", dependencies=limited("analytics"))
+async def income_expense_series(
+    clerkUserId: str,
+    request: Request,
+    interval: Literal["daily", "weekly", "monthly"] = "monthly",
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    account: Optional[str] = Query(None, description="Account name; all accounts when omitted"),
+    tz: str = Query("UTC", description="IANA time zone the periods are aligned to"),
+):
+    check_time_zone(tz)
+    start, end, account_id = await resolve_scope(clerkUserId, from_date, to_date, account)
+
+    async def build():
+        pipeline = series_pipeline(range_match(clerkUserId, start, end, account_id), interval, tz)
+        series = await db.transactions.aggregate(pipeline).to_list(None)
+        return {"from": start, "to": end, "interval": interval, "series": series}
+
+    return await cached_json(
+        request, "analytics_series", [user_tag(clerkUserId)], build,
+        vary=_vary(interval, from_date, to_date, account, tz),
+    )
+
+
+@router.get("/categories/{clerkUserId}", dependencies=limited("analytics"))
+async def category_breakdown(
+    clerkUserId: str,
+    request: Request,
+    type: Literal["income", "expense"] = "expense",
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    account: Optional[str] = None,
+):
+    start, end, account_id = await resolve_scope(clerkUserId, from_date, to_date, account)
+
+    async def build():
+        pipeline = category_pipeline(range_match(clerkUserId, start, end, account_id), type)
+        categories = await db.transactions.aggregate(pipeline).to_list(None)
+        total = sum(row["total"] for row in categories)
+        for row in categories:
+            row["share"] = round(row["total"] / total, 4) if total else 0
+        return {"from": start, "to": end, "type": type, "total": total, "categories": categories}
+
+    return await cached_json(
+        request, "analytics_categories", [user_tag(clerkUserId)], build,
+        vary=_vary(type, from_date, to_date, account),
+    )
+
+
+@router.get("/merchants/{clerkUserId}", dependencies=limited("analytics"))
+async def top_merchants(
+    clerkUserId: str,
+    request: Request,
+    limit: int = Query(10, ge=1, le=100),
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    account: Optional[str] = None,
+):
+    start, end, account_id = await resolve_scope(clerkUserId, from_date, to_date, account)
+
+    async def build():
+        pipeline = merchants_pipeline(range_match(clerkUserId, start, end, account_id), limit)
+        merchants = await db.transactions.aggregate(pipeline).to_list(limit)
+        return {"from": start, "to": end, "merchants": merchants}
+
+    return await cached_json(
+        request, "analytics_merchants", [user_tag(clerkUserId)], build,
+        vary=_vary(limit, from_date, to_date, account),
+    )
+
+
+@router.get("/budget/{clerkUserId}", dependencies=limited("analytics"))
+async def budget_utilisation(
+    clerkUserId: str,
+    request: Request,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    account: Optional[str] = None,
+):
+    """Monthly expense against budget for every budgeted account (or just `account`)"""
+    start, end, account_id = await resolve_scope(clerkUserId, from_date, to_date, account)
+
+    async def build():
+        query = {"clerkUserId": clerkUserId, "budget": {"$ne": None}}
+        if account_id is not None:
+            query["_id"] = account_id
+        accounts = await db.accounts.find(query, {"name": 1, "budget": 1}).to_list(None)
+        rollups = await db.account_rollups.aggregate(budget_history_pipeline(
+            # `to` is exclusive, so a range ending on the 1st doesn't include that month
+            clerkUserId, month_key(start), month_key(end - relativedelta(microseconds=1)),
+            [acc["_id"] for acc in accounts],
+        )).to_list(None)
+        return {"from": start, "to": end, "history": budget_history(rollups, accounts)}
+
+    return await cached_json(
+        request, "analytics_budget", [user_tag(clerkUserId)], build,
+        vary=_vary(from_date, to_date, account),
+    )
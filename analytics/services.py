@@ -0,0 +1,110 @@
+"""Aggregation pipelines behind the analytics endpoints.
+
+Every pipeline starts with a $match on clerkUserId (or accountId) and a date
+range, so it is served by the clerkUserId_date / accountId_date_id indexes of
+the transactions collection; budget history reads the monthly rollups through
+their clerkUserId_month index. The builders are plain functions so the
+benchmark can run the exact same pipelines.
+"""
+from datetime import datetime
+
+INTERVAL_UNITS = {"daily": "day", "weekly": "week", "monthly": "month"}
+
+INCOME = {"$cond": [{"$eq": ["$type", "income"]}, "$amount", 0]}
+EXPENSE = {"$cond": [{"$eq": ["$type", "expense"]}, "$amount", 0]}
+
+
+def range_match(clerk_user_id: str, start: datetime, end: datetime, account_id=None) -> dict:
+    match = {"clerkUserId": clerk_user_id, "date": {"$gte": start, "$lt": end}}
+    if account_id is not None:
+        match["accountId"] = account_id
+    return match
+
+
+def series_pipeline(match: dict, interval: str, timezone: str = "UTC"):
+    trunc = {"date": "$date", "unit": INTERVAL_UNITS[interval], "timezone": timezone}
+    if interval == "weekly":
+        trunc["startOfWeek"] = "monday"
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"$dateTrunc": trunc},
+            "income": {"$sum": INCOME},
+            "expense": {"$sum": EXPENSE},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "_id": 0,
+            "period": "$_id",
+            "income": 1,
+            "expense": 1,
+            "net": {"$subtract": ["$income", "$expense"]},
+            "count": 1,
+        }},
+    ]
+
+
+def category_pipeline(match: dict, type: str):
+    return [
+        {"$match": {**match, "type": type}},
+        {"$group": {
+            "_id": {"$ifNull": ["$category", "uncategorized"]},
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"total": -1}},
+        {"$project": {"_id": 0, "category": "$_id", "total": 1, "count": 1}},
+    ]
+
+
+def merchants_pipeline(match: dict, limit: int):
+    # Descriptions are the closest thing to a merchant name; group them case-insensitively
+    merchant = {"$toLower": {"$trim": {"input": "$description"}}}
+    return [
+        {"$match": {**match, "type": "expense", "description": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": merchant,
+            "name": {"$first": "$description"},
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "lastSeen": {"$max": "$date"},
+        }},
+        {"$sort": {"total": -1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "merchant": "$name", "total": 1, "count": 1, "lastSeen": 1}},
+    ]
+
+
+def budget_history_pipeline(clerk_user_id: str, start_month: str, end_month: str, account_ids):
+    return [
+        {"$match": {
+            "clerkUserId": clerk_user_id,
+            "month": {"$gte": start_month, "$lte": end_month},
+            "accountId": {"$in": account_ids},
+        }},
+        {"$sort": {"month": 1}},
+        {"$project": {"_id": 0, "accountId": 1, "month": 1, "expense": 1, "income": 1}},
+    ]
+
+
+def budget_history(rollups, accounts) -> list:
+    """Join monthly rollups with each account's budget.
+
+    Budgets aren't versioned, so every month is measured against the current one.
+    """
+    by_id = {acc["_id"]: acc for acc in accounts}
+    history = []
+    for row in rollups:
+        account = by_id[row["accountId"]]
+        budget = float(account["budget"])
+        expense = row.get("expense", 0)
+        history.append({
+            "accountId": str(row["accountId"]),
+            "accountName": account["name"],
+            "month": row["month"],
+            "budget": budget,
+            "expense": expense,
+            "utilisation": round(expense / budget, 4) if budget else None,
+        })
+    return history
@@ -0,0 +1,150 @@
+"""Response cache for hot account/user reads.
+
+Entries are tagged (`user:<clerkUserId>`, `account:<accountId>`, ...). Every
+tag has a generation counter that is part of the cache key, so invalidating a
+tag is a single increment and stale entries simply stop being addressed until
+they age out. Responses carry an ETag and honour If-None-Match with a 304.
+
+CACHE_BACKEND selects `memory` (per-process LRU with TTL), `redis` (shared,
+any Redis-compatible server via CACHE_URL) or `off`. Invalidation only reaches
+the process (memory) or server (redis) holding the entries, so `memory` is the
+default only for a single worker (WEB_CONCURRENCY).
+"""
+import hashlib
+import time
+from collections import OrderedDict, defaultdict
+
+from fastapi import Request, Response
+
+from app import config
+from app.coalesce import single_flight
+from app.serialization import dumps
+
+
+class MemoryCache:
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = defaultdict(int)
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def generations(self, tags):
+        return [self._generations[tag] for tag in tags]
+
+    async def invalidate(self, *tags):
+        for tag in tags:
+            self._generations[tag] += 1
+
+
+class RedisCache:
+    def __init__(self, client, ttl: int):
+        self.client = client
+        self.ttl = ttl
+
+    async def get(self, key: str):
+        return await self.client.get(f"cache:{key}")
+
+    async def set(self, key: str, value: bytes):
+        await self.client.set(f"cache:{key}", value, ex=self.ttl)
+
+    async def generations(self, tags):
+        values = await self.client.mget([f"gen:{tag}" for tag in tags])
+        return [int(value or 0) for value in values]
+
+    async def invalidate(self, *tags):
+        if tags:
+            pipe = self.client.pipeline()
+            for tag in tags:
+                pipe.incr(f"gen:{tag}")
+            await pipe.execute()
+
+
+def create_backend():
+    if config.CACHE_BACKEND == "redis":
+        import redis.asyncio as redis
+
+        return RedisCache(redis.from_url(config.CACHE_URL), config.CACHE_TTL_SECONDS)
+    if config.CACHE_BACKEND == "memory":
+        if config.WEB_CONCURRENCY > 1:
+            print("⚠️ CACHE_BACKEND=memory with several workers: other workers serve stale reads "
+                  "until CACHE_TTL_SECONDS after a write; use redis or off")
+        return MemoryCache(config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS)
+    return None
+
+
+backend = create_backend()
+
+# route -> {"hits": n, "misses": n}
+stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+
+def user_tag(clerk_user_id: str) -> str:
+    return f"user:{clerk_user_id}"
+
+
+def account_tag(account_id) -> str:
+    return f"account:{account_id}"
+
+
+def email_tag(email: str) -> str:
+    return f"email:{email}"
+
+
+async def invalidate(*tags):
+    if backend:
+        await backend.invalidate(*tags)
+
+
+def _json_response(body: bytes, etag: str, request: Request) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def versioned_key(route: str, tags, vary: str = "") -> str:
+    """Key that changes whenever one of `tags` is invalidated"""
+    generations = await backend.generations(tags) if backend else []
+    return ":".join([route, *tags, *map(str, generations), vary])
+
+
+async def cached_json(request: Request, route: str, tags, build, vary: str = ""):
+    """Serve `await build()` as JSON from the cache, keyed by route, tag generations and `vary`"""
+    key = await versioned_key(route, tags, vary)
+
+    async def render():
+        return dumps(await build())
+
+    if backend is None:
+        body = await single_flight(key, render)
+        return _json_response(body, f'"{hashlib.sha1(body).hexdigest()}"', request)
+
+    entry = await backend.get(key)
+    if entry is None:
+        stats[route]["misses"] += 1
+        # Concurrent misses on the same key share one build
+        body = await single_flight(key, render)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        await backend.set(key, etag.encode() + b"\n" + body)
+    else:
+        stats[route]["hits"] += 1
+        etag, body = entry.split(b"\n", 1)
+        etag = etag.decode()
+    return _json_response(body, etag, request)
@@ -0,0 +1,26 @@
+"""In-process single-flight for hot reads.
+
+Concurrent identical reads (same route, same arguments, same cache tag
+generations) share one in-flight database round trip: the first caller runs
+the query and everyone who arrives before it finishes awaits the same result.
+Because the key includes the tag generations, a read that starts after a write
+invalidated its tags never joins a flight that started before the write.
+"""
+import asyncio
+
+from app import metrics
+
+_flights = {}
+
+
+async def single_flight(key: str, load):
+    """`await load()`, shared with every concurrent caller passing the same key"""
+    flight = _flights.get(key)
+    if flight is None:
+        # A task, so one caller disconnecting doesn't cancel the query for the others
+        flight = asyncio.ensure_future(load())
+        _flights[key] = flight
+        flight.add_done_callback(lambda _: _flights.pop(key, None) if _flights.get(key) is flight else None)
+    else:
+        metrics.coalesced_reads.inc(key.split(":", 1)[0])
+    return await asyncio.shield(flight)
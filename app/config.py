@@ -4,6 +4,104 @@ import os
 load_dotenv()
 
 EMAIL_HOST = os.getenv("EMAIL_HOST")
-EMAIL_PORT = int(os.getenv("EMAIL_PORT"))
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_USERNAME = os.getenv("EMAIL_USERNAME")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+EMAIL_FROM = os.getenv("EMAIL_FROM") or EMAIL_USERNAME
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "true").lower() == "true"
+
+# MONGODB_URI is still read for deployments configured for the old cron client
+MONGO_URI = os.getenv("MONGO_URI") or os.getenv("MONGODB_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "finance")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+
+# "async" runs scheduled jobs inside each API worker (guarded by a Mongo lease),
+# "off" leaves them to a separate `python -m app.scheduler` process
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "async")
+SCHEDULER_POLL_SECONDS = int(os.getenv("SCHEDULER_POLL_SECONDS", 30))
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", 300))
+# Threads running job bodies (scheduled and manually triggered), kept apart from request handling
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_RUN_TTL_DAYS = int(os.getenv("JOB_RUN_TTL_DAYS", 30))
+
+# Change stream consumer for derived data and notifications (needs a replica set): "async" runs
+# it in the API workers (one at a time, via a Mongo lease), "off" leaves it to `python -m app.scheduler`.
+# The resume token is saved, and batched handler work flushed, every EVENTS_CHECKPOINT_SECONDS
+# or EVENTS_CHECKPOINT_EVERY events
+EVENTS_MODE = os.getenv("EVENTS_MODE", SCHEDULER_MODE)
+EVENTS_CHECKPOINT_SECONDS = float(os.getenv("EVENTS_CHECKPOINT_SECONDS", 2))
+EVENTS_CHECKPOINT_EVERY = int(os.getenv("EVENTS_CHECKPOINT_EVERY", 500))
+EVENTS_LEASE_SECONDS = int(os.getenv("EVENTS_LEASE_SECONDS", 30))
+
+# API worker processes; uvicorn --workers and gunicorn -w both default to WEB_CONCURRENCY
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+# Response cache for account/user reads: "memory", "redis" (needs the redis package) or "off".
+# "memory" is per process: a write only invalidates the worker that served it, so with several
+# workers the default is "redis" when CACHE_URL is set and "off" otherwise
+CACHE_BACKEND = os.getenv(
+    "CACHE_BACKEND",
+    "memory" if WEB_CONCURRENCY <= 1 else ("redis" if os.getenv("CACHE_URL") else "off"),
+)
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 60))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+
+# Per-tenant token buckets: RATE_LIMITS is "group=rate:burst,..." with rate in requests/second
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", CACHE_URL)
+RATE_LIMITS = os.getenv("RATE_LIMITS", "reads=10:20,writes=5:20,analytics=2:10,bulk=0.2:3")
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", 100000))
+
+TRANSACTIONS_PAGE_SIZE = int(os.getenv("TRANSACTIONS_PAGE_SIZE", 50))
+TRANSACTIONS_MAX_PAGE_SIZE = int(os.getenv("TRANSACTIONS_MAX_PAGE_SIZE", 500))
+
+# Bulk import
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 1000))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", 1000))
+IMPORT_IDEMPOTENCY_TTL_DAYS = int(os.getenv("IMPORT_IDEMPOTENCY_TTL_DAYS", 7))
+
+# Streaming export; parquet needs the optional pyarrow package
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_PARQUET_ROW_GROUP = int(os.getenv("EXPORT_PARQUET_ROW_GROUP", 50000))
+EXPORT_PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
+
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", 1000))
+
+# How long an Idempotency-Key (or client transaction id) replays the original response
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))
+
+# Instrumentation: commands slower than SLOW_QUERY_MS are logged with their filter shape;
+# requests faster than REQUEST_LOG_MIN_MS are counted in /metrics but not logged
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+REQUEST_LOG_MIN_MS = float(os.getenv("REQUEST_LOG_MIN_MS", 0))
+
+# Running balance reconciliation job
+BALANCE_RECONCILE_BATCH_SIZE = int(os.getenv("BALANCE_RECONCILE_BATCH_SIZE", 500))
+BALANCE_RECONCILE_SETTLE_SECONDS = float(os.getenv("BALANCE_RECONCILE_SETTLE_SECONDS", 2))
+
+# Monthly rollup reconciliation job
+ROLLUP_RECONCILE_BATCH_SIZE = int(os.getenv("ROLLUP_RECONCILE_BATCH_SIZE", 200))
+ROLLUP_RECONCILE_SETTLE_SECONDS = float(os.getenv("ROLLUP_RECONCILE_SETTLE_SECONDS", 2))
+
+# Outbound mail: EMAIL_CONCURRENCY pooled SMTP connections drain the `email_outbox` collection
+EMAIL_CONCURRENCY = int(os.getenv("EMAIL_CONCURRENCY", 8))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 200))
+EMAIL_POLL_SECONDS = int(os.getenv("EMAIL_POLL_SECONDS", 5))
+EMAIL_IDLE_SECONDS = int(os.getenv("EMAIL_IDLE_SECONDS", 30))
+MAIL_DISPATCHER_MODE = os.getenv("MAIL_DISPATCHER_MODE", SCHEDULER_MODE)
+
+# Monthly insights: LLM backend ("groq" or the local "fake"), worker pool and rate limit
+INSIGHTS_LLM = os.getenv("INSIGHTS_LLM", "groq")
+INSIGHTS_MODEL = os.getenv("INSIGHTS_MODEL", "llama3-70b-8192")
+INSIGHTS_CONCURRENCY = int(os.getenv("INSIGHTS_CONCURRENCY", 4))
+INSIGHTS_RATE_PER_MINUTE = int(os.getenv("INSIGHTS_RATE_PER_MINUTE", 30))
+INSIGHTS_TOP_EXPENSES = int(os.getenv("INSIGHTS_TOP_EXPENSES", 5))
+INSIGHTS_CACHE_TTL_DAYS = int(os.getenv("INSIGHTS_CACHE_TTL_DAYS", 120))
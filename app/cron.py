@@ -1,244 +1,151 @@
-from pymongo import MongoClient
-from bson import ObjectId
-from datetime import datetime,timedelta
-from app.email_utils import send_email
-from app import config
-import os
-import pytz
-from groq import Groq
-
-from pymongo import MongoClient
 from datetime import datetime
+from app.mailer import enqueue_emails_sync
 
-import uuid
+import time
+from transactions.recurring import process_due_schedules
+from database import get_sync_db
+from app.insights import send_monthly_insights
+from accounts.balances import reconcile_balances
+from transactions.rollups import reconcile_rollups
 
-def check_and_send_budget_emails():
-    client = MongoClient(os.getenv("MONGODB_URI"))
-    db = client["finance"]
-    print(db)
-    print(db.list_collection_names())
-
-    # Get start of this month
-    now = datetime.now()
-    start_of_month = datetime(now.year, now.month, 1)
-
-    accounts = db.accounts.find({})
-    account_count = 0
+def month_start(month: str) -> datetime:
+    return datetime.strptime(month, "%Y-%m")
 
-    for account in accounts:
-        account_count += 1
-        print(f"\n👉 Found account: {account.get('name')}")
 
-        transactions = account.get("transactions", [])
-        if not transactions:
-            print("⚠️ Skipping: No transactions")
-            continue
-
-        if account.get("budget") is None:
-            print("⚠️ Skipping: No budget set")
-            continue
+def not_alerted_since(start: datetime) -> dict:
+    """Accounts without a budget alert sent on or after `start`"""
+    return {"$or": [{"lastAlertSent": None}, {"lastAlertSent": {"$lt": start}}]}
 
-        # Filter only this month's expense transactions
-        monthly_expenses = [
-            txn for txn in transactions
-            if txn["type"] == "expense" and txn["date"] >= start_of_month
-        ]
 
-        expenses = sum(txn["amount"] for txn in monthly_expenses)
+def release_alert(account, start: datetime) -> tuple:
+    """Filter and update undoing this month's lastAlertSent claim when its alert wasn't queued"""
+    return (
+        {"_id": account["_id"], "lastAlertSent": {"$gte": start}},
+        {"$set": {"lastAlertSent": account.get("lastAlertSent")}},
+    )
 
-        print(f"✅ Checking account: {account['name']}")
-        print(f"Expenses (this month): {expenses}, Budget: {account['budget']}")
 
-        if expenses > account["budget"]:
-            print("🚨 Budget exceeded!")
-            user = db.users.find_one({"clerkUserId": account["clerkUserId"]})
-            if not user:
-                print("❌ User not found for Clerk ID:", account["clerkUserId"])
-                continue
+def budget_alert_pipeline(month: str, account_ids=None):
+    """Over-budget accounts for `month` that haven't been alerted this month, joined with
+    their user, computed entirely in MongoDB; `account_ids` narrows it to those accounts"""
+    match = {"budget": {"$exists": True, "$ne": None}, **not_alerted_since(month_start(month))}
+    if account_ids is not None:
+        match["_id"] = {"$in": list(account_ids)}
+    return [
+        {"$match": match},
+        {"$project": {"name": 1, "clerkUserId": 1, "budget": 1, "lastAlertSent": 1}},
+        {"$lookup": {
+            "from": "account_rollups",
+            "let": {"accountId": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$accountId", "$$accountId"]},
+                    {"$eq": ["$month", month]},
+                ]}}},
+                {"$project": {"_id": 0, "expense": 1}},
+            ],
+            "as": "rollup",
+        }},
+        {"$addFields": {"expenses": {"$ifNull": [{"$first": "$rollup.expense"}, 0]}}},
+        {"$match": {"$expr": {"$gt": ["$expenses", "$budget"]}}},
+        {"$lookup": {
+            "from": "users",
+            "let": {"clerkUserId": "$clerkUserId"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$clerkUserId", "$$clerkUserId"]}}},
+                {"$project": {"_id": 0, "email": 1, "name": 1}},
+                {"$limit": 1},
+            ],
+            "as": "user",
+        }},
+        {"$project": {"rollup": 0}},
+    ]
 
-            print(f"📧 Sending email to {user['email']}")
 
-            email_body = f"""
+def budget_alert_email(user, account) -> str:
+    return f"""
 Hi {user.get('name', '')},
 
 Your account '{account['name']}' has exceeded its budget for this month.
 
 📊 Monthly Budget: {account['budget']}
-💸 Total Expenses (this month): {expenses}
+💸 Total Expenses (this month): {account['expenses']}
 
 Please review your recent transactions.
 
 Regards,  
 Finance Bot
 """
-            send_email(
-                to_email=user["email"],
-                subject="🚨 Monthly Budget Exceeded Alert",
-                body=email_body
-            )
-        else:
-            print("✅ Budget is under control.")
 
-    if account_count == 0:
-        print("❌ No accounts found in DB.")
 
-    client.close()
+def check_and_send_budget_emails():
+    started = time.monotonic()
+    db = get_sync_db()
+
+    # Rollup key of this month
+    month = datetime.utcnow().strftime("%Y-%m")
+    start = month_start(month)
+    stats = {"over_budget": 0, "missing_users": 0, "emails_queued": 0, "queue_failures": 0}
+
+    # Alerts go to the outbox; the mail dispatcher delivers them
+    for account in db.accounts.aggregate(budget_alert_pipeline(month)):
+        stats["over_budget"] += 1
+        if not account["user"]:
+            print("❌ User not found for Clerk ID:", account["clerkUserId"])
+            stats["missing_users"] += 1
+            continue
 
+        # The change stream consumer may have alerted it already; whoever sets lastAlertSent mails
+        claimed = db.accounts.update_one(
+            {"_id": account["_id"], **not_alerted_since(start)},
+            {"$set": {"lastAlertSent": datetime.utcnow()}},
+        )
+        if not claimed.modified_count:
+            continue
 
-def handle_recurring_transactions():
-    client = MongoClient(os.getenv("MONGODB_URI"))
-    db = client["finance"]
-    today = datetime.now(pytz.UTC).date()
-
-    accounts = db.accounts.find({})
-    for account in accounts:
-        updated = False
-        transactions = account.get("transactions", [])
-        new_transactions = list(transactions)
-
-        for txn in transactions:
-            if txn.get("isRecurring") and txn.get("nextRecurringDate"):
-                print(txn)
-                next_date = txn["nextRecurringDate"].date()
-                if next_date == today:
-                    print(f"🔁 Recurring txn triggered: {txn.get('description')}")
-                    print(txn.get("recurringInterval"))
-
-                    # Determine next recurring date
-                    interval = txn.get("recurringInterval")
-                    if interval=="daily":
-                        next_recurring = today + timedelta(days=1)
-                    elif interval == "weekly":
-                        next_recurring = today + timedelta(weeks=1)
-                    elif interval == "monthly":
-                        next_month = (today.replace(day=1) + timedelta(days=32)).replace(day=txn["date"].day if "date" in txn else 1)
-                        next_recurring = next_month
-                    else:
-                        print(f"⚠️ Unknown interval ({interval}), skipping...")
-                        continue
-
-                    # Create new recurring transaction
-                    new_txn = {
-                        "type": txn["type"],
-                        "amount": txn["amount"],
-                        "description": txn.get("description"),
-                        "date": datetime.now(pytz.UTC),
-                        "category": txn.get("category"),
-                        "receiptUrl": txn.get("receiptUrl"),
-                        "isRecurring": True,
-                        "recurringInterval": interval,
-                        "lastProcessed": datetime.now(pytz.UTC),
-                        "nextRecurringDate": datetime.combine(next_recurring, datetime.min.time()).replace(tzinfo=pytz.UTC),
-                        "createdAt": datetime.now(pytz.UTC),
-                        "updatedAt": datetime.now(pytz.UTC),
-                        "id": uuid.uuid4().hex
-                    }
-
-                    new_transactions.append(new_txn)
-                    updated = True
-
-        if updated:
-            db.accounts.update_one(
-                {"_id": account["_id"]},
-                {"$set": {"transactions": new_transactions}}
+        user = account["user"][0]
+        print(f"🚨 Budget exceeded for '{account['name']}', 📧 queueing email to {user['email']}")
+        # Queued straight after the claim rather than buffered, and the claim is
+        # released if that fails, so a claimed account isn't left without its alert
+        try:
+            stats["emails_queued"] += enqueue_emails_sync(
+                db, [(user["email"], "🚨 Monthly Budget Exceeded Alert", budget_alert_email(user, account))]
             )
-            print(f"✅ New recurring transaction added for account: {account['name']}")
-
-    client.close()
+        except Exception as e:
+            print(f"❌ Queueing the budget alert for '{account['name']}' failed: {e}")
+            db.accounts.update_one(*release_alert(account, start))
+            stats["queue_failures"] += 1
 
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    print(f"✅ Budget check finished: {stats}")
+    return stats
 
 
+def handle_recurring_transactions():
+    started = time.monotonic()
+    db = get_sync_db()
 
+    # Only due schedules are read; missed days are caught up idempotently
+    stats = process_due_schedules(db)
 
-def send_transaction_insights_email():
-    # Step 1: Connect to MongoDB
-    client = MongoClient(os.getenv("MONGODB_URI"))
-    db = client["finance"]
-
-    # Step 2: Fetch default account
-    default_account = db.accounts.find_one({"isDefault": True})
-    if not default_account:
-        print("❌ No default account found.")
-        return
-
-    # Step 3: Fetch associated user
-    clerk_user_id = default_account.get("clerkUserId")
-    if not clerk_user_id:
-        print("❌ Missing Clerk User ID in account.")
-        return
-
-    user = db.users.find_one({"clerkUserId": clerk_user_id})
-    if not user:
-        print(f"❌ No user found for Clerk User ID: {clerk_user_id}")
-        return
-
-    # Step 4: Filter this month's transactions
-    all_transactions = default_account.get("transactions", [])
-    if not all_transactions:
-        print("⚠️ No transactions found in the default account.")
-        return
-
-    now = datetime.now()
-    start_of_month = datetime(now.year, now.month, 1)
-
-    monthly_transactions = [
-        txn for txn in all_transactions
-        if txn.get("date") and txn["date"] >= start_of_month
-    ]
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    print(f"✅ Recurring transactions processed: {stats}")
+    return stats
 
-    if not monthly_transactions:
-        print("⚠️ No transactions for the current month.")
-        return
-
-    # Step 5: Create prompt
-    prompt = f"""
-Analyze the following bank account transactions and generate insights:
-- Highlight unusual or high spending.
-- Categorize spending.
-- Mention if spending exceeds a defined budget (assume 100 for demo).
-- Suggest savings tips.
-
-Only consider transactions for this month: {now.strftime('%B %Y')}
-
-Transactions:
-{chr(10).join([
-    f"{txn.get('date').strftime('%Y-%m-%d')} | {txn['type']} | {txn['amount']} | {txn.get('category', 'N/A')} | {txn.get('description', '')}"
-    for txn in monthly_transactions
-])}
-"""
 
-    # Step 6: Generate insights using Groq
-    try: 
-        groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))  # or set as env var
-        response = groq_client.chat.completions.create(
-            model="llama3-70b-8192",  # You can also try Mixtral
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1024
-        )
-        insights = response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"❌ Groq API error: {e}")
-        return
 
-    # Step 7: Send the email
-    email_body = f"""
-Hi {user.get('name', '')},
 
-Here are the AI-generated insights for your default account **{default_account['name']}** for {now.strftime('%B %Y')}:
 
-{insights}
+def send_transaction_insights_email():
+    # Per-user insights for every default account, built from monthly aggregates
+    return send_monthly_insights(get_sync_db())
 
-Stay financially healthy! 💡
 
-— Finance Bot
-"""
+def reconcile_account_balances():
+    # Repairs running balances that drifted from their transactions
+    return reconcile_balances(get_sync_db())
 
-    send_email(
-        to_email=user["email"],
-        subject=f"📊 Monthly Transaction Insights for '{default_account['name']}'",
-        body=email_body
-    )
 
-    print(f"✅ Transaction insights email sent to {user['email']}")
-    client.close()
\ No newline at end of file
+def reconcile_account_rollups():
+    # Repairs monthly rollups whose $inc was lost between a write and a crash
+    return reconcile_rollups(get_sync_db())
@@ -2,17 +2,24 @@ import smtplib
 from email.message import EmailMessage
 from app import config # Assuming you have a config module with email settings
 
-def send_email(to_email: str, subject: str, body: str):
+def build_message(to_email: str, subject: str, body: str) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = config.EMAIL_USERNAME
+    msg["From"] = config.EMAIL_FROM
     msg["To"] = to_email
     msg.set_content(body)
+    return msg
+
+def send_email(to_email: str, subject: str, body: str):
+    """One-off synchronous send; bulk and background mail goes through app.mailer"""
+    msg = build_message(to_email, subject, body)
 
     try:
         with smtplib.SMTP(config.EMAIL_HOST, config.EMAIL_PORT) as smtp:
-            smtp.starttls()
-            smtp.login(config.EMAIL_USERNAME, config.EMAIL_PASSWORD)
+            if config.EMAIL_USE_TLS:
+                smtp.starttls()
+            if config.EMAIL_USERNAME:
+                smtp.login(config.EMAIL_USERNAME, config.EMAIL_PASSWORD)
             smtp.send_message(msg)
         return True
     except Exception as e:
@@ -0,0 +1,241 @@
+"""Change-stream event pipeline for derived data and notifications.
+
+One consumer watches the database's change stream, narrowed server side to the
+collections (and operations) registered handlers care about, and fans each
+event out to them. Work is proportional to what actually changed instead of a
+periodic scan of every account.
+
+Handlers may batch: `handle(change)` notes what needs doing and `flush()` does
+it. The consumer flushes and then saves its resume token in `event_offsets`
+every EVENTS_CHECKPOINT_SECONDS or EVENTS_CHECKPOINT_EVERY events, so after a
+restart it resumes from the last flushed event (delivery is at least once;
+handlers must be idempotent). The offset document doubles as a lease, so with
+several API workers only one of them consumes at a time.
+
+Change streams need a replica set; on a standalone server the consumer logs
+that and stops, and the daily jobs keep covering the same ground.
+"""
+import asyncio
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app import config, mailer, metrics
+from app.cron import budget_alert_email, budget_alert_pipeline, month_start, not_alerted_since, release_alert
+from database import db
+from transactions.rollups import month_key
+
+offsets_collection = db["event_offsets"]
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+LEASE = timedelta(seconds=config.EVENTS_LEASE_SECONDS)
+
+# Server errors meaning the stored resume token can't be used any more
+HISTORY_LOST = {260, 280, 286}  # InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost
+# $changeStream on a standalone server
+NOT_REPLICA_SET = {40573}
+
+HANDLERS = []
+
+
+class Handler:
+    def __init__(self, collection: str, handle, match=None, flush=None, name=None):
+        self.collection = collection
+        self.handle = handle
+        # Extra $match on the change event, applied by the server before it is sent
+        self.match = match
+        self.flush = flush
+        self.name = name or getattr(handle, "__qualname__", repr(handle))
+
+
+def register(collection: str, handle, match=None, flush=None, name=None) -> Handler:
+    """Call `await handle(change)` for changes to `collection` (matching `match`, if given)"""
+    handler = Handler(collection, handle, match, flush, name)
+    HANDLERS.append(handler)
+    return handler
+
+
+def stream_pipeline(handlers) -> list:
+    clauses = []
+    for handler in handlers:
+        clause = {"ns.coll": handler.collection}
+        if handler.match:
+            clause = {"$and": [clause, handler.match]}
+        clauses.append(clause)
+    return [{"$match": {"$or": clauses}}]
+
+
+class ChangeStreamConsumer:
+    def __init__(self, name: str = "default", handlers=None):
+        self.name = name
+        self.handlers = HANDLERS if handlers is None else handlers
+        self._task = None
+
+    async def acquire(self):
+        """Take (or renew) the consumer lease; returns the offset document, or None if held elsewhere"""
+        now = datetime.utcnow()
+        try:
+            return await offsets_collection.find_one_and_update(
+                {"_id": self.name, "$or": [
+                    {"lockedUntil": None},
+                    {"lockedUntil": {"$lt": now}},
+                    {"lockedBy": OWNER},
+                ]},
+                {"$set": {"lockedBy": OWNER, "lockedUntil": now + LEASE}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return None
+
+    async def checkpoint(self, token) -> bool:
+        """Flush batched handler work, then save the resume token; False if the lease was lost"""
+        for flush in {h.flush for h in self.handlers if h.flush}:
+            await flush()
+        now = datetime.utcnow()
+        update = {"lockedUntil": now + LEASE}
+        if token is not None:
+            update.update({"token": token, "updatedAt": now})
+        result = await offsets_collection.update_one(
+            {"_id": self.name, "lockedBy": OWNER}, {"$set": update}
+        )
+        return result.matched_count == 1
+
+    async def dispatch(self, change: dict):
+        collection = change.get("ns", {}).get("coll")
+        for handler in self.handlers:
+            if handler.collection != collection:
+                continue
+            try:
+                await handler.handle(change)
+                metrics.change_events.inc(collection, handler.name, "ok")
+            except Exception:
+                # One failing handler must not stall the stream for the others
+                metrics.change_events.inc(collection, handler.name, "error")
+                print(f"❌ Event handler {handler.name} failed:\n{traceback.format_exc()}")
+
+    async def consume(self, token):
+        """Dispatch events until the lease is lost"""
+        pipeline = stream_pipeline(self.handlers)
+        async with db.watch(
+            pipeline, full_document="updateLookup", resume_after=token, max_await_time_ms=1000
+        ) as stream:
+            print(f"✅ Consuming change stream '{self.name}'" + (" (resumed)" if token else ""))
+            pending, last_checkpoint = 0, time.monotonic()
+            while stream.alive:
+                # None when nothing changed for max_await_time_ms; still checkpoint on time
+                change = await stream.try_next()
+                if change is not None:
+                    await self.dispatch(change)
+                    pending += 1
+                if (pending >= config.EVENTS_CHECKPOINT_EVERY
+                        or time.monotonic() - last_checkpoint >= config.EVENTS_CHECKPOINT_SECONDS):
+                    if not await self.checkpoint(stream.resume_token):
+                        print(f"⚠️ Lost the '{self.name}' change stream lease")
+                        return
+                    pending, last_checkpoint = 0, time.monotonic()
+
+    async def run_forever(self):
+        if not self.handlers:
+            return
+        while True:
+            try:
+                state = await self.acquire()
+                if state:
+                    await self.consume(state.get("token"))
+            except OperationFailure as e:
+                if e.code in NOT_REPLICA_SET:
+                    print(f"⚠️ Change streams need a replica set; event consumer disabled: {e}")
+                    return
+                if e.code in HISTORY_LOST:
+                    # The oplog rolled past our position; the daily jobs catch up on what was missed
+                    print(f"⚠️ Change stream '{self.name}' can't resume, starting from now: {e}")
+                    await offsets_collection.update_one({"_id": self.name}, {"$unset": {"token": ""}})
+                    continue
+                print(f"❌ Change stream '{self.name}' failed: {e}")
+            except Exception as e:
+                print(f"❌ Change stream '{self.name}' failed: {e}")
+            await asyncio.sleep(LEASE.total_seconds() / 3)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class BudgetAlerts:
+    """Emails a user as soon as an account's expenses this month pass its budget.
+
+    Expense transactions and budget changes mark their account; `flush` checks
+    the marked accounts together. `lastAlertSent` is claimed with a conditional
+    update before mailing, so an account gets one alert per month however many
+    events, consumers or daily job runs see it over budget.
+    """
+
+    def __init__(self):
+        self._pending = set()
+
+    async def transaction_changed(self, change: dict):
+        transaction = change.get("fullDocument") or {}
+        date = transaction.get("date")
+        # Only this month's expenses count against the budget
+        if isinstance(date, datetime) and month_key(date) != month_key(datetime.utcnow()):
+            return
+        if transaction.get("accountId"):
+            self._pending.add(transaction["accountId"])
+
+    async def account_changed(self, change: dict):
+        self._pending.add(change["documentKey"]["_id"])
+
+    async def flush(self):
+        if not self._pending:
+            return
+        account_ids, self._pending = self._pending, set()
+        now = datetime.utcnow()
+        month = month_key(now)
+        async for account in db.accounts.aggregate(budget_alert_pipeline(month, account_ids)):
+            if not account["user"]:
+                print("❌ User not found for Clerk ID:", account["clerkUserId"])
+                continue
+            claimed = await db.accounts.update_one(
+                {"_id": account["_id"], **not_alerted_since(month_start(month))},
+                {"$set": {"lastAlertSent": now}},
+            )
+            if not claimed.modified_count:
+                continue
+            user = account["user"][0]
+            print(f"🚨 Budget exceeded for '{account['name']}', 📧 queueing email to {user['email']}")
+            try:
+                await mailer.enqueue_email(
+                    user["email"], "🚨 Monthly Budget Exceeded Alert", budget_alert_email(user, account)
+                )
+            except Exception:
+                # Give the claim back so the next check alerts it instead
+                await db.accounts.update_one(*release_alert(account, month_start(month)))
+                raise
+
+
+budget_alerts = BudgetAlerts()
+register(
+    "transactions", budget_alerts.transaction_changed, flush=budget_alerts.flush, name="budget_alerts",
+    match={"operationType": {"$in": ["insert", "update", "replace"]}, "fullDocument.type": "expense"},
+)
+register(
+    # Not the $inc of currentBalance on every transaction write: only budget changes
+    "accounts", budget_alerts.account_changed, flush=budget_alerts.flush, name="budget_alerts",
+    match={"$or": [
+        {"operationType": {"$in": ["insert", "replace"]}},
+        {"updateDescription.updatedFields.budget": {"$exists": True}},
+    ]},
+)
+
+consumer = ChangeStreamConsumer()
@@ -0,0 +1,170 @@
+"""Every index the app relies on, declared in one place.
+
+The API applies them on startup (create_index is a no-op for an index that
+already exists with the same definition). From the command line:
+
+    python -m app.indexes apply     # create missing indexes
+    python -m app.indexes report    # declared vs existing indexes, with $indexStats usage
+    python -m app.indexes explain   # explain() each route's query; exits 1 on a collection scan
+
+An index that can't be built (e.g. a unique index over existing duplicates)
+is reported and skipped instead of stopping the app.
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from app.insights import INSIGHTS_CACHE_INDEXES
+from app.jobs import JOB_RUN_INDEXES
+from app.mailer import OUTBOX_INDEXES
+from database import db, get_sync_db
+from transactions.idempotency import IDEMPOTENCY_INDEXES
+from transactions.imports import IMPORT_INDEXES
+from transactions.recurring import SCHEDULE_INDEXES
+from transactions.rollups import ROLLUP_INDEXES
+from transactions.services import TRANSACTION_INDEXES
+
+ACCOUNT_INDEXES = [
+    # find_account and the duplicate-name check; the clerkUserId prefix serves account listings
+    ([("clerkUserId", ASCENDING), ("name", ASCENDING)], {"name": "clerkUserId_name_unique", "unique": True}),
+    ([("clerkUserId", ASCENDING), ("isDefault", ASCENDING)], {"name": "clerkUserId_isDefault"}),
+    # Scheduled jobs scan only budgeted / default accounts
+    ([("budget", ASCENDING)], {"name": "budget_sparse", "sparse": True}),
+    ([("isDefault", ASCENDING)], {"name": "isDefault_true", "partialFilterExpression": {"isDefault": True}}),
+]
+
+USER_INDEXES = [
+    ([("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    ([("clerkUserId", ASCENDING)], {"name": "clerkUserId"}),
+]
+
+# collection -> [(keys, options)]
+INDEXES = {
+    "accounts": ACCOUNT_INDEXES,
+    "users": USER_INDEXES,
+    "transactions": TRANSACTION_INDEXES,
+    "account_rollups": ROLLUP_INDEXES,
+    "recurring_schedules": SCHEDULE_INDEXES,
+    "transaction_imports": IMPORT_INDEXES,
+    "idempotency_keys": IDEMPOTENCY_INDEXES,
+    "email_outbox": OUTBOX_INDEXES,
+    "insights_cache": INSIGHTS_CACHE_INDEXES,
+    "job_runs": JOB_RUN_INDEXES,
+}
+
+_ID = ObjectId()
+_NOW = datetime.utcnow()
+
+# (route, collection, filter, sort) for the hot query of each route; values are placeholders
+ROUTE_QUERIES = [
+    ("find_account", "accounts", {"clerkUserId": "u", "name": "n"}, None),
+    ("getaccounts", "accounts", {"clerkUserId": "u"}, None),
+    ("expenses_monthly", "accounts", {"clerkUserId": "u", "isDefault": True}, None),
+    ("insights_default_accounts", "accounts", {"isDefault": True}, None),
+    ("budget_alert_accounts", "accounts", {"budget": {"$exists": True, "$ne": None}}, None),
+    ("get_user", "users", {"email": "e@example.com"}, None),
+    ("user_lookup", "users", {"clerkUserId": "u"}, None),
+    ("get_transactions", "transactions", {"accountId": _ID, "date": {"$lte": _NOW}},
+     [("date", DESCENDING), ("id", DESCENDING)]),
+    ("gettransaction", "transactions", {"accountId": _ID, "id": "t"}, None),
+    ("transaction_by_id", "transactions", {"id": "t"}, None),
+    ("analytics_range", "transactions", {"clerkUserId": "u", "date": {"$gte": _NOW, "$lt": _NOW}}, None),
+    ("month_rollup", "account_rollups", {"accountId": _ID, "month": "2026-01"}, None),
+    ("budget_history", "account_rollups", {"clerkUserId": "u", "month": {"$gte": "2025-01", "$lte": "2026-01"}}, None),
+    ("due_schedules", "recurring_schedules", {"nextRunAt": {"$lte": _NOW}}, [("nextRunAt", ASCENDING)]),
+    ("schedule_by_transaction", "recurring_schedules", {"transactionId": "t"}, None),
+    ("outbox_claimed", "email_outbox", {"claim": "c"}, None),
+]
+
+
+async def ensure_indexes():
+    """Create every declared index; returns the (collection, index, error) that failed"""
+    failures = []
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                await db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                print(f"❌ Index {collection}.{options['name']} not created: {e}")
+                failures.append((collection, options["name"], str(e)))
+    return failures
+
+
+def index_report(sync_db) -> dict:
+    """Per collection: declared indexes that are missing, existing ones not declared, and unused ones"""
+    report = {}
+    for collection, indexes in INDEXES.items():
+        declared = {options["name"] for _, options in indexes}
+        stats = {
+            row["name"]: row["accesses"]
+            for row in sync_db[collection].aggregate([{"$indexStats": {}}])
+        }
+        existing = set(stats) - {"_id_"}
+        report[collection] = {
+            "missing": sorted(declared - existing),
+            "undeclared": sorted(existing - declared),
+            "unused": sorted(
+                f"{name} (since {accesses['since']:%Y-%m-%d})"
+                for name, accesses in stats.items()
+                if name != "_id_" and accesses["ops"] == 0
+            ),
+        }
+    return report
+
+
+def _stages(plan: dict):
+    # Classic plans nest inputStage(s); slot-based plans wrap the tree in queryPlan
+    if "stage" in plan:
+        yield plan["stage"]
+    for child in plan.get("inputStages", []) + [plan[key] for key in ("inputStage", "queryPlan") if key in plan]:
+        yield from _stages(child)
+
+
+def explain_queries(sync_db) -> list:
+    """Winning plan of every route query: whether it scans the collection or sorts in memory"""
+    results = []
+    for route, collection, query, sort in ROUTE_QUERIES:
+        cursor = sync_db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = set(_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+        results.append({
+            "route": route,
+            "collection": collection,
+            "collscan": "COLLSCAN" in stages,
+            "inMemorySort": "SORT" in stages,
+            "stages": sorted(stages),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and check the app's MongoDB indexes")
+    parser.add_argument("command", choices=["apply", "report", "explain"])
+    args = parser.parse_args()
+
+    if args.command == "apply":
+        failures = asyncio.run(ensure_indexes())
+        print(f"✅ Indexes applied ({len(failures)} failed)")
+        sys.exit(1 if failures else 0)
+
+    sync_db = get_sync_db()
+    if args.command == "report":
+        for collection, entry in index_report(sync_db).items():
+            print(f"{collection}: missing={entry['missing']} undeclared={entry['undeclared']} unused={entry['unused']}")
+        return
+
+    results = explain_queries(sync_db)
+    for row in results:
+        flag = "❌" if row["collscan"] else "⚠️" if row["inMemorySort"] else "✅"
+        print(f"{flag} {row['route']:<28} {row['collection']:<20} {', '.join(row['stages'])}")
+    sys.exit(1 if any(row["collscan"] for row in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Monthly AI insights for every user's default account.
+
+The prompt is built from precomputed aggregates (the month's rollup plus the
+largest expenses) rather than raw transactions. Generated text is cached in
+`insights_cache` under a hash of those aggregates, so an unchanged month is
+never sent to the LLM twice. Generation runs on a bounded worker pool behind a
+shared rate limiter, and the LLM client is pluggable (INSIGHTS_LLM=groq|fake).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+
+import database
+from app import config
+from app.mailer import enqueue_emails_sync
+from transactions.services import month_range
+
+insights_cache_collection = database.db["insights_cache"]
+
+INSIGHTS_CACHE_INDEXES = [
+    ([("createdAt", ASCENDING)], {"name": "createdAt_ttl",
+                                  "expireAfterSeconds": config.INSIGHTS_CACHE_TTL_DAYS * 86400}),
+]
+
+# Bump when the prompt wording changes so cached answers are regenerated
+PROMPT_VERSION = 1
+
+
+async def ensure_insights_indexes():
+    for keys, options in INSIGHTS_CACHE_INDEXES:
+        await insights_cache_collection.create_index(keys, **options)
+
+
+class GroqLLM:
+    def __init__(self, model=None):
+        from groq import Groq
+
+        self.model = model or config.INSIGHTS_MODEL
+        self._client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+    def complete(self, prompt: str) -> str:
+        response = self._client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=1024
+        )
+        return response.choices[0].message.content.strip()
+
+
+class FakeLLM:
+    """Deterministic stand-in for local runs and tests; records every prompt"""
+    model = "fake"
+
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return "Insights generated from:\n" + prompt.strip()
+
+
+LLM_CLIENTS = {"groq": GroqLLM, "fake": FakeLLM}
+
+
+def get_llm_client():
+    return LLM_CLIENTS[config.INSIGHTS_LLM]()
+
+
+class RateLimiter:
+    """Spaces calls at least 60/rate_per_minute seconds apart across threads"""
+
+    def __init__(self, rate_per_minute: int):
+        self.interval = 60.0 / rate_per_minute
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def default_accounts_pipeline(month: str):
+    return [
+        {"$match": {"isDefault": True}},
+        {"$project": {"name": 1, "clerkUserId": 1, "budget": 1}},
+        {"$lookup": {
+            "from": "account_rollups",
+            "let": {"accountId": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$accountId", "$$accountId"]},
+                    {"$eq": ["$month", month]},
+                ]}}},
+                {"$project": {"_id": 0, "income": 1, "expense": 1, "categories": 1}},
+            ],
+            "as": "rollup",
+        }},
+        # Accounts without a rollup had no transactions this month
+        {"$match": {"rollup.0": {"$exists": True}}},
+        {"$lookup": {
+            "from": "users",
+            "let": {"clerkUserId": "$clerkUserId"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$clerkUserId", "$$clerkUserId"]}}},
+                {"$project": {"_id": 0, "email": 1, "name": 1}},
+                {"$limit": 1},
+            ],
+            "as": "user",
+        }},
+    ]
+
+
+def month_aggregates(sync_db, account: dict, now: datetime) -> dict:
+    rollup = account["rollup"][0]
+    start, end = month_range(now.year, now.month)
+    outliers = sync_db.transactions.find(
+        {"accountId": account["_id"], "type": "expense", "date": {"$gte": start, "$lt": end}},
+        {"_id": 0, "date": 1, "amount": 1, "category": 1, "description": 1},
+    ).sort("amount", DESCENDING).limit(config.INSIGHTS_TOP_EXPENSES)
+    return {
+        "month": now.strftime("%B %Y"),
+        "account": account["name"],
+        "budget": account.get("budget"),
+        "income": rollup.get("income", 0),
+        "expense": rollup.get("expense", 0),
+        "categories": {
+            category: {"income": totals.get("income", 0), "expense": totals.get("expense", 0)}
+            for category, totals in sorted(rollup.get("categories", {}).items())
+            if totals.get("income") or totals.get("expense")
+        },
+        "largestExpenses": [
+            [txn["date"].strftime("%Y-%m-%d"), txn["amount"], txn.get("category"), txn.get("description") or ""]
+            for txn in outliers
+        ],
+    }
+
+
+def build_prompt(aggregates: dict) -> str:
+    budget = aggregates["budget"]
+    return f"""
+Analyze this bank account's monthly summary and generate insights:
+- Highlight unusual or high spending.
+- Comment on the category split.
+- Mention if spending exceeds the budget{f" of {budget}" if budget else " (no budget is set)"}.
+- Suggest savings tips.
+
+Month: {aggregates['month']}
+Totals: income {aggregates['income']}, expense {aggregates['expense']}
+
+Category totals (category | income | expense):
+{chr(10).join(f"{c} | {t['income']} | {t['expense']}" for c, t in aggregates['categories'].items())}
+
+Largest expenses (date | amount | category | description):
+{chr(10).join(" | ".join(str(v) for v in row) for row in aggregates['largestExpenses'])}
+"""
+
+
+def cache_key(aggregates: dict, model: str) -> str:
+    raw = json.dumps([PROMPT_VERSION, model, aggregates], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def insights_email(user: dict, account: dict, month: str, insights: str) -> str:
+    return f"""
+Hi {user.get('name', '')},
+
+Here are the AI-generated insights for your default account **{account['name']}** for {month}:
+
+{insights}
+
+Stay financially healthy! 💡
+
+— Finance Bot
+"""
+
+
+def generate_account_insights(sync_db, llm, limiter: RateLimiter, account: dict, now: datetime) -> str:
+    """Returns "cached" or "generated" once the email is queued"""
+    aggregates = month_aggregates(sync_db, account, now)
+    key = cache_key(aggregates, llm.model)
+
+    cached = sync_db.insights_cache.find_one({"_id": key}, {"insights": 1})
+    if cached:
+        insights, outcome = cached["insights"], "cached"
+    else:
+        limiter.wait()
+        insights, outcome = llm.complete(build_prompt(aggregates)), "generated"
+        sync_db.insights_cache.replace_one(
+            {"_id": key},
+            {"insights": insights, "model": llm.model, "createdAt": datetime.utcnow()},
+            upsert=True,
+        )
+
+    user = account["user"][0]
+    enqueue_emails_sync(sync_db, [(
+        user["email"],
+        f"📊 Monthly Transaction Insights for '{account['name']}'",
+        insights_email(user, account, aggregates["month"], insights),
+    )])
+    return outcome
+
+
+def send_monthly_insights(sync_db, llm=None, now: datetime = None):
+    started = time.monotonic()
+    now = now or datetime.utcnow()
+    llm = llm or get_llm_client()
+    limiter = RateLimiter(config.INSIGHTS_RATE_PER_MINUTE)
+    stats = {"accounts": 0, "missing_users": 0, "cached": 0, "generated": 0, "failed": 0}
+
+    in_flight = threading.BoundedSemaphore(config.INSIGHTS_CONCURRENCY)
+    lock = threading.Lock()
+
+    def work(account):
+        try:
+            outcome = generate_account_insights(sync_db, llm, limiter, account, now)
+        except Exception as e:
+            print(f"❌ Insights failed for account {account['_id']}: {e}")
+            outcome = "failed"
+        finally:
+            in_flight.release()
+        with lock:
+            stats[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=config.INSIGHTS_CONCURRENCY) as executor:
+        for account in sync_db.accounts.aggregate(default_accounts_pipeline(now.strftime("%Y-%m"))):
+            stats["accounts"] += 1
+            if not account["user"]:
+                print(f"❌ No user found for Clerk User ID: {account['clerkUserId']}")
+                stats["missing_users"] += 1
+                continue
+            in_flight.acquire()
+            executor.submit(work, account)
+
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    print(f"✅ Transaction insights finished: {stats}")
+    return stats
@@ -0,0 +1,192 @@
+"""Manually triggered job runs.
+
+`POST /jobs/{name}` records a run in `job_runs` and returns 202 with its id
+straight away; the job body runs on `job_executor`, a small thread pool of its
+own, so a long job never occupies the threads request handlers use. Scheduled
+runs go through the same pool. Poll `GET /jobs/{id}` for the status
+(queued -> running -> succeeded | failed | cancelled) and the job's stats.
+
+Admission control: a unique partial index allows one active run per job, so a
+second trigger gets 409 with the id of the run in progress, and a trigger is
+also refused while the scheduler holds the job's lease. Active runs keep a
+lease of their own; a run whose worker died stops blocking new triggers once
+that lease lapses.
+"""
+import asyncio
+import contextvars
+import os
+import socket
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+import database
+from app import config, metrics
+
+job_runs_collection = database.db["job_runs"]
+
+JOB_RUN_INDEXES = [
+    # One queued/running run per job
+    ([("job", ASCENDING)], {"name": "job_active_unique", "unique": True,
+                            "partialFilterExpression": {"active": True}}),
+    ([("finishedAt", ASCENDING)], {"name": "finishedAt_ttl",
+                                   "expireAfterSeconds": config.JOB_RUN_TTL_DAYS * 86400}),
+]
+
+job_executor = ThreadPoolExecutor(max_workers=config.JOB_WORKERS, thread_name_prefix="job")
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+LEASE = timedelta(seconds=config.SCHEDULER_LEASE_SECONDS)
+
+# Keeps dispatched runs referenced until they finish
+_tasks = set()
+
+
+class JobAlreadyRunning(Exception):
+    def __init__(self, job: str, run_id=None):
+        super().__init__(f"{job} is already running")
+        self.job = job
+        self.run_id = run_id
+
+
+async def run_blocking(func):
+    """Run a blocking job body on the job pool, carrying the caller's context (metrics span)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(job_executor, contextvars.copy_context().run, func)
+
+
+async def _claim(name: str) -> dict:
+    now = datetime.utcnow()
+    run = {
+        "_id": uuid.uuid4().hex,
+        "job": name,
+        "status": "queued",
+        "active": True,
+        "requestedAt": now,
+        "startedAt": None,
+        "finishedAt": None,
+        "durationSeconds": None,
+        "result": None,
+        "error": None,
+        "owner": OWNER,
+        "lockedUntil": now + LEASE,
+    }
+    await job_runs_collection.insert_one(run)
+    return run
+
+
+async def start_run(name: str) -> dict:
+    """Record a queued run, or raise JobAlreadyRunning"""
+    now = datetime.utcnow()
+    scheduled = await database.db["scheduler_jobs"].find_one(
+        {"_id": name, "lockedUntil": {"$gt": now}}, {"_id": 1}
+    )
+    if scheduled:
+        raise JobAlreadyRunning(name)
+
+    try:
+        return await _claim(name)
+    except DuplicateKeyError:
+        pass
+
+    # Another run is active; take its place only if its owner stopped renewing the lease
+    abandoned = await job_runs_collection.find_one_and_update(
+        {"job": name, "active": True, "lockedUntil": {"$lt": now}},
+        {"$set": {"status": "abandoned", "finishedAt": now}, "$unset": {"active": ""}},
+    )
+    if abandoned:
+        try:
+            return await _claim(name)
+        except DuplicateKeyError:
+            pass
+    current = await job_runs_collection.find_one({"job": name, "active": True}, {"_id": 1})
+    raise JobAlreadyRunning(name, current["_id"] if current else None)
+
+
+async def _heartbeat(run_id: str):
+    while True:
+        await asyncio.sleep(LEASE.total_seconds() / 3)
+        await job_runs_collection.update_one(
+            {"_id": run_id, "active": True},
+            {"$set": {"lockedUntil": datetime.utcnow() + LEASE}},
+        )
+
+
+async def execute(run: dict, func):
+    heartbeat = asyncio.create_task(_heartbeat(run["_id"]))
+    status, result, error = "succeeded", None, None
+    started = None
+
+    def body():
+        # The status flips to running only once a pool thread picks the run up
+        nonlocal started
+        started = datetime.utcnow()
+        database.get_sync_db()["job_runs"].update_one(
+            {"_id": run["_id"]}, {"$set": {"status": "running", "startedAt": started}}
+        )
+        return func()
+
+    try:
+        with metrics.job_span(run["job"]):
+            result = await run_blocking(body)
+    except asyncio.CancelledError:
+        # Shutdown dropped the queued run, or stopped waiting for a running one
+        status, error = "cancelled", "Interrupted by shutdown"
+        raise
+    except Exception:
+        status, error = "failed", traceback.format_exc()
+        print(f"❌ Job run {run['_id']} ({run['job']}) failed:\n{error}")
+    finally:
+        heartbeat.cancel()
+        await _finish(run, status, started, result, error)
+
+
+async def _finish(run: dict, status: str, started, result, error):
+    finished = datetime.utcnow()
+    await job_runs_collection.update_one(
+        {"_id": run["_id"]},
+        {
+            "$set": {
+                "status": status,
+                "finishedAt": finished,
+                "durationSeconds": round((finished - started).total_seconds(), 3) if started else None,
+                # Jobs return a stats dict; anything else isn't worth storing
+                "result": result if isinstance(result, dict) else None,
+                "error": error,
+            },
+            "$unset": {"active": "", "lockedUntil": ""},
+        },
+    )
+
+
+async def dispatch(name: str, func) -> dict:
+    """Admit a manual run of `name` and start it in the background; returns the run document"""
+    run = await start_run(name)
+    task = asyncio.create_task(execute(run, func))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return run
+
+
+async def get_run(run_id: str):
+    return await job_runs_collection.find_one({"_id": run_id}, {"active": 0, "lockedUntil": 0})
+
+
+def public_run(run: dict) -> dict:
+    run = {key: value for key, value in run.items() if key not in ("active", "lockedUntil")}
+    run["id"] = run.pop("_id")
+    return run
+
+
+async def shutdown():
+    # Queued runs are dropped and every run still in flight is recorded as cancelled;
+    # job bodies already running finish on their threads
+    job_executor.shutdown(wait=False, cancel_futures=True)
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,234 @@
+"""Outbound mail pipeline.
+
+Messages are written to the durable `email_outbox` collection and delivered by
+a MailDispatcher: it claims due messages in batches and hands them to a fixed
+set of SMTP connections that stay open across messages. Failed sends are
+retried with exponential backoff until EMAIL_MAX_ATTEMPTS, then left as
+`failed` with the last error for inspection.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import aiosmtplib
+from pymongo import ASCENDING
+
+import database
+from app import config
+from app.email_utils import build_message
+
+outbox_collection = database.db["email_outbox"]
+
+OUTBOX_INDEXES = [
+    ([("status", ASCENDING), ("nextAttemptAt", ASCENDING)], {"name": "status_nextAttemptAt"}),
+    ([("status", ASCENDING), ("lockedUntil", ASCENDING)], {"name": "status_lockedUntil"}),
+    ([("claim", ASCENDING)], {"name": "claim", "sparse": True}),
+]
+
+# How long a claimed message may stay in `sending` before another dispatcher retakes it;
+# renewed just before the send, so time spent queued behind slow sends doesn't count
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+async def ensure_outbox_indexes():
+    for keys, options in OUTBOX_INDEXES:
+        await outbox_collection.create_index(keys, **options)
+
+
+def outbox_document(to_email: str, subject: str, body: str) -> dict:
+    now = datetime.utcnow()
+    return {
+        "to": to_email,
+        "subject": subject,
+        "body": body,
+        "status": "pending",
+        "attempts": 0,
+        "nextAttemptAt": now,
+        "lastError": None,
+        "createdAt": now,
+        "sentAt": None,
+    }
+
+
+async def enqueue_email(to_email: str, subject: str, body: str):
+    result = await outbox_collection.insert_one(outbox_document(to_email, subject, body))
+    if dispatcher:
+        dispatcher.wake()
+    return result.inserted_id
+
+
+def enqueue_emails_sync(sync_db, messages) -> int:
+    """Queue (to_email, subject, body) tuples from a scheduled job in one insert"""
+    docs = [outbox_document(*message) for message in messages]
+    if docs:
+        sync_db.email_outbox.insert_many(docs, ordered=False)
+    return len(docs)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(config.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 3600))
+
+
+class SMTPConnection:
+    """One SMTP session reused for many messages, reconnecting when needed"""
+
+    def __init__(self):
+        self.smtp = None
+
+    async def send(self, message):
+        if self.smtp is None or not self.smtp.is_connected:
+            self.smtp = aiosmtplib.SMTP(
+                hostname=config.EMAIL_HOST,
+                port=config.EMAIL_PORT,
+                start_tls=config.EMAIL_USE_TLS,
+                timeout=30,
+            )
+            await self.smtp.connect()
+            if config.EMAIL_USERNAME:
+                await self.smtp.login(config.EMAIL_USERNAME, config.EMAIL_PASSWORD)
+        await self.smtp.send_message(message)
+
+    async def close(self):
+        smtp, self.smtp = self.smtp, None
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+
+class MailDispatcher:
+    def __init__(self, concurrency=None, batch_size=None, poll_seconds=None):
+        self.concurrency = concurrency or config.EMAIL_CONCURRENCY
+        self.batch_size = batch_size or config.EMAIL_BATCH_SIZE
+        self.poll_seconds = poll_seconds or config.EMAIL_POLL_SECONDS
+        self._queue = asyncio.Queue(maxsize=self.batch_size)
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+    def wake(self):
+        self._wake.set()
+
+    async def claim_batch(self):
+        now = datetime.utcnow()
+        due = {"$or": [
+            {"status": "pending", "nextAttemptAt": {"$lte": now}},
+            {"status": "sending", "lockedUntil": {"$lt": now}},
+        ]}
+        ids = [
+            doc["_id"] for doc in await outbox_collection.find(due, {"_id": 1})
+            .sort("nextAttemptAt", ASCENDING).limit(self.batch_size).to_list(self.batch_size)
+        ]
+        if not ids:
+            return []
+        claim = uuid.uuid4().hex
+        # Re-checking `due` makes the claim atomic per message across dispatchers
+        await outbox_collection.update_many(
+            {"_id": {"$in": ids}, **due},
+            {"$set": {"status": "sending", "claim": claim, "lockedUntil": now + CLAIM_LEASE}},
+        )
+        return await outbox_collection.find({"claim": claim}).to_list(self.batch_size)
+
+    async def renew(self, doc: dict) -> bool:
+        """Extend the claim's lease; False if another dispatcher has retaken the message"""
+        result = await outbox_collection.update_one(
+            {"_id": doc["_id"], "claim": doc["claim"], "status": "sending"},
+            {"$set": {"lockedUntil": datetime.utcnow() + CLAIM_LEASE}},
+        )
+        return result.matched_count == 1
+
+    async def deliver(self, connection: SMTPConnection, doc: dict):
+        if not await self.renew(doc):
+            print(f"⚠️ Claim on email to {doc['to']} lapsed and was retaken; skipping")
+            return False
+        try:
+            await connection.send(build_message(doc["to"], doc["subject"], doc["body"]))
+        except Exception as e:
+            await connection.close()
+            attempts = doc["attempts"] + 1
+            failed = attempts >= config.EMAIL_MAX_ATTEMPTS
+            print(f"❌ Email to {doc['to']} failed (attempt {attempts}): {e}")
+            await outbox_collection.update_one({"_id": doc["_id"], "claim": doc["claim"]}, {"$set": {
+                "status": "failed" if failed else "pending",
+                "attempts": attempts,
+                "lastError": str(e),
+                "nextAttemptAt": datetime.utcnow() + retry_delay(attempts),
+                "lockedUntil": None,
+            }})
+            return False
+
+        await outbox_collection.update_one({"_id": doc["_id"], "claim": doc["claim"]}, {"$set": {
+            "status": "sent",
+            "attempts": doc["attempts"] + 1,
+            "sentAt": datetime.utcnow(),
+            "lockedUntil": None,
+        }})
+        return True
+
+    async def _sender(self):
+        connection = SMTPConnection()
+        try:
+            while True:
+                try:
+                    doc = await asyncio.wait_for(self._queue.get(), timeout=config.EMAIL_IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    await connection.close()  # don't hold idle sessions open
+                    continue
+                try:
+                    await self.deliver(connection, doc)
+                except Exception as e:
+                    # Recording the outcome failed; the claim lease expiring puts the
+                    # message back in play, and this sender lives on for the next one
+                    print(f"❌ Outbox update for {doc['to']} failed: {e}")
+                finally:
+                    self._queue.task_done()
+        finally:
+            await connection.close()
+
+    async def _feeder(self):
+        while True:
+            try:
+                batch = await self.claim_batch()
+            except Exception as e:
+                print(f"❌ Outbox poll failed: {e}")
+                batch = []
+            for doc in batch:
+                await self._queue.put(doc)
+            if len(batch) < self.batch_size:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain(self):
+        """Wait until every claimed message has been attempted"""
+        await self._queue.join()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._feeder())]
+        self._tasks += [asyncio.create_task(self._sender()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+# The dispatcher running in this process, if any; enqueue_email wakes it directly
+dispatcher = None
+
+
+def start_dispatcher():
+    global dispatcher
+    dispatcher = MailDispatcher()
+    dispatcher.start()
+    return dispatcher
+
+
+async def stop_dispatcher():
+    global dispatcher
+    if dispatcher:
+        await dispatcher.stop()
+        dispatcher = None
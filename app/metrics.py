@@ -0,0 +1,338 @@
+"""Request, database and job instrumentation.
+
+Three sources feed one in-process registry:
+
+- MetricsMiddleware times every HTTP request per route template and counts the
+  response bytes it sends, including streamed bodies.
+- CommandTimer is registered on both MongoDB clients. It times every command
+  and adds its round trip to the span of whatever request or job issued it (a
+  contextvar, which Motor and asyncio.to_thread carry into their worker
+  threads). Commands slower than SLOW_QUERY_MS are logged with the shape of
+  their filter, values masked.
+- job_span wraps each scheduled job the same way.
+
+`GET /metrics` renders the registry in the Prometheus text format; every
+request, slow command and job is also written as one JSON log line. Metrics are
+per process, so scrape each worker.
+"""
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+from app import config
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in series:
+            pairs = [f'{key}="{_escape(value)}"' for key, value in zip(self.labels, labels)]
+            for bound, cumulative in zip(self.buckets, counts):
+                yield self.name + "_bucket{" + ",".join(pairs + [f'le="{bound}"']) + "} " + str(cumulative)
+            yield self.name + "_bucket{" + ",".join(pairs + ['le="+Inf"']) + "} " + str(count)
+            suffix = f"{{{','.join(pairs)}}}" if pairs else ""
+            yield f"{self.name}_sum{suffix} {total}"
+            yield f"{self.name}_count{suffix} {count}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            pairs = ",".join(f'{key}="{_escape(label)}"' for key, label in zip(self.labels, labels))
+            yield f"{self.name}{{{pairs}}} {value}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], LATENCY_BUCKETS,
+)
+response_bytes = Histogram(
+    "http_response_size_bytes", "HTTP response body size by route template",
+    ["method", "route"], SIZE_BUCKETS,
+)
+request_db_seconds = Histogram(
+    "http_request_db_seconds", "Time a request spent waiting on MongoDB",
+    ["method", "route"], LATENCY_BUCKETS,
+)
+request_db_commands = Counter(
+    "http_request_db_commands_total", "MongoDB commands issued while serving each route",
+    ["method", "route"],
+)
+command_seconds = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command round trip by command and collection",
+    ["command", "collection"], LATENCY_BUCKETS,
+)
+slow_commands = Counter(
+    "mongodb_slow_commands_total", "MongoDB commands slower than SLOW_QUERY_MS",
+    ["command", "collection"],
+)
+job_seconds = Histogram(
+    "job_duration_seconds", "Scheduled job run time",
+    ["job", "status"], JOB_BUCKETS,
+)
+job_db_seconds = Histogram(
+    "job_db_seconds", "Time a scheduled job spent waiting on MongoDB",
+    ["job"], JOB_BUCKETS,
+)
+job_db_commands = Counter(
+    "job_db_commands_total", "MongoDB commands issued by each scheduled job",
+    ["job"],
+)
+rate_limited = Counter(
+    "http_rate_limited_total", "Requests answered 429 by the per-tenant rate limiter",
+    ["group"],
+)
+coalesced_reads = Counter(
+    "coalesced_reads_total", "Reads that joined an identical in-flight read instead of querying",
+    ["route"],
+)
+change_events = Counter(
+    "change_events_total", "Change stream events handled, by collection, handler and outcome",
+    ["collection", "handler", "status"],
+)
+
+REGISTRY = [
+    request_seconds, response_bytes, request_db_seconds, request_db_commands,
+    command_seconds, slow_commands, job_seconds, job_db_seconds, job_db_commands,
+    rate_limited, coalesced_reads, change_events,
+]
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        return json.dumps(entry, default=str)
+
+
+logger = logging.getLogger("financebackend")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(JSONFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(config.LOG_LEVEL)
+    logger.propagate = False
+
+
+def log(level: int, event: str, **fields):
+    logger.log(level, event, extra={"fields": fields})
+
+
+class Span:
+    __slots__ = ("db_commands", "db_seconds", "status")
+
+    def __init__(self):
+        self.db_commands = 0
+        self.db_seconds = 0.0
+        self.status = "ok"
+
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+@contextmanager
+def job_span(name: str):
+    """Time a scheduled job and the MongoDB commands it issues"""
+    span = Span()
+    token = current_span.set(span)
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span.status = "error"
+        raise
+    finally:
+        current_span.reset(token)
+        elapsed = time.perf_counter() - started
+        job_seconds.observe(elapsed, name, span.status)
+        job_db_seconds.observe(span.db_seconds, name)
+        job_db_commands.inc(name, amount=span.db_commands)
+        log(
+            logging.INFO, "job", job=name, status=span.status, duration_ms=round(elapsed * 1000, 2),
+            db_commands=span.db_commands, db_ms=round(span.db_seconds * 1000, 2),
+        )
+
+
+# command -> where its filter lives
+FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "update": "updates",
+    "delete": "deletes",
+    "aggregate": "pipeline",
+}
+
+
+def query_shape(value):
+    """The filter with every value masked: operators and field names only"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $in / $and lists: the first element stands for the rest
+        return [query_shape(value[0])] if value else []
+    return "?"
+
+
+def command_shape(command_name: str, command: dict):
+    field = FILTER_FIELDS.get(command_name)
+    value = command.get(field) if field else None
+    if value is None:
+        return None
+    if command_name in ("update", "delete"):
+        return query_shape(value[0].get("q")) if value else None
+    if command_name == "aggregate":
+        return [next(iter(stage)) if "$match" not in stage else query_shape(stage) for stage in value]
+    return query_shape(value)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Times every MongoDB command and charges it to the current request or job"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        command = event.command
+        collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = command.get("collection", "")  # getMore carries the cursor id instead
+        self._pending[(event.connection_id, event.request_id)] = (collection, command)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+    def _finish(self, event, outcome: str):
+        collection, command = self._pending.pop((event.connection_id, event.request_id), ("", {}))
+        seconds = event.duration_micros / 1_000_000
+        command_seconds.observe(seconds, event.command_name, collection)
+
+        span = current_span.get()
+        if span is not None:
+            span.db_commands += 1
+            span.db_seconds += seconds
+
+        if seconds * 1000 >= config.SLOW_QUERY_MS:
+            slow_commands.inc(event.command_name, collection)
+            log(
+                logging.WARNING, "slow_query", command=event.command_name, collection=collection,
+                duration_ms=round(seconds * 1000, 2), outcome=outcome,
+                shape=command_shape(event.command_name, command),
+            )
+
+
+command_timer = CommandTimer()
+
+
+def route_template(scope) -> str:
+    """`/accounts/account/{clerkId}` for `/accounts/account/user_123`"""
+    # Unmatched paths share one label so 404 probes can't blow up cardinality
+    if scope.get("route") is None:
+        return "unmatched"
+    return scope["route"].path
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses and contextvars pass through untouched"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        span = Span()
+        token = current_span.set(span)
+        status, size = 500, 0
+
+        async def send_and_count(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_count)
+        finally:
+            current_span.reset(token)
+            elapsed = time.perf_counter() - started
+            method, route = scope["method"], route_template(scope)
+            request_seconds.observe(elapsed, method, route, str(status))
+            response_bytes.observe(size, method, route)
+            request_db_seconds.observe(span.db_seconds, method, route)
+            request_db_commands.inc(method, route, amount=span.db_commands)
+            if elapsed * 1000 >= config.REQUEST_LOG_MIN_MS:
+                log(
+                    logging.INFO, "request", method=method, route=route, status=status,
+                    duration_ms=round(elapsed * 1000, 2), bytes=size,
+                    db_commands=span.db_commands, db_ms=round(span.db_seconds * 1000, 2),
+                )
@@ -0,0 +1,186 @@
+"""Per-tenant token-bucket rate limiting.
+
+Each (route group, tenant) pair has a bucket holding up to `burst` tokens that
+refills at `rate` tokens per second; a request takes one token or is answered
+with 429 and a Retry-After header saying when the next token arrives. The
+tenant is the clerkUserId: from the path, else from the JSON body, else the
+owner of the account in the path. Only a request naming none of them (or an
+unknown account) is keyed by client address, which behind a proxy is shared.
+
+RATE_LIMITS configures the groups as `group=rate:burst` pairs, e.g.
+`reads=10:20,writes=5:10,bulk=0.2:2`; routes opt in with
+`dependencies=limited("reads")`. RATE_LIMIT_BACKEND selects `memory`
+(per process), `redis` (shared by every worker, via RATE_LIMIT_URL) or `off`.
+A Redis outage lets requests through rather than failing them.
+"""
+import math
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import Depends, HTTPException, Request
+
+from app import config, metrics
+from database import db
+
+# The routes don't agree on a name for the clerkUserId, in the path or in the body
+USER_PARAMS = ("clerkUserId", "clerkId", "clerk_id", "user_id")
+USER_FIELDS = ("clerkUserId", "clerkId")
+ACCOUNT_PARAMS = ("accountId", "account_id")
+
+
+def parse_limits(spec: str) -> dict:
+    """'reads=10:20,writes=5:10' -> {"reads": (10.0, 20.0), "writes": (5.0, 10.0)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        group, _, values = item.partition("=")
+        rate, _, burst = values.partition(":")
+        if float(rate) > 0:  # a zero rate means "no limit" for that group
+            limits[group.strip()] = (float(rate), max(1.0, float(burst or rate)))
+    return limits
+
+
+class MemoryLimiter:
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Take a token; returns 0 if granted, else the seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)  # least recently seen tenant; it starts full again
+        return wait
+
+
+# Same algorithm as MemoryLimiter, atomic on the Redis server and clocked by it
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisLimiter:
+    def __init__(self, client):
+        self.client = client
+        self._script = client.register_script(TOKEN_BUCKET_LUA)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            return float(await self._script(keys=[f"ratelimit:{key}"], args=[rate, burst]))
+        except Exception as e:
+            print(f"⚠️ Rate limiter unavailable, letting request through: {e}")
+            return 0.0
+
+
+def create_limiter():
+    if config.RATE_LIMIT_BACKEND == "redis":
+        import redis.asyncio as redis
+
+        return RedisLimiter(redis.from_url(config.RATE_LIMIT_URL))
+    if config.RATE_LIMIT_BACKEND == "memory":
+        return MemoryLimiter(config.RATE_LIMIT_MAX_BUCKETS)
+    return None
+
+
+limiter = create_limiter()
+LIMITS = parse_limits(config.RATE_LIMITS)
+
+
+# account id -> clerkUserId; an account never changes owner
+_account_owners = OrderedDict()
+
+
+async def account_owner(account_id: str):
+    if account_id in _account_owners:
+        _account_owners.move_to_end(account_id)
+        return _account_owners[account_id]
+    try:
+        account = await db.accounts.find_one({"_id": ObjectId(account_id)}, {"clerkUserId": 1})
+    except InvalidId:
+        return None
+    owner = account.get("clerkUserId") if account else None
+    if owner:
+        _account_owners[account_id] = owner
+        while len(_account_owners) > config.RATE_LIMIT_MAX_BUCKETS:
+            _account_owners.popitem(last=False)
+    return owner
+
+
+async def body_user(request: Request):
+    if "json" not in request.headers.get("content-type", ""):
+        return None
+    try:
+        # FastAPI has already read the body for the route; this reuses it
+        body = await request.json()
+    except ValueError:
+        return None
+    if isinstance(body, dict):
+        for name in USER_FIELDS:
+            if isinstance(body.get(name), str) and body[name]:
+                return body[name]
+    return None
+
+
+async def tenant(request: Request) -> str:
+    for name in USER_PARAMS:
+        if request.path_params.get(name):
+            return f"user:{request.path_params[name]}"
+    user = await body_user(request)
+    if user:
+        return f"user:{user}"
+    for name in ACCOUNT_PARAMS:
+        account_id = request.path_params.get(name)
+        if account_id:
+            owner = await account_owner(account_id)
+            return f"user:{owner}" if owner else f"account:{account_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def rate_limit(group: str):
+    """Route dependency charging one token from the caller's bucket for `group`"""
+
+    async def dependency(request: Request):
+        if limiter is None or group not in LIMITS:
+            return
+        rate, burst = LIMITS[group]
+        wait = await limiter.take(f"{group}:{await tenant(request)}", rate, burst)
+        if wait > 0:
+            metrics.rate_limited.inc(group)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, slow down",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    return dependency
+
+
+def limited(group: str) -> list:
+    """`dependencies=` value for a route in `group`"""
+    return [Depends(rate_limit(group))]
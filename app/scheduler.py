@@ -0,0 +1,176 @@
+"""Cluster-wide job scheduler running on the asyncio loop.
+
+Each job has a document in `scheduler_jobs` holding its next/last run and a
+lease. A worker only runs a job after atomically taking an expired lease on a
+due job, so with N API workers every job still runs once per interval, and the
+persisted `nextRunAt` keeps restarts from re-firing jobs.
+
+Jobs run inside the API process when SCHEDULER_MODE=async (the default). Set
+SCHEDULER_MODE=off on the API and run a dedicated scheduler process with:
+
+    python -m app.scheduler
+"""
+import asyncio
+import os
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import database
+from app import config, events, jobs, mailer, metrics
+from app.indexes import ensure_indexes
+from app.cron import (
+    check_and_send_budget_emails,
+    handle_recurring_transactions,
+    reconcile_account_balances,
+    reconcile_account_rollups,
+    send_transaction_insights_email,
+)
+
+jobs_collection = database.db["scheduler_jobs"]
+
+# name -> (callable, interval). Job bodies use the shared sync pool, so they
+# run on the job thread pool (app.jobs) and never block the loop.
+JOBS = {
+    "budget_alerts": (check_and_send_budget_emails, timedelta(days=1)),
+    "recurring_transactions": (handle_recurring_transactions, timedelta(days=1)),
+    "transaction_insights": (send_transaction_insights_email, timedelta(weeks=4)),
+    "balance_reconciliation": (reconcile_account_balances, timedelta(days=1)),
+    "rollup_reconciliation": (reconcile_account_rollups, timedelta(days=1)),
+}
+
+
+class JobScheduler:
+    def __init__(self, jobs=None, poll_seconds=None, lease_seconds=None):
+        self.jobs = jobs or JOBS
+        self.poll_seconds = poll_seconds or config.SCHEDULER_POLL_SECONDS
+        self.lease = timedelta(seconds=lease_seconds or config.SCHEDULER_LEASE_SECONDS)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running = {}
+        self._task = None
+
+    async def register(self):
+        now = datetime.utcnow()
+        for name, (_, interval) in self.jobs.items():
+            try:
+                await jobs_collection.update_one(
+                    {"_id": name},
+                    {
+                        "$setOnInsert": {"nextRunAt": now + interval, "lastRunAt": None, "lockedUntil": None},
+                        "$set": {"intervalSeconds": interval.total_seconds()},
+                    },
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                pass  # another worker registered it first
+
+    async def acquire(self, name: str):
+        """Take the job's lease if it is due and nobody else holds it"""
+        now = datetime.utcnow()
+        return await jobs_collection.find_one_and_update(
+            {
+                "_id": name,
+                "nextRunAt": {"$lte": now},
+                "$or": [{"lockedUntil": None}, {"lockedUntil": {"$lt": now}}],
+            },
+            {"$set": {"lockedBy": self.owner, "lockedUntil": now + self.lease}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _heartbeat(self, name: str):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            await jobs_collection.update_one(
+                {"_id": name, "lockedBy": self.owner},
+                {"$set": {"lockedUntil": datetime.utcnow() + self.lease}},
+            )
+
+    async def run_job(self, name: str, state: dict):
+        func, interval = self.jobs[name]
+        started = time.monotonic()
+        heartbeat = asyncio.create_task(self._heartbeat(name))
+        status, error = "ok", None
+        try:
+            print(f"⏱️ Running job {name}")
+            with metrics.job_span(name):
+                await jobs.run_blocking(func)
+        except Exception:
+            status, error = "error", traceback.format_exc()
+            print(f"❌ Job {name} failed:\n{error}")
+        finally:
+            heartbeat.cancel()
+
+        # Keep the original cadence, but never schedule into the past after downtime
+        now = datetime.utcnow()
+        next_run = state["nextRunAt"] + interval
+        if next_run <= now:
+            next_run = now + interval
+        await jobs_collection.update_one(
+            {"_id": name, "lockedBy": self.owner},
+            {"$set": {
+                "lastRunAt": now,
+                "nextRunAt": next_run,
+                "lastStatus": status,
+                "lastError": error,
+                "lastDurationSeconds": round(time.monotonic() - started, 3),
+                "lockedUntil": None,
+            }},
+        )
+
+    async def run_pending(self):
+        for name in self.jobs:
+            if name in self._running:
+                continue
+            # A manually triggered run of the same job is still going (and its owner is alive)
+            if await jobs.job_runs_collection.find_one(
+                {"job": name, "active": True, "lockedUntil": {"$gt": datetime.utcnow()}}, {"_id": 1}
+            ):
+                continue
+            state = await self.acquire(name)
+            if state:
+                task = asyncio.create_task(self.run_job(name, state))
+                self._running[name] = task
+                task.add_done_callback(lambda _, name=name: self._running.pop(name, None))
+
+    async def run_forever(self):
+        await self.register()
+        while True:
+            try:
+                await self.run_pending()
+            except Exception as e:
+                print(f"❌ Scheduler poll failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._running.values()) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def main():
+    await database.connect(warm_sync=True)
+    await ensure_indexes()
+    if config.MAIL_DISPATCHER_MODE != "async":
+        # The API isn't delivering mail, so this process does
+        mailer.start_dispatcher()
+    if config.EVENTS_MODE != "async":
+        events.consumer.start()
+    try:
+        await JobScheduler().run_forever()
+    finally:
+        await events.consumer.stop()
+        await mailer.stop_dispatcher()
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""Fast JSON path for documents read from MongoDB.
+
+Account and transaction documents coming out of the database are already
+validated, so read routes encode them straight to response bytes here instead
+of building AccountResponse/TransactionResponse models and dumping them again.
+The output is the same JSON those models produce: the fields they declare, in
+their order, with money fields as exact decimal strings (Decimal128 values are
+rendered from their decimal digits, never through a float).
+
+orjson is used when installed and the standard library otherwise.
+"""
+import json
+from decimal import Decimal
+
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from schemas import (
+    AccountDetailResponse,
+    AccountPageResponse,
+    AccountResponse,
+    AccountSummaryResponse,
+    TransactionResponse,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# Fields declared as Decimal on the response models; serialised as strings like pydantic does
+MONEY_FIELDS = {"amount", "balance", "budget", "currentBalance"}
+
+TRANSACTION_FIELDS = tuple(TransactionResponse.model_fields)
+ACCOUNT_FIELDS = tuple(AccountResponse.model_fields)
+ACCOUNT_DETAIL_FIELDS = tuple(AccountDetailResponse.model_fields)
+ACCOUNT_PAGE_FIELDS = tuple(AccountPageResponse.model_fields)
+ACCOUNT_SUMMARY_FIELDS = tuple(AccountSummaryResponse.model_fields)
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def money(value):
+    """Render a stored amount the way a pydantic Decimal field would"""
+    if value is None:
+        return None
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, float):
+        return str(Decimal(repr(value)))
+    return str(value)
+
+
+def _encode(doc: dict, fields) -> dict:
+    return {
+        field: money(doc.get(field)) if field in MONEY_FIELDS else doc.get(field)
+        for field in fields
+    }
+
+
+def encode_transaction(txn: dict) -> dict:
+    return _encode(txn, TRANSACTION_FIELDS)
+
+
+def encode_account(account: dict, fields=ACCOUNT_FIELDS) -> dict:
+    """Account document (with `_id` or `id`) -> response dict; transactions are encoded too"""
+    doc = dict(account)
+    if "_id" in doc:
+        doc["id"] = str(doc.pop("_id"))
+    if doc.get("transactions") is not None:
+        doc["transactions"] = [encode_transaction(txn) for txn in doc["transactions"]]
+    elif "transactions" in fields and fields is not ACCOUNT_SUMMARY_FIELDS:
+        doc["transactions"] = []
+    return _encode(doc, fields)
@@ -0,0 +1,86 @@
+"""Time the analytics pipelines over multi-year synthetic data.
+
+    python -m benchmarks.analytics [--generate] [--accounts 2] [--transactions 50000] [--years 5]
+
+Runs against MONGO_URI in a separate database (--db, default finance_bench);
+$dateTrunc needs MongoDB 5.0 or newer. --generate drops and recreates the
+data set first.
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from pymongo import MongoClient
+
+from analytics.services import (
+    budget_history_pipeline,
+    category_pipeline,
+    merchants_pipeline,
+    range_match,
+    series_pipeline,
+)
+from app import config
+from benchmarks import data
+from transactions.rollups import month_key
+
+
+def cases(clerk_user_id: str, account_ids, end: datetime):
+    one_year = range_match(clerk_user_id, end - relativedelta(years=1), end)
+    all_time = range_match(clerk_user_id, datetime(1970, 1, 1), end)
+    return {
+        "series_daily_1y": ("transactions", series_pipeline(one_year, "daily")),
+        "series_weekly_1y": ("transactions", series_pipeline(one_year, "weekly")),
+        "series_monthly_all": ("transactions", series_pipeline(all_time, "monthly")),
+        "categories_1y": ("transactions", category_pipeline(one_year, "expense")),
+        "merchants_all": ("transactions", merchants_pipeline(all_time, 10)),
+        "budget_all": ("account_rollups", budget_history_pipeline(
+            clerk_user_id, "1970-01", month_key(end), account_ids)),
+    }
+
+
+def time_case(sync_db, collection: str, pipeline, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = list(sync_db[collection].aggregate(pipeline))
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"rows": len(rows), "min_ms": round(min(timings), 2), "median_ms": round(statistics.median(timings), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analytics aggregation pipelines")
+    parser.add_argument("--uri", default=config.MONGO_URI)
+    parser.add_argument("--db", default="finance_bench")
+    parser.add_argument("--generate", action="store_true")
+    parser.add_argument("--accounts", type=int, default=2)
+    parser.add_argument("--transactions", type=int, default=50000, help="per account")
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sync_db = MongoClient(args.uri)[args.db]
+    end = datetime(2026, 1, 1)
+    if args.generate:
+        data.drop(sync_db)
+        started = time.perf_counter()
+        data.generate(sync_db, users=1, accounts_per_user=args.accounts,
+                      transactions_per_account=args.transactions, years=args.years, end=end)
+        print(f"generated in {time.perf_counter() - started:.1f}s")
+
+    user = sync_db.users.find_one({}, {"clerkUserId": 1})
+    if not user:
+        parser.error("no data set found; run with --generate")
+    account_ids = sync_db.accounts.distinct("_id", {"clerkUserId": user["clerkUserId"]})
+
+    results = {
+        name: time_case(sync_db, collection, pipeline, args.repeat)
+        for name, (collection, pipeline) in cases(user["clerkUserId"], account_ids, end).items()
+    }
+    print(json.dumps({"transactions": sync_db.transactions.estimated_document_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
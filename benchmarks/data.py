@@ -0,0 +1,169 @@
+"""Synthetic users, accounts and transaction histories for benchmarks.
+
+Documents have the same shape the API writes (transactions linked by
+accountId/clerkUserId, monthly rollups, Decimal128 running balances, a
+recurring schedule per recurring transaction), so benchmarks exercise the real
+query paths. Generation is deterministic for a given seed.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from bson import Decimal128, ObjectId
+
+from accounts.balances import balance_updates, to_decimal
+from transactions.recurring import SCHEDULE_INDEXES, occurrence_date, schedule_from_transaction
+from transactions.rollups import ROLLUP_INDEXES, rollup_updates
+from transactions.services import TRANSACTION_INDEXES
+
+# (category, type, typical amount, share of transactions)
+CATEGORIES = [
+    ("groceries", "expense", 60, 0.22),
+    ("dining", "expense", 35, 0.14),
+    ("transport", "expense", 20, 0.12),
+    ("shopping", "expense", 80, 0.10),
+    ("utilities", "expense", 120, 0.06),
+    ("entertainment", "expense", 40, 0.07),
+    ("health", "expense", 70, 0.04),
+    ("travel", "expense", 400, 0.02),
+    ("rent", "expense", 1400, 0.03),
+    ("salary", "income", 3800, 0.03),
+    ("freelance", "income", 600, 0.04),
+    ("investments", "income", 150, 0.03),
+    ("other-expense", "expense", 25, 0.10),
+]
+
+MERCHANTS = {
+    "groceries": ["Tesco", "Aldi", "Whole Foods", "Lidl"],
+    "dining": ["Pret", "Nando's", "Local Cafe", "Sushi Bar"],
+    "transport": ["Uber", "Metro Card", "Shell"],
+    "shopping": ["Amazon", "IKEA", "Zara"],
+    "utilities": ["Electric Co", "Water Board", "Fibre ISP"],
+    "entertainment": ["Netflix", "Cinema", "Spotify"],
+    "health": ["Pharmacy", "Gym"],
+    "travel": ["Airline", "Hotel"],
+    "rent": ["Landlord"],
+    "salary": ["Employer Ltd"],
+    "freelance": ["Client"],
+    "investments": ["Broker"],
+    "other-expense": ["Misc"],
+}
+
+RECURRING = {"rent": "monthly", "salary": "monthly", "utilities": "monthly", "entertainment": "monthly"}
+
+_WEIGHTS = [share for *_, share in CATEGORIES]
+_RECURRING_WEIGHT = sum(share for category, *_, share in CATEGORIES if category in RECURRING)
+
+
+def next_occurrence(date: datetime, interval: str, after: datetime) -> datetime:
+    n = 1
+    while occurrence_date(date, interval, n) <= after:
+        n += 1
+    return occurrence_date(date, interval, n)
+
+
+def make_transaction(rng: random.Random, account: dict, date: datetime, recurring_share: float,
+                     last_run: datetime) -> dict:
+    category, type, typical, _ = rng.choices(CATEGORIES, weights=_WEIGHTS)[0]
+    # Only categories that plausibly repeat are recurring, at an overall rate of `recurring_share`
+    interval = RECURRING.get(category) if rng.random() < recurring_share / _RECURRING_WEIGHT else None
+    amount = round(max(0.5, rng.lognormvariate(0, 0.5) * typical), 2)
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "accountId": account["_id"],
+        "clerkUserId": account["clerkUserId"],
+        "type": type,
+        "amount": amount,
+        "description": rng.choice(MERCHANTS[category]),
+        "date": date,
+        "category": category,
+        "receiptUrl": None,
+        "isRecurring": interval is not None,
+        "recurringInterval": interval,
+        # Where the recurring job would have left it, had it last run at `last_run`
+        "nextRecurringDate": next_occurrence(date, interval, last_run) if interval else None,
+        "lastProcessed": date,
+        "createdAt": date,
+        "updatedAt": date,
+    }
+
+
+def generate(sync_db, users: int = 1, accounts_per_user: int = 2, transactions_per_account: int = 1000,
+             years: float = 3, recurring_share: float = 0.05, seed: int = 42, batch_size: int = 5000,
+             end: datetime = None, running_balances: bool = True, recurring_backlog: timedelta = timedelta(days=1),
+             ) -> dict:
+    """Insert a synthetic data set into `sync_db`; returns the ids it created.
+
+    With running_balances=False accounts get no currentBalance, like accounts
+    created before it existed. Recurring schedules look as if the recurring job
+    last ran `recurring_backlog` before `end`, so the occurrences since then are due.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.utcnow().replace(microsecond=0)
+    span = timedelta(days=365 * years).total_seconds()
+    last_run = end - recurring_backlog
+    created = {"users": [], "accounts": []}
+
+    for keys, options in TRANSACTION_INDEXES:
+        sync_db.transactions.create_index(keys, **options)
+    for keys, options in ROLLUP_INDEXES:
+        sync_db.account_rollups.create_index(keys, **options)
+    for keys, options in SCHEDULE_INDEXES:
+        sync_db.recurring_schedules.create_index(keys, **options)
+
+    for u in range(users):
+        clerk_user_id = f"user_bench_{seed}_{u}"
+        sync_db.users.insert_one({
+            "clerkUserId": clerk_user_id,
+            "email": f"{clerk_user_id}@example.com",
+            "name": f"Bench User {u}",
+            "createdAt": end,
+        })
+        created["users"].append(clerk_user_id)
+
+        for a in range(accounts_per_user):
+            opening = round(rng.uniform(0, 5000), 2)
+            account = {
+                "_id": ObjectId(),
+                "clerkUserId": clerk_user_id,
+                "name": f"Account {a}",
+                "type": "CURRENT" if a == 0 else "SAVINGS",
+                "balance": opening,
+                "currentBalance": Decimal128(to_decimal(opening)) if running_balances else None,
+                "budget": float(rng.choice([1500, 2500, 4000])) if a == 0 else None,
+                "isDefault": a == 0,
+                "createdAt": end - timedelta(seconds=span),
+                "updatedAt": end,
+            }
+            if not running_balances:
+                del account["currentBalance"]
+            sync_db.accounts.insert_one(account)
+            created["accounts"].append(account["_id"])
+
+            remaining = transactions_per_account
+            while remaining:
+                count = min(batch_size, remaining)
+                batch = [
+                    make_transaction(
+                        rng, account, end - timedelta(seconds=rng.uniform(0, span)), recurring_share, last_run)
+                    for _ in range(count)
+                ]
+                sync_db.transactions.insert_many(batch, ordered=False)
+                schedules = [schedule_from_transaction(txn) for txn in batch if txn["isRecurring"]]
+                if schedules:
+                    sync_db.recurring_schedules.insert_many(schedules, ordered=False)
+                sync_db.account_rollups.bulk_write(rollup_updates(batch), ordered=False)
+                updates = balance_updates(batch) if running_balances else []
+                if updates:
+                    sync_db.accounts.bulk_write(updates, ordered=False)
+                remaining -= count
+
+    return created
+
+
+def drop(sync_db):
+    # The generated data plus everything the routes and scheduled jobs derive from it
+    for name in ("users", "accounts", "transactions", "account_rollups", "recurring_schedules",
+                 "email_outbox", "insights_cache", "idempotency_keys", "job_runs", "scheduler_jobs"):
+        sync_db.drop_collection(name)
+
@@ -0,0 +1,439 @@
+"""Load test every accounts, transactions and users route, then time the cron jobs.
+
+    python -m benchmarks.load [--backend mongod|mongomock] [--users 20] [--transactions 1000]
+                              [--concurrency 16] [--requests 200] [--output results.json]
+                              [--baseline previous.json]
+
+The app is driven in-process through httpx's ASGI transport, so there is no
+network hop and no server to start. Each route gets `--requests` calls from
+`--concurrency` concurrent clients spread across the generated users; the result
+is throughput, error count and p50/p99 latency per route, plus the run time of
+every scheduled job, as JSON that can be diffed between commits.
+
+`--backend mongod` (the default) uses MONGO_URI with a separate database
+(`--db`, default finance_bench) that is dropped and regenerated on every run.
+`--backend mongomock` needs the mongomock-motor package and no server; it is fine for
+smoke runs but its timings say little about MongoDB, and pipelines it doesn't
+implement show up as errors. It can't $inc Decimal128 either, so accounts are
+generated there without a running balance, and the jobs in MONGOMOCK_SKIPPED_JOBS
+are reported as skipped rather than timed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Settings that must be in place before the app modules read app.config
+BENCH_ENV = {
+    "SCHEDULER_MODE": "off",  # jobs are timed explicitly below, not left to fire mid-run
+    "MAIL_DISPATCHER_MODE": "off",  # budget alerts stay in the outbox
+    "INSIGHTS_LLM": "fake",
+    "REQUEST_LOG_MIN_MS": "60000",
+    "RATE_LIMIT_BACKEND": "off",  # the load generator is one tenant hammering every route
+}
+
+# Scheduled jobs whose pipelines mongomock can't run, and why
+MONGOMOCK_SKIPPED_JOBS = {
+    "budget_alerts": "mongomock doesn't implement $lookup with let",
+    "transaction_insights": "mongomock doesn't implement $lookup with let",
+}
+
+
+def use_mongomock(database):
+    """Point the app's Motor client and the jobs' pymongo pool at one in-memory store"""
+    try:
+        import mongomock
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("--backend mongomock needs the mongomock-motor package")
+
+    # pymongo 4.9+ passes `sort` with every UpdateOne/ReplaceOne in a bulk write,
+    # which mongomock's bulk builder doesn't accept (nor implement)
+    builder = mongomock.collection.BulkOperationBuilder
+    for method in ("add_update", "add_replace"):
+        original = getattr(builder, method)
+        if not getattr(original, "drops_sort", False):
+            def without_sort(self, *args, sort=None, _original=original, **kwargs):
+                return _original(self, *args, **kwargs)
+            without_sort.drops_sort = True
+            setattr(builder, method, without_sort)
+
+    sync_client = mongomock.MongoClient()
+    database.client = AsyncMongoMockClient(mock_mongo_client=sync_client)
+    database.db = database.client[database.config.MONGO_DB_NAME]
+    database.accounts_collection = database.db["accounts"]
+    database.transactions_collection = database.db["transactions"]
+    database._sync_client = sync_client
+
+    async def connect(warm_sync: bool = False):
+        pass
+
+    database.connect = connect
+
+
+class Fixture:
+    """What the generated data set looks like, for building request bodies"""
+
+    def __init__(self, sync_db):
+        self.users = list(sync_db.users.find({}, {"clerkUserId": 1, "email": 1}))
+        self.accounts = list(sync_db.accounts.find(
+            {}, {"clerkUserId": 1, "name": 1, "type": 1, "balance": 1, "budget": 1, "isDefault": 1}))
+        self.rng = random.Random(7)
+        self.transactions = [
+            (txn["accountId"], txn["id"])
+            for txn in sync_db.transactions.find({}, {"accountId": 1, "id": 1}).limit(50000)
+        ]
+        self.rng.shuffle(self.transactions)
+        self.owners = {acc["_id"]: acc for acc in self.accounts}
+        self._serial = 0
+
+    def serial(self) -> int:
+        self._serial += 1
+        return self._serial
+
+    def account(self) -> dict:
+        return self.rng.choice(self.accounts)
+
+    def transaction(self):
+        """(account, transaction id) of an existing row"""
+        account_id, transaction_id = self.rng.choice(self.transactions)
+        return self.owners[account_id], transaction_id
+
+    def take_transaction(self):
+        """Like transaction(), but never hands out the same row twice (for deletes)"""
+        account_id, transaction_id = self.transactions.pop()
+        return self.owners[account_id], transaction_id
+
+    def new_transaction(self) -> dict:
+        return {
+            "type": self.rng.choice(["income", "expense"]),
+            "amount": str(round(self.rng.uniform(1, 500), 2)),
+            "description": "Load test",
+            "date": datetime.utcnow().replace(microsecond=0).isoformat(),
+            "category": self.rng.choice(["groceries", "dining", "transport", "salary"]),
+        }
+
+
+def _account_body(account: dict, **overrides) -> dict:
+    """The account as stored, so updates don't change what later routes see"""
+    budget = account.get("budget")
+    return {"clerkUserId": account["clerkUserId"], "name": account["name"], "type": account["type"],
+            "balance": str(account.get("balance") or 0), "budget": None if budget is None else str(budget),
+            "isDefault": account.get("isDefault", False), **overrides}
+
+
+# "<router>.<route>" -> factory returning the next request as (method, path, httpx kwargs)
+def scenarios(fx: Fixture):
+    def getaccounts():
+        return "GET", f"/accounts/account/{fx.account()['clerkUserId']}", {}
+
+    def createaccount():
+        user = fx.rng.choice(fx.users)
+        return "POST", "/accounts/account", {"json": {
+            "clerkUserId": user["clerkUserId"], "name": f"Load {fx.serial()}", "type": "SAVINGS", "balance": "100"}}
+
+    def updateaccount():
+        account = fx.account()
+        return "PUT", f"/accounts/account/{account['_id']}", {"json": _account_body(account)}
+
+    def updatedefaultaccount():
+        # Re-assert each user's existing default, keeping one default per user
+        account = fx.rng.choice([acc for acc in fx.accounts if acc.get("isDefault")])
+        return "PUT", f"/accounts/defaultaccount/{account['_id']}", {"json": _account_body(account)}
+
+    def get_account():
+        return "GET", f"/accounts/singleaccount/{fx.account()['_id']}", {}
+
+    def get_user_accounts():
+        return "GET", f"/accounts/useraccount/{fx.account()['clerkUserId']}", {}
+
+    def expenses_monthly():
+        return "GET", f"/accounts/expenses/monthly/{fx.account()['clerkUserId']}", {}
+
+    def update_budget():
+        return "POST", f"/accounts/budget/{fx.account()['_id']}", {"json": {"budget": round(fx.rng.uniform(500, 5000), 2)}}
+
+    def createtransaction():
+        account = fx.account()
+        return "POST", f"/transactions/transaction/{account['clerkUserId']}/{account['name']}", {"json": fx.new_transaction()}
+
+    def get_transactions():
+        account = fx.account()
+        return "GET", f"/transactions/transaction/{account['clerkUserId']}/{account['name']}", {"params": {"limit": 50}}
+
+    def gettransaction():
+        account, transaction_id = fx.transaction()
+        return "POST", f"/transactions/gettransaction/{transaction_id}", {"json": {
+            "clerkId": account["clerkUserId"], "accountName": account["name"]}}
+
+    def edit_transaction():
+        account, transaction_id = fx.transaction()
+        body = {**fx.new_transaction(), "isRecurring": False}
+        body["amount"] = float(body["amount"])
+        return "PUT", f"/transactions/edittransaction/{account['_id']}/{transaction_id}", {"json": body}
+
+    def delete_transaction():
+        account, transaction_id = fx.take_transaction()
+        return "POST", f"/transactions/deletetransaction/{transaction_id}", {"json": {
+            "clerkId": account["clerkUserId"], "accountName": account["name"]}}
+
+    def deletebulk():
+        rows = [fx.take_transaction() for _ in range(10)]
+        account = rows[0][0]
+        ids = [transaction_id for acc, transaction_id in rows if acc["_id"] == account["_id"]]
+        return "POST", f"/transactions/deletebulk/{account['_id']}", {"json": ids}
+
+    def batch():
+        account, _ = fx.transaction()
+        operations = []
+        for _ in range(10):
+            owner, transaction_id = fx.transaction()
+            if owner["clerkUserId"] == account["clerkUserId"]:
+                operations.append({"op": "update", "accountId": str(owner["_id"]), "transactionId": transaction_id,
+                                   "set": {"description": f"Batch {fx.serial()}"}})
+        if not operations:
+            operations.append({"op": "delete", "accountId": str(account["_id"]), "transactionId": "missing"})
+        return "POST", "/transactions/batch", {"json": {"clerkUserId": account["clerkUserId"], "operations": operations}}
+
+    def export_csv():
+        account = fx.account()
+        since = (datetime.utcnow() - timedelta(days=90)).replace(microsecond=0).isoformat()
+        return "GET", f"/transactions/export/{account['clerkUserId']}/{account['name']}", {
+            "params": {"format": "csv", "from": since}}
+
+    def import_csv():
+        account = fx.account()
+        rows = "".join(
+            f"expense,{fx.rng.randint(1, 200)},{datetime.utcnow().date()}T00:00:00,groceries,Import\n" for _ in range(100)
+        )
+        return "POST", f"/transactions/import/{account['clerkUserId']}/{account['name']}", {
+            "content": ("type,amount,date,category,description\n" + rows).encode()}
+
+    def createUser():
+        n = fx.serial()
+        return "POST", "/users/user", {"json": {
+            "clerkUserId": f"user_load_{n}", "email": f"load_{n}_{uuid.uuid4().hex[:6]}@example.com", "name": "Load"}}
+
+    def get_user():
+        return "GET", f"/users/user/{fx.rng.choice(fx.users)['email']}", {}
+
+    return {
+        "accounts.getaccounts": getaccounts,
+        "accounts.createaccount": createaccount,
+        "accounts.updateaccount": updateaccount,
+        "accounts.updatedefaultaccount": updatedefaultaccount,
+        "accounts.get_account": get_account,
+        "accounts.get_user_accounts": get_user_accounts,
+        "accounts.expenses_monthly": expenses_monthly,
+        "accounts.update_budget": update_budget,
+        "transactions.createtransaction": createtransaction,
+        "transactions.get_transactions": get_transactions,
+        "transactions.gettransaction": gettransaction,
+        "transactions.edit_transaction": edit_transaction,
+        "transactions.batch": batch,
+        "transactions.export_csv": export_csv,
+        "transactions.import_csv": import_csv,
+        # Last, so the rows the other routes pick at random are still there
+        "transactions.delete_transaction": delete_transaction,
+        "transactions.deletebulk": deletebulk,
+        "users.createUser": createUser,
+        "users.get_user": get_user,
+    }
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(q * (len(sorted_values) - 1)))]
+
+
+async def load_route(client, make_request, requests: int, concurrency: int) -> dict:
+    latencies, errors, statuses = [], 0, {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, path, kwargs = make_request()
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+async def time_jobs(jobs, skipped=None) -> dict:
+    results = {}
+    for name, (func, _) in jobs.items():
+        if skipped and name in skipped:
+            results[name] = {"status": "skipped", "reason": skipped[name]}
+            continue
+        started = time.perf_counter()
+        status, error, stats = "ok", None, None
+        try:
+            stats = await asyncio.to_thread(func)
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+        results[name] = {"seconds": round(time.perf_counter() - started, 3), "status": status}
+        if error:
+            results[name]["error"] = error
+        elif isinstance(stats, dict):
+            # What the run did, so an empty run isn't mistaken for a fast one
+            results[name]["stats"] = stats
+    return results
+
+
+def compare(baseline: dict, results: dict):
+    """Print each route's change against an earlier results file"""
+    print(f"vs {baseline.get('commit')}:")
+    for name, now in results["routes"].items():
+        before = baseline.get("routes", {}).get(name)
+        if not before:
+            continue
+        changes = [
+            f"{metric} {before[metric]} -> {now[metric]} ({(now[metric] - before[metric]) / before[metric]:+.0%})"
+            for metric in ("throughput_rps", "p50_ms", "p99_ms") if before[metric]
+        ]
+        print(f"{name:<36} " + "  ".join(changes))
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def run(args) -> dict:
+    import httpx
+
+    import database
+    if args.backend == "mongomock":
+        use_mongomock(database)
+
+    from app.scheduler import JOBS
+    from benchmarks import data
+    from main import app
+
+    sync_db = database.get_sync_db()
+    sync_db.client.drop_database(sync_db.name)
+    started = time.perf_counter()
+    data.generate(
+        sync_db, users=args.users, accounts_per_user=args.accounts, transactions_per_account=args.transactions,
+        years=args.years, recurring_share=args.recurring_share, seed=args.seed,
+        running_balances=args.backend != "mongomock",
+    )
+    generated_seconds = time.perf_counter() - started
+
+    fx = Fixture(sync_db)
+    routes = scenarios(fx)
+    if args.routes:
+        routes = {name: routes[name] for name in args.routes}
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name, make_request in routes.items():
+                await load_route(client, make_request, args.warmup, 1)
+                results[name] = await load_route(client, make_request, args.requests, args.concurrency)
+                print(f"{name:<36} {results[name]['throughput_rps']:>8} req/s  "
+                      f"p50 {results[name]['p50_ms']:>8} ms  p99 {results[name]['p99_ms']:>8} ms  "
+                      f"errors {results[name]['errors']}")
+        skipped = MONGOMOCK_SKIPPED_JOBS if args.backend == "mongomock" else None
+        jobs = await time_jobs(JOBS, skipped) if not args.skip_jobs else {}
+
+    return {
+        "commit": git_commit(),
+        "startedAt": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "dataset": {
+            "users": args.users, "accountsPerUser": args.accounts, "transactionsPerAccount": args.transactions,
+            "years": args.years, "recurringShare": args.recurring_share, "seed": args.seed,
+            "generatedSeconds": round(generated_seconds, 2),
+        },
+        "load": {"concurrency": args.concurrency, "requestsPerRoute": args.requests, "warmup": args.warmup,
+                 "cache": os.environ.get("CACHE_BACKEND", "memory")},
+        "routes": results,
+        "jobs": jobs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API routes and time the scheduled jobs")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--uri", default=None, help="defaults to MONGO_URI")
+    parser.add_argument("--db", default="finance_bench", help="dropped and regenerated on every run")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--accounts", type=int, default=2, help="per user")
+    parser.add_argument("--transactions", type=int, default=1000, help="per account, 10 to 1,000,000")
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--recurring-share", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="per route")
+    parser.add_argument("--warmup", type=int, default=10, help="sequential requests per route before measuring")
+    parser.add_argument("--routes", nargs="*", help="only these routes, e.g. accounts.getaccounts")
+    parser.add_argument("--cache", choices=["memory", "redis", "off"], default=None,
+                        help="response cache backend (default: CACHE_BACKEND)")
+    parser.add_argument("--skip-jobs", action="store_true")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+    if not 10 <= args.transactions <= 1_000_000:
+        parser.error("--transactions must be between 10 and 1,000,000")
+
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ["MONGO_DB_NAME"] = args.db
+    if args.uri:
+        os.environ["MONGO_URI"] = args.uri
+    if args.cache:
+        os.environ["CACHE_BACKEND"] = args.cache
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"✅ Results written to {args.output}")
+    else:
+        print(output)
+    if baseline:
+        compare(baseline, results)
+
+
+if __name__ == "__main__":
+    main()
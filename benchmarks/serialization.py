@@ -0,0 +1,95 @@
+"""Compare the model-based and direct encoding of an account response.
+
+    python -m benchmarks.serialization [--sizes 1000 10000 100000] [--repeat 3]
+
+"old" is the previous path (convert_decimal_to_float, AccountResponse(**doc),
+model_dump, json.dumps); "new" is app.serialization. Both are checked to
+produce the same JSON before timing.
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from accounts.routes import convert_decimal_to_float
+from app import serialization
+from schemas import AccountResponse
+
+CATEGORIES = ["groceries", "rent", "salary", "utilities", "transport", "dining", "health", "shopping"]
+
+
+def make_account(transactions: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    now = datetime(2026, 1, 1)
+    return {
+        "_id": ObjectId(),
+        "clerkUserId": "user_bench",
+        "name": "Main",
+        "type": "CURRENT",
+        "balance": 1520.75,
+        "budget": 2000.0,
+        "isDefault": True,
+        "createdAt": now,
+        "updatedAt": now,
+        "transactions": [
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "type": "income" if i % 10 == 0 else "expense",
+                "amount": round(rng.uniform(1, 500), 2),
+                "description": f"Payment {i}",
+                "date": now - timedelta(hours=i),
+                "category": rng.choice(CATEGORIES),
+                "receiptUrl": "https://receipts.example.com/r/%d" % i if i % 7 == 0 else None,
+                "isRecurring": i % 25 == 0,
+                "recurringInterval": "monthly" if i % 25 == 0 else None,
+                "nextRecurringDate": None,
+                "lastProcessed": now,
+                "createdAt": now,
+                "updatedAt": now,
+            }
+            for i in range(transactions)
+        ],
+    }
+
+
+def old_path(account: dict) -> bytes:
+    doc = convert_decimal_to_float(dict(account))
+    doc["id"] = str(doc.pop("_id"))
+    return json.dumps(AccountResponse(**doc).model_dump(mode="json")).encode()
+
+
+def new_path(account: dict) -> bytes:
+    return serialization.dumps(serialization.encode_account(account))
+
+
+def best_of(func, account, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(account)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"orjson: {'yes' if serialization.orjson else 'no'}")
+    print(f"{'transactions':>12} {'old ms':>10} {'new ms':>10} {'speedup':>8} {'bytes':>12}")
+    for size in args.sizes:
+        account = make_account(size)
+        assert json.loads(old_path(account)) == json.loads(new_path(account)), "encodings differ"
+        old = best_of(old_path, account, args.repeat)
+        new = best_of(new_path, account, args.repeat)
+        print(f"{size:>12} {old * 1000:>10.1f} {new * 1000:>10.1f} {old / new:>7.1f}x {len(new_path(account)):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,53 @@
 
 from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from pymongo import MongoClient
+from app import config
+from app.metrics import command_timer
+import asyncio
+import threading
 
-MONGO_URI = os.getenv("MONGO_URI")
+# One place for pool sizing and timeouts; the API (Motor) and the scheduled
+# jobs (pymongo) each keep a single long-lived pool built from these options.
+CLIENT_OPTIONS = {
+    "maxPoolSize": config.MONGO_MAX_POOL_SIZE,
+    "minPoolSize": config.MONGO_MIN_POOL_SIZE,
+    "maxIdleTimeMS": config.MONGO_MAX_IDLE_TIME_MS,
+    "connectTimeoutMS": config.MONGO_CONNECT_TIMEOUT_MS,
+    "serverSelectionTimeoutMS": config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    "appname": "financebackend",
+    "event_listeners": [command_timer],
+}
 
-client = AsyncIOMotorClient(MONGO_URI)
+client = AsyncIOMotorClient(config.MONGO_URI, **CLIENT_OPTIONS)
 
-db = client["finance"]
+db = client[config.MONGO_DB_NAME]
 accounts_collection = db["accounts"]
-transactions_collection = db["transactions"]
\ No newline at end of file
+transactions_collection = db["transactions"]
+
+_sync_client = None
+_sync_lock = threading.Lock()
+
+
+def get_sync_db():
+    """Database handle on the shared synchronous pool used by scheduled jobs"""
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None:
+            _sync_client = MongoClient(config.MONGO_URI, **CLIENT_OPTIONS)
+    return _sync_client[config.MONGO_DB_NAME]
+
+
+async def connect(warm_sync: bool = False):
+    """Fail fast if MongoDB is unreachable and open the pools before traffic arrives"""
+    await client.admin.command("ping")
+    if warm_sync:
+        await asyncio.to_thread(get_sync_db().command, "ping")
+
+
+def close():
+    global _sync_client
+    client.close()
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
@@ -1,15 +1,21 @@
-from fastapi import FastAPI, Request,BackgroundTasks
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, EmailStr
-from app.email_utils import send_email
+from app import cache, events, jobs, mailer, metrics
 from fastapi.middleware.cors import CORSMiddleware
 
 
 from users.routes import router as users_router
 from accounts.routes import router as accounts_router
 from transactions.routes import router as transactions_router
-
-from apscheduler.schedulers.background import BackgroundScheduler
-from app.cron import check_and_send_budget_emails, handle_recurring_transactions,send_transaction_insights_email
+from analytics.routes import router as analytics_router
+import database
+from contextlib import asynccontextmanager
+
+from app import config
+from app.serialization import FastJSONResponse
+from app.indexes import ensure_indexes
+from app.scheduler import JOBS, JobScheduler
 import google.generativeai as genai
 import os
 
@@ -19,7 +25,31 @@ genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 
 
-app = FastAPI()
+scheduler = JobScheduler() if config.SCHEDULER_MODE == "async" else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open and ping both pools before serving so the first request and the
+    # first job run don't pay the TCP/TLS handshake
+    await database.connect(warm_sync=scheduler is not None)
+    await ensure_indexes()
+    if scheduler:
+        scheduler.start()
+    if config.MAIL_DISPATCHER_MODE == "async":
+        mailer.start_dispatcher()
+    if config.EVENTS_MODE == "async":
+        events.consumer.start()
+    yield
+    await events.consumer.stop()
+    if scheduler:
+        await scheduler.stop()
+    await mailer.stop_dispatcher()
+    await jobs.shutdown()
+    database.close()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 class EmailRequest(BaseModel):
     email: EmailStr
     subject: str
@@ -36,13 +66,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so latency includes CORS handling and every response is counted
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.post("/send-email")
-async def trigger_email(data: EmailRequest, background_tasks: BackgroundTasks):
-    background_tasks.add_task(
-        send_email, to_email=data.email, subject=data.subject, body=data.message
-    )
+async def trigger_email(data: EmailRequest):
+    await mailer.enqueue_email(data.email, data.subject, data.message)
     return {"message": "Email is being sent in the background."}
 
 app.include_router(users_router, prefix="/users", tags=["users"])
@@ -54,12 +84,17 @@ app.include_router(
     transactions_router, prefix="/transactions", tags=["transactions"]
 )  # Assuming you have a similar router for transactions
 
-scheduler = BackgroundScheduler()
-scheduler.add_job(check_and_send_budget_emails, 'interval', days=1, max_instances=1)
-scheduler.add_job(handle_recurring_transactions, 'interval', days=1, max_instances=1)
-scheduler.add_job(send_transaction_insights_email, 'interval',  weeks=4, max_instances=1)
+app.include_router(analytics_router, prefix="/analytics", tags=["analytics"])
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"backend": config.CACHE_BACKEND, "routes": cache.stats}
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-scheduler.start()
 
 @app.get("/")
 def root():
@@ -67,11 +102,38 @@ def root():
 
 
 
-@app.get("/test-budget-alert")
-def test_budget_alert():
-    print("Triggered budget check!")
-    check_and_send_budget_emails()
-    handle_recurring_transactions()
-    send_transaction_insights_email()
-    return {"status": "Email check triggered"}
+@app.post("/jobs/{name}", status_code=202)
+async def trigger_job(name: str):
+    """Start a run of a scheduled job now; poll GET /jobs/{id} for its outcome"""
+    if name not in JOBS:
+        raise HTTPException(status_code=404, detail=f"Unknown job, expected one of {sorted(JOBS)}")
+    try:
+        run = await jobs.dispatch(name, JOBS[name][0])
+    except jobs.JobAlreadyRunning as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "runningId": e.run_id})
+    return JSONResponse(
+        status_code=202,
+        content={"id": run["_id"], "job": name, "status": run["status"]},
+        headers={"Location": f"/jobs/{run['_id']}"},
+    )
+
+
+@app.get("/jobs/{run_id}")
+async def get_job_run(run_id: str):
+    run = await jobs.get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Job run not found")
+    return jobs.public_run(run)
+
+
+@app.get("/test-budget-alert", status_code=202)
+async def test_budget_alert():
+    # Queues the three mail jobs instead of running them inside the request
+    runs = {}
+    for name in ("budget_alerts", "recurring_transactions", "transaction_insights"):
+        try:
+            runs[name] = (await jobs.dispatch(name, JOBS[name][0]))["_id"]
+        except jobs.JobAlreadyRunning as e:
+            runs[name] = e.run_id or "running"
+    return {"status": "Email check triggered", "runs": runs}
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, HttpUrl, EmailStr, Field
+from pydantic import BaseModel, HttpUrl, EmailStr, Field, field_validator
 from datetime import datetime
 from decimal import Decimal
 from typing import Optional, List, Literal
@@ -15,6 +15,11 @@ class TransactionCreate(BaseModel):
     recurringInterval: Optional[Literal["daily", "weekly", "monthly", "yearly"]] = None
 
 
+class TransactionCreateRequest(TransactionCreate):
+    # Client-chosen id: a retry carrying the same id is never written twice
+    id: Optional[str] = Field(None, min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
+
+
 class TransactionResponse(TransactionCreate):
     id: str
     nextRecurringDate: Optional[datetime]
@@ -26,6 +31,37 @@ class TransactionResponse(TransactionCreate):
         from_attributes = True 
 
 
+class TransactionPatch(BaseModel):
+    type: Optional[Literal["income", "expense"]] = None
+    amount: Optional[Decimal] = None
+    description: Optional[str] = None
+    date: Optional[datetime] = None
+    category: Optional[str] = None
+    isRecurring: Optional[bool] = None
+
+    @field_validator("type", "amount", "date", "category", "isRecurring")
+    @classmethod
+    def not_null(cls, value):
+        # Leave a field out to keep it; only description can be cleared with null
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+
+class BatchOperation(BaseModel):
+    op: Literal["update", "delete", "move"]
+    accountId: str
+    transactionId: str
+    toAccountId: Optional[str] = None  # required for "move"
+    set: Optional[TransactionPatch] = None  # "update", or extra changes applied by "move"
+
+
+class BatchMutationRequest(BaseModel):
+    clerkUserId: str
+    operations: List[BatchOperation] = Field(..., min_length=1)
+    atomic: bool = False  # all-or-nothing inside a MongoDB transaction (needs a replica set)
+
+
 class AccountCreate(BaseModel):
     clerkUserId: str
     name: str
@@ -46,6 +82,29 @@ class AccountResponse(AccountCreate):
         from_attributes = True 
 
 
+class AccountPageResponse(AccountResponse):
+    # One page of transactions, newest first; pass nextCursor back for the next one
+    nextCursor: Optional[str] = None
+
+
+class AccountSummaryResponse(BaseModel):
+    id: str
+    name: str
+    type: Literal["CURRENT", "SAVINGS"]
+    isDefault: bool
+    budget: Optional[Decimal] = None
+    currentBalance: Decimal
+    transactionCount: int
+    lastActivity: Optional[datetime] = None
+    transactions: Optional[List[TransactionResponse]] = None
+
+
+class AccountDetailResponse(AccountResponse):
+    currentBalance: Decimal
+    transactionCount: int
+    lastActivity: Optional[datetime] = None
+
+
 class BudgetCreate(BaseModel):
     amount: Decimal
 
@@ -0,0 +1,77 @@
+"""Shared test setup.
+
+The app runs against an in-memory mongomock store: settings are fixed before
+any app module reads app.config, then the Motor client and the jobs' pymongo
+pool are pointed at mongomock the same way `benchmarks.load --backend mongomock`
+does. No MongoDB server, SMTP server or LLM key is needed.
+"""
+import os
+
+os.environ.update({
+    "SCHEDULER_MODE": "off",
+    "MAIL_DISPATCHER_MODE": "off",
+    "EVENTS_MODE": "off",
+    "RATE_LIMIT_BACKEND": "off",
+    "CACHE_BACKEND": "memory",
+    "INSIGHTS_LLM": "fake",
+    "REQUEST_LOG_MIN_MS": "60000",
+})
+
+import database  # noqa: E402
+from benchmarks.load import use_mongomock  # noqa: E402
+
+use_mongomock(database)
+
+import asyncio  # noqa: E402
+from datetime import datetime  # noqa: E402
+
+import pytest  # noqa: E402
+from bson import ObjectId  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import cache, config  # noqa: E402
+from app.indexes import ensure_indexes  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def sync_db():
+    """An empty database with the app's indexes (unique ids etc.) and a cold cache"""
+    asyncio.run(ensure_indexes())
+    cache.backend = cache.MemoryCache(config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS)
+    yield database.get_sync_db()
+    database._sync_client.drop_database(config.MONGO_DB_NAME)
+
+
+@pytest.fixture
+def client():
+    import main
+
+    # No `with`: the lifespan (pings, background workers) isn't needed
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def make_account(sync_db):
+    """Insert an account the way older data looks (no running balance, which mongomock can't $inc)"""
+
+    def make(clerk_user_id="user_1", name="Main", **fields):
+        account = {
+            "_id": ObjectId(),
+            "clerkUserId": clerk_user_id,
+            "name": name,
+            "type": "CURRENT",
+            "balance": 100.0,
+            "isDefault": True,
+            "createdAt": datetime.utcnow(),
+            "updatedAt": datetime.utcnow(),
+            **fields,
+        }
+        sync_db.accounts.insert_one(account)
+        return account
+
+    return make
@@ -0,0 +1,45 @@
+def add_transactions(client, account, count):
+    # Through the API, so the rollups behind transactionCount move too
+    for n in range(count):
+        body = {"id": f"{account['name']}-{n}", "type": "expense", "amount": 1.0, "category": "misc",
+                "date": f"2024-05-0{n + 1}T00:00:00"}
+        assert client.post(f"/transactions/transaction/user_1/{account['name']}", json=body).status_code == 200
+
+
+def listing(client, **params):
+    response = client.get("/accounts/account/user_1", params=params)
+    assert response.status_code == 200
+    return {account["name"]: account for account in response.json()}
+
+
+def test_detailed_listing_carries_stats_but_no_history_by_default(client, make_account):
+    main = make_account(name="Main")
+    make_account(name="Savings", isDefault=False)
+    add_transactions(client, main, 3)
+
+    accounts = listing(client)
+    assert set(accounts) == {"Main", "Savings"}
+    # The contract since histories moved out of the account: nothing embedded unless asked for
+    assert accounts["Main"]["transactions"] == []
+    assert accounts["Main"]["transactionCount"] == 3
+    assert accounts["Main"]["lastActivity"] == "2024-05-03T00:00:00"
+    assert (accounts["Savings"]["transactionCount"], accounts["Savings"]["lastActivity"]) == (0, None)
+
+
+def test_include_transactions_embeds_the_most_recent_per_account(client, make_account):
+    main = make_account(name="Main")
+    add_transactions(client, main, 5)
+
+    accounts = listing(client, include="transactions", limit=2)
+    assert [txn["id"] for txn in accounts["Main"]["transactions"]] == ["Main-4", "Main-3"]
+    assert accounts["Main"]["transactionCount"] == 5
+
+
+def test_summary_view_has_only_list_fields(client, make_account):
+    add_transactions(client, make_account(name="Main"), 1)
+
+    summary = listing(client, view="summary")["Main"]
+    assert "transactions" not in summary
+    assert "clerkUserId" not in summary
+    assert summary["transactionCount"] == 1
+    assert listing(client, view="summary", include="transactions")["Main"]["transactions"][0]["id"] == "Main-0"
@@ -0,0 +1,143 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import analytics.routes
+from analytics.services import merchants_pipeline, series_pipeline
+
+
+def add_transactions(sync_db, account, *rows):
+    sync_db.transactions.insert_many([
+        {
+            "id": f"txn-{n}",
+            "accountId": account["_id"],
+            "clerkUserId": account["clerkUserId"],
+            "type": type,
+            "amount": amount,
+            "category": category,
+            "description": description,
+            "date": date,
+        }
+        for n, (type, amount, category, description, date) in enumerate(rows)
+    ])
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    """The pipelines the route sends; mongomock implements neither $dateTrunc nor $trim"""
+    pipelines = []
+
+    class Cursor:
+        async def to_list(self, length):
+            return []
+
+    def aggregate(pipeline):
+        pipelines.append(pipeline)
+        return Cursor()
+
+    monkeypatch.setattr(analytics.routes, "db", SimpleNamespace(transactions=SimpleNamespace(aggregate=aggregate)))
+    return pipelines
+
+
+def test_category_shares_within_an_exclusive_range(client, sync_db, make_account):
+    account = make_account()
+    add_transactions(
+        sync_db, account,
+        ("expense", 30.0, "groceries", "Tesco", datetime(2024, 3, 5)),
+        ("expense", 10.0, "dining", "Pret", datetime(2024, 3, 9)),
+        ("expense", 60.0, "groceries", "Aldi", datetime(2024, 3, 20)),
+        ("income", 500.0, "salary", "Employer", datetime(2024, 3, 25)),
+        ("expense", 99.0, "groceries", "Tesco", datetime(2024, 4, 1)),
+    )
+
+    body = client.get("/analytics/categories/user_1", params={"from": "2024-03-01", "to": "2024-04-01"}).json()
+    assert body["total"] == 100
+    assert body["categories"] == [
+        {"category": "groceries", "total": 90.0, "count": 2, "share": 0.9},
+        {"category": "dining", "total": 10.0, "count": 1, "share": 0.1},
+    ]
+
+
+def test_time_zone_aware_bounds_are_compared_as_utc(client, sync_db, make_account):
+    account = make_account()
+    add_transactions(
+        sync_db, account,
+        ("expense", 5.0, "dining", "Pret", datetime(2024, 1, 1, 1, 30)),
+        ("expense", 7.0, "dining", "Pret", datetime(2024, 1, 1, 3, 0)),
+    )
+
+    # An aware `from` with no `to` used to be compared against naive utcnow()
+    assert client.get("/analytics/categories/user_1", params={"from": "2024-01-01T00:00:00Z"}).status_code == 200
+
+    body = client.get("/analytics/categories/user_1", params={
+        "from": "2024-01-01T05:00:00+02:00", "to": "2024-01-01T06:00:00+02:00",
+    }).json()
+    assert body["from"].startswith("2024-01-01T03:00:00")
+    assert body["total"] == 7
+
+
+def test_reversed_range_is_400(client, make_account):
+    make_account()
+    response = client.get("/analytics/categories/user_1", params={"from": "2024-02-01", "to": "2024-01-01"})
+    assert response.status_code == 400
+
+
+def test_unknown_account_is_404(client, make_account):
+    make_account()
+    assert client.get("/analytics/categories/user_1", params={"account": "Nope"}).status_code == 404
+
+
+def test_budget_history_joins_rollups_with_the_budget(client, make_account):
+    make_account(budget=200.0)
+    for amount, date in ((50, "2024-01-10T00:00:00"), (100, "2024-02-03T00:00:00"), (70, "2024-02-20T00:00:00")):
+        body = {"type": "expense", "amount": amount, "date": date, "category": "groceries"}
+        assert client.post("/transactions/transaction/user_1/Main", json=body).status_code == 200
+
+    history = client.get("/analytics/budget/user_1", params={"from": "2024-01-01", "to": "2024-03-01"}).json()["history"]
+    assert [(row["month"], row["expense"], row["utilisation"]) for row in history] == [
+        ("2024-01", 50.0, 0.25),
+        ("2024-02", 170.0, 0.85),
+    ]
+    # `to` on the 1st of a month leaves that month out
+    history = client.get("/analytics/budget/user_1", params={"from": "2024-01-01", "to": "2024-02-01"}).json()["history"]
+    assert [row["month"] for row in history] == ["2024-01"]
+
+
+def test_series_is_scoped_to_the_account_range_and_zone(client, make_account, captured):
+    account = make_account()
+    response = client.get("/analytics/series/user_1", params={
+        "interval": "weekly", "account": "Main", "tz": "Europe/London",
+        "from": "2024-01-01T00:00:00+01:00", "to": "2024-02-01T00:00:00Z",
+    })
+    assert response.status_code == 200
+
+    [pipeline] = captured
+    assert pipeline == series_pipeline({
+        "clerkUserId": "user_1",
+        "date": {"$gte": datetime(2023, 12, 31, 23), "$lt": datetime(2024, 2, 1)},
+        "accountId": account["_id"],
+    }, "weekly", "Europe/London")
+    trunc = pipeline[1]["$group"]["_id"]["$dateTrunc"]
+    assert trunc == {"date": "$date", "unit": "week", "timezone": "Europe/London", "startOfWeek": "monday"}
+
+
+def test_series_rejects_an_unknown_time_zone(client, make_account, captured):
+    make_account()
+    response = client.get("/analytics/series/user_1", params={"tz": "Mars/Olympus"})
+    assert response.status_code == 400
+    assert captured == []
+
+
+def test_merchants_are_limited_expenses_with_a_description(client, make_account, captured):
+    make_account()
+    response = client.get("/analytics/merchants/user_1", params={"limit": 3, "from": "2024-01-01", "to": "2024-02-01"})
+    assert response.status_code == 200
+
+    [pipeline] = captured
+    assert pipeline == merchants_pipeline({
+        "clerkUserId": "user_1", "date": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 2, 1)},
+    }, 3)
+    assert pipeline[0]["$match"]["type"] == "expense"
+    assert pipeline[0]["$match"]["description"] == {"$nin": [None, ""]}
+    assert {"$limit": 3} in pipeline
@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from bson import Decimal128
+from pymongo import UpdateOne
+
+import accounts.balances
+import accounts.routes
+from accounts.balances import apply_balances, balance_updates, opening_balance_update, reconcile_balances
+
+ACCOUNT_BODY = {"clerkUserId": "user_1", "name": "Main", "type": "CURRENT", "balance": 100, "isDefault": True}
+
+
+def add_transactions(sync_db, account, *rows):
+    sync_db.transactions.insert_many([
+        {"id": f"{account['name']}-{n}", "accountId": account["_id"], "clerkUserId": account["clerkUserId"],
+         "type": type, "amount": amount, "date": datetime(2024, 5, 1), "category": "misc"}
+        for n, (type, amount) in enumerate(rows)
+    ])
+
+
+def current_balance(sync_db, account):
+    return sync_db.accounts.find_one({"_id": account["_id"]})["currentBalance"]
+
+
+def test_balance_updates_move_each_account_by_its_exact_net(make_account):
+    main, savings = make_account(name="Main"), make_account(name="Savings")
+    updates = balance_updates([
+        {"accountId": main["_id"], "type": "income", "amount": 0.1},
+        {"accountId": main["_id"], "type": "income", "amount": 0.2},
+        {"accountId": main["_id"], "type": "expense", "amount": Decimal128("1.05")},
+        {"accountId": savings["_id"], "type": "income", "amount": 5},
+        {"accountId": savings["_id"], "type": "expense", "amount": 5},
+        {"accountId": savings["_id"], "type": "transfer", "amount": 7},
+    ], sign=-1)
+
+    # Savings nets to zero and gets no write at all
+    assert updates == [UpdateOne(
+        {"_id": main["_id"], "currentBalance": {"$exists": True}},
+        {"$inc": {"currentBalance": Decimal128(Decimal("0.75"))}},
+    )]
+
+
+def test_apply_balances_writes_in_one_unordered_bulk(monkeypatch, make_account):
+    account = make_account()
+    calls = []
+
+    class Collection:
+        async def bulk_write(self, requests, **kwargs):
+            calls.append((requests, kwargs))
+
+    monkeypatch.setattr(accounts.balances, "accounts_collection", Collection())
+    txns = [{"accountId": account["_id"], "type": "expense", "amount": 3.5}]
+
+    asyncio.run(apply_balances(txns, session="session"))
+    asyncio.run(apply_balances([{**txns[0], "amount": 0}]))
+    assert calls == [(balance_updates(txns), {"ordered": False, "session": "session"})]
+
+
+def test_opening_balance_change_shifts_the_running_balance():
+    assert opening_balance_update({"balance": 120.1, "name": "Main"}, 100.0) == {
+        "$set": {"balance": 120.1, "name": "Main"},
+        "$inc": {"currentBalance": Decimal128(Decimal("20.1"))},
+    }
+    assert "$inc" not in opening_balance_update({"balance": 100.0}, 100.0)
+
+
+def test_reconciliation_repairs_drift_and_initialises_missing_balances(sync_db, make_account):
+    drifted = make_account(name="Drifted", balance=100.0, currentBalance=Decimal128("90"))
+    missing = make_account(name="Missing", balance=50.0)
+    healthy = make_account(name="Healthy", balance=10.0, currentBalance=Decimal128("12.5"))
+    add_transactions(sync_db, drifted, ("income", 0.1), ("income", 0.2), ("expense", 10.5))
+    add_transactions(sync_db, missing, ("expense", 1.25))
+    add_transactions(sync_db, healthy, ("income", 2.5))
+
+    stats = reconcile_balances(sync_db, settle_seconds=0)
+    assert (stats["accounts"], stats["drifted"], stats["repaired"]) == (3, 2, 2)
+    assert current_balance(sync_db, drifted) == Decimal128("89.8")
+    assert current_balance(sync_db, missing) == Decimal128("48.75")
+    assert current_balance(sync_db, healthy) == Decimal128("12.5")
+
+    assert reconcile_balances(sync_db, settle_seconds=0)["drifted"] == 0
+
+
+def test_reconciliation_leaves_a_balance_that_moved_while_settling(monkeypatch, sync_db, make_account):
+    account = make_account(balance=100.0, currentBalance=Decimal128("90"))
+    add_transactions(sync_db, account, ("expense", 5))
+
+    def in_flight_write(seconds):
+        # The $inc of a transaction still being written lands during the settle delay
+        sync_db.accounts.update_one({"_id": account["_id"]}, {"$set": {"currentBalance": Decimal128("96")}})
+
+    monkeypatch.setattr(accounts.balances.time, "sleep", in_flight_write)
+    stats = reconcile_balances(sync_db, settle_seconds=1)
+    assert (stats["drifted"], stats["repaired"]) == (0, 0)
+    assert current_balance(sync_db, account) == Decimal128("96")
+
+
+def test_dry_run_reports_without_repairing(sync_db, make_account):
+    account = make_account(balance=100.0, currentBalance=Decimal128("1"))
+    assert reconcile_balances(sync_db, settle_seconds=0, repair=False)["drifted"] == 1
+    assert current_balance(sync_db, account) == Decimal128("1")
+
+
+class RacingAccounts:
+    """db.accounts whose find_one is followed by another request changing the opening balance"""
+
+    def __init__(self, sync_db):
+        self.sync_db = sync_db
+        self.real = accounts.routes.db.accounts
+
+    async def find_one(self, *args, **kwargs):
+        doc = await self.real.find_one(*args, **kwargs)
+        if doc:
+            self.sync_db.accounts.update_one({"_id": doc["_id"]}, {"$set": {"balance": 250.0}})
+        return doc
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+
+def test_account_updates_racing_a_balance_change_are_409(monkeypatch, client, sync_db, make_account):
+    account = make_account(balance=100.0)
+    monkeypatch.setattr(accounts.routes, "db", SimpleNamespace(accounts=RacingAccounts(sync_db)))
+
+    for route in ("account", "defaultaccount"):
+        response = client.put(f"/accounts/{route}/{account['_id']}", json={**ACCOUNT_BODY, "name": "Renamed"})
+        assert response.status_code == 409
+        # Neither the rename nor any shift of the running balance was applied
+        stored = sync_db.accounts.find_one({"_id": account["_id"]})
+        assert (stored["name"], stored["balance"]) == ("Main", 250.0)
+        sync_db.accounts.update_one({"_id": account["_id"]}, {"$set": {"balance": 100.0}})
+
+
+def test_account_update_without_a_race_succeeds(client, sync_db, make_account):
+    account = make_account(balance=100.0)
+    response = client.put(f"/accounts/account/{account['_id']}", json={**ACCOUNT_BODY, "name": "Renamed"})
+    assert response.status_code == 200
+    assert sync_db.accounts.find_one({"_id": account["_id"]})["name"] == "Renamed"
@@ -0,0 +1,165 @@
+import pytest
+
+import database
+import transactions.rollups
+from accounts.balances import to_decimal
+
+
+def create(client, account, id, type="expense", amount=10.0, date="2024-05-10T00:00:00", **fields):
+    body = {"id": id, "type": type, "amount": amount, "date": date, "category": "groceries", **fields}
+    response = client.post(f"/transactions/transaction/{account['clerkUserId']}/{account['name']}", json=body)
+    assert response.status_code == 200
+
+
+def batch(client, *operations, clerk_user_id="user_1", atomic=False):
+    return client.post("/transactions/batch", json={
+        "clerkUserId": clerk_user_id, "atomic": atomic, "operations": list(operations),
+    })
+
+
+def op(kind, account, transaction_id, **fields):
+    return {"op": kind, "accountId": str(account["_id"]), "transactionId": transaction_id, **fields}
+
+
+def rollup(sync_db, account, month="2024-05"):
+    doc = sync_db.account_rollups.find_one({"accountId": account["_id"], "month": month}) or {}
+    return doc.get("expense", 0), doc.get("income", 0), doc.get("count", 0)
+
+
+@pytest.fixture
+def balances(monkeypatch):
+    """Net balance change per account (mongomock can't $inc the Decimal128 balance itself)"""
+    nets = {}
+
+    async def apply_balances(transactions, sign=1, session=None):
+        for txn in transactions:
+            amount = to_decimal(txn["amount"]) * (1 if txn["type"] == "income" else -1)
+            nets[txn["accountId"]] = nets.get(txn["accountId"], 0) + sign * amount
+
+    monkeypatch.setattr(transactions.rollups, "apply_balances", apply_balances)
+    return nets
+
+
+def test_update_delete_and_move_move_the_rollups_and_balances(client, sync_db, make_account, balances):
+    main, savings = make_account(name="Main"), make_account(name="Savings", isDefault=False)
+    create(client, main, "t-update", amount=10.0)
+    create(client, main, "t-delete", amount=20.0)
+    create(client, main, "t-move", amount=30.0)
+    balances.clear()
+
+    response = batch(
+        client,
+        op("update", main, "t-update", set={"amount": 15.0, "date": "2024-06-01T00:00:00"}),
+        op("delete", main, "t-delete"),
+        op("move", main, "t-move", toAccountId=str(savings["_id"]), set={"category": "transfer"}),
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["applied"], body["succeeded"], body["failed"]) == (True, 3, 0)
+
+    assert sync_db.transactions.find_one({"id": "t-update"})["amount"] == 15.0
+    assert sync_db.transactions.find_one({"id": "t-delete"}) is None
+    moved = sync_db.transactions.find_one({"id": "t-move"})
+    assert (moved["accountId"], moved["category"]) == (savings["_id"], "transfer")
+
+    assert rollup(sync_db, main) == (0, 0, 0)
+    assert rollup(sync_db, main, "2024-06") == (15.0, 0, 1)
+    assert rollup(sync_db, savings) == (30.0, 0, 1)
+    # 20 deleted and 30 moved out, 10 -> 15 spent
+    assert balances == {main["_id"]: 45, savings["_id"]: -30}
+
+
+def test_missing_and_foreign_rows_fail_alone(client, sync_db, make_account):
+    main, theirs = make_account(), make_account(clerk_user_id="user_2", name="Theirs")
+    create(client, main, "mine", amount=10.0)
+    create(client, main, "kept", amount=5.0)
+    create(client, theirs, "theirs", amount=10.0)
+
+    response = batch(
+        client,
+        op("delete", main, "nope"),
+        op("delete", theirs, "theirs"),
+        op("move", main, "kept", toAccountId=str(theirs["_id"])),
+        op("update", main, "mine", set={"amount": 12.0}),
+        op("update", main, "mine", set={"amount": 13.0}),
+    )
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [
+        "not_found", "forbidden", "forbidden", "ok", "invalid",
+    ]
+    assert sync_db.transactions.find_one({"id": "mine"})["amount"] == 12.0
+    assert sync_db.transactions.find_one({"id": "kept"})["accountId"] == main["_id"]
+    assert sync_db.transactions.find_one({"id": "theirs"}) is not None
+    assert rollup(sync_db, main) == (17.0, 0, 2)
+    assert rollup(sync_db, theirs) == (10.0, 0, 1)
+
+
+def test_null_fields_are_rejected(client, sync_db, make_account):
+    main = make_account()
+    create(client, main, "t1", amount=10.0)
+
+    response = batch(client, op("update", main, "t1", set={"amount": None, "type": None, "date": None}))
+    assert response.status_code == 422
+    stored = sync_db.transactions.find_one({"id": "t1"})
+    assert (stored["type"], stored["amount"]) == ("expense", 10.0)
+    assert rollup(sync_db, main) == (10.0, 0, 1)
+
+    # A description can still be cleared
+    response = batch(client, op("update", main, "t1", set={"description": None}))
+    assert response.json()["succeeded"] == 1
+    assert sync_db.transactions.find_one({"id": "t1"})["description"] is None
+
+
+class FakeSession:
+    """Stands in for a MongoDB transaction by restoring `transactions` when the callback raises"""
+
+    def __init__(self, sync_db):
+        self.sync_db = sync_db
+
+    def __bool__(self):
+        # mongomock rejects any truthy session; run_batch only checks `is not None`
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        snapshot = list(self.sync_db.transactions.find())
+        try:
+            return await callback(self)
+        except Exception:
+            self.sync_db.transactions.delete_many({})
+            self.sync_db.transactions.insert_many(snapshot)
+            raise
+
+
+def test_atomic_batch_rolls_back_unless_every_operation_succeeds(client, sync_db, make_account, monkeypatch):
+    main = make_account()
+    create(client, main, "t1", amount=10.0)
+
+    class Client:
+        async def start_session(self):
+            return FakeSession(sync_db)
+
+    monkeypatch.setattr(database, "client", Client())
+    response = batch(client, op("update", main, "t1", set={"amount": 99.0}), op("delete", main, "nope"), atomic=True)
+    assert response.status_code == 409
+    detail = response.json()["detail"]
+    assert detail["applied"] is False
+    assert [result["status"] for result in detail["results"]] == ["ok", "not_found"]
+    assert sync_db.transactions.find_one({"id": "t1"})["amount"] == 10.0
+    assert rollup(sync_db, main) == (10.0, 0, 1)
+
+    response = batch(client, op("update", main, "t1", set={"amount": 99.0}), atomic=True)
+    assert response.json()["applied"] is True
+    assert rollup(sync_db, main) == (99.0, 0, 1)
+
+
+def test_batch_size_is_capped(client, make_account, monkeypatch):
+    main = make_account()
+    monkeypatch.setattr("app.config.BATCH_MAX_OPERATIONS", 2)
+    response = batch(client, *(op("delete", main, f"t{n}") for n in range(3)))
+    assert response.status_code == 400
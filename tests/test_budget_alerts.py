@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+
+import app.cron
+from app.cron import check_and_send_budget_emails
+
+
+@pytest.fixture
+def over_budget(sync_db, monkeypatch):
+    """Feed the job over-budget accounts directly; mongomock can't run $lookup with `let`"""
+    rows = []
+
+    def aggregate(pipeline):
+        return iter([
+            {**account, "expenses": 150.0, "user": [{"email": f"{account['name']}@example.com", "name": "Sam"}]}
+            for account in rows
+        ])
+
+    monkeypatch.setattr(sync_db.accounts, "aggregate", aggregate)
+    monkeypatch.setattr(app.cron, "get_sync_db", lambda: sync_db)
+    return rows
+
+
+def last_alert(sync_db, account):
+    return sync_db.accounts.find_one({"_id": account["_id"]})["lastAlertSent"]
+
+
+def test_every_claimed_account_is_queued(sync_db, make_account, over_budget):
+    over_budget += [make_account(name="Main", budget=100.0), make_account(name="Travel", budget=50.0)]
+
+    stats = check_and_send_budget_emails()
+    assert (stats["emails_queued"], stats["queue_failures"]) == (2, 0)
+    assert sorted(doc["to"] for doc in sync_db.email_outbox.find()) == ["Main@example.com", "Travel@example.com"]
+
+    # Already alerted this month
+    assert check_and_send_budget_emails()["emails_queued"] == 0
+    assert sync_db.email_outbox.count_documents({}) == 2
+
+
+def test_claim_is_released_when_the_alert_cannot_be_queued(sync_db, make_account, over_budget, monkeypatch):
+    last_month = datetime(2020, 1, 31)
+    failing = make_account(name="Main", budget=100.0, lastAlertSent=last_month)
+    queued = make_account(name="Travel", budget=50.0)
+    over_budget += [failing, queued]
+    unreachable = {"Main@example.com"}
+    enqueue_emails_sync = app.cron.enqueue_emails_sync
+
+    def enqueue(db, messages):
+        if messages[0][0] in unreachable:
+            raise ConnectionError("primary stepped down")
+        return enqueue_emails_sync(db, messages)
+
+    monkeypatch.setattr(app.cron, "enqueue_emails_sync", enqueue)
+    stats = check_and_send_budget_emails()
+    assert (stats["emails_queued"], stats["queue_failures"]) == (1, 1)
+    assert last_alert(sync_db, failing) == last_month
+    assert last_alert(sync_db, queued) > last_month
+
+    # The next run alerts the released account
+    unreachable.clear()
+    assert check_and_send_budget_emails()["emails_queued"] == 1
+    assert sorted(doc["to"] for doc in sync_db.email_outbox.find()) == ["Main@example.com", "Travel@example.com"]
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app import cache
+from app.cache import MemoryCache, RedisCache
+
+
+def test_if_none_match_gets_304_until_a_write_invalidates(client, make_account):
+    make_account(name="Main")
+    url = "/accounts/useraccount/user_1"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.json() == ["Main"]
+    etag = first.headers["ETag"]
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cache.stats["get_user_accounts"]["hits"] >= 1
+
+    created = client.post("/accounts/account", json={
+        "clerkUserId": "user_1", "name": "Savings", "type": "SAVINGS", "balance": 10,
+    })
+    assert created.status_code == 200
+
+    fresh = client.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert sorted(fresh.json()) == ["Main", "Savings"]
+    assert fresh.headers["ETag"] != etag
+
+
+def test_budget_update_invalidates_the_account(client, make_account):
+    account = make_account(budget=100.0)
+    url = f"/accounts/singleaccount/{account['_id']}"
+    assert float(client.get(url).json()["budget"]) == 100
+
+    assert client.post(f"/accounts/budget/{account['_id']}", json={"budget": 250}).status_code == 200
+    assert float(client.get(url).json()["budget"]) == 250
+
+
+def test_other_users_entries_survive_an_invalidation(client, make_account):
+    make_account(clerk_user_id="user_1", name="Mine")
+    make_account(clerk_user_id="user_2", name="Theirs")
+    client.get("/accounts/useraccount/user_1")
+    client.get("/accounts/useraccount/user_2")
+    hits = cache.stats["get_user_accounts"]["hits"]
+
+    asyncio.run(cache.invalidate(cache.user_tag("user_1")))
+    client.get("/accounts/useraccount/user_1")
+    client.get("/accounts/useraccount/user_2")
+    assert cache.stats["get_user_accounts"]["hits"] == hits + 1
+
+
+def test_memory_cache_evicts_least_recently_used_and_expires():
+    async def scenario():
+        backend = MemoryCache(max_entries=2, ttl=60)
+        await backend.set("a", b"1")
+        await backend.set("b", b"2")
+        await backend.get("a")
+        await backend.set("c", b"3")
+        assert await backend.get("b") is None
+        assert await backend.get("a") == b"1"
+
+        expired = MemoryCache(max_entries=2, ttl=-1)
+        await expired.set("a", b"1")
+        assert await expired.get("a") is None
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def redis_cache(monkeypatch):
+    """The redis backend against fakeredis, an in-process stand-in for the server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(cache, "backend", RedisCache(fakeredis.FakeAsyncRedis(server=server), ttl=60))
+    return fakeredis.FakeRedis(server=server)
+
+
+def test_redis_backend_serves_304s_until_a_write_bumps_the_generation(client, make_account, redis_cache):
+    make_account(name="Main")
+    url = "/accounts/useraccount/user_1"
+
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    [key] = redis_cache.keys("cache:*")
+    assert key.decode().startswith("cache:get_user_accounts:user:user_1:0:")
+    assert redis_cache.ttl(key) <= 60
+    assert redis_cache.get(key).split(b"\n", 1) == [etag.encode(), first.content]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    created = client.post("/accounts/account", json={
+        "clerkUserId": "user_1", "name": "Savings", "type": "SAVINGS", "balance": 10,
+    })
+    assert created.status_code == 200
+    assert redis_cache.get("gen:user:user_1") == b"1"
+
+    fresh = client.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert sorted(fresh.json()) == ["Main", "Savings"]
+    assert any(key.startswith(b"cache:get_user_accounts:user:user_1:1:") for key in redis_cache.keys("cache:*"))
+
+
+def test_redis_backend_increments_every_tag_in_one_pipeline(redis_cache):
+    async def scenario():
+        backend = cache.backend
+        assert await backend.generations(["user:a", "account:b"]) == [0, 0]
+        await backend.invalidate("user:a", "account:b")
+        await backend.invalidate("user:a")
+        await backend.invalidate()
+        assert await backend.generations(["user:a", "account:b", "user:c"]) == [2, 1, 0]
+
+    asyncio.run(scenario())
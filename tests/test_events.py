@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from app import config, events
+from app.events import BudgetAlerts, ChangeStreamConsumer, Handler, offsets_collection, stream_pipeline
+
+pytestmark = pytest.mark.anyio
+
+
+def change(n, coll="transactions"):
+    return {"_id": {"_data": f"token-{n}"}, "ns": {"coll": coll}, "n": n}
+
+
+class FakeStream:
+    """What db.watch() yields: the changes in order, then a stream that is no longer alive"""
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.resume_token = None
+
+    @property
+    def alive(self):
+        return bool(self.changes)
+
+    async def try_next(self):
+        current = self.changes.pop(0)
+        self.resume_token = current["_id"]
+        return current
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeDatabase:
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.resumed_after = []
+
+    def watch(self, pipeline, resume_after=None, **kwargs):
+        self.resumed_after.append(resume_after)
+        stream = self.streams.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        return stream
+
+
+class Recorder:
+    def __init__(self):
+        self.seen, self.flushed = [], []
+
+    async def handle(self, change):
+        self.seen.append(change["n"])
+
+    async def flush(self):
+        self.flushed.append(list(self.seen))
+
+
+@pytest.fixture
+def checkpoint_every_event(monkeypatch):
+    monkeypatch.setattr(config, "EVENTS_CHECKPOINT_EVERY", 1)
+
+
+async def test_restart_resumes_after_the_last_checkpoint(monkeypatch, checkpoint_every_event):
+    recorder = Recorder()
+    handlers = [Handler("transactions", recorder.handle, flush=recorder.flush)]
+    database = FakeDatabase(FakeStream([change(1), change(2)]), FakeStream([change(3)]))
+    monkeypatch.setattr(events, "db", database)
+
+    first = ChangeStreamConsumer("test", handlers)
+    state = await first.acquire()
+    assert state.get("token") is None
+    await first.consume(state.get("token"))
+    assert recorder.seen == [1, 2]
+    # Batched work is flushed before the token that covers it is saved
+    assert recorder.flushed == [[1], [1, 2]]
+    assert (await offsets_collection.find_one({"_id": "test"}))["token"] == {"_data": "token-2"}
+
+    restarted = ChangeStreamConsumer("test", handlers)
+    state = await restarted.acquire()
+    await restarted.consume(state.get("token"))
+    assert database.resumed_after == [None, {"_data": "token-2"}]
+    assert recorder.seen == [1, 2, 3]
+
+
+async def test_lease_held_by_another_worker_is_respected_until_it_expires():
+    await offsets_collection.insert_one({
+        "_id": "test", "lockedBy": "other-host:1", "lockedUntil": datetime.utcnow() + timedelta(minutes=1),
+    })
+    consumer = ChangeStreamConsumer("test", [])
+    assert await consumer.acquire() is None
+
+    await offsets_collection.update_one({"_id": "test"}, {"$set": {"lockedUntil": datetime.utcnow() - timedelta(seconds=1)}})
+    assert (await consumer.acquire())["lockedBy"] == events.OWNER
+
+
+async def test_consumer_stops_once_its_lease_is_taken(monkeypatch, checkpoint_every_event):
+    recorder = Recorder()
+    consumer = ChangeStreamConsumer("test", [Handler("transactions", recorder.handle)])
+    await consumer.acquire()
+    await offsets_collection.update_one({"_id": "test"}, {"$set": {"lockedBy": "other-host:1"}})
+    monkeypatch.setattr(events, "db", FakeDatabase(FakeStream([change(1), change(2)])))
+
+    await consumer.consume(None)
+    assert recorder.seen == [1]
+    assert "token" not in await offsets_collection.find_one({"_id": "test"})
+
+
+async def test_lost_history_restarts_from_now(monkeypatch):
+    await offsets_collection.insert_one({"_id": "test", "token": {"_data": "expired"}})
+    database = FakeDatabase(
+        OperationFailure("history lost", code=286),
+        OperationFailure("not a replica set", code=40573),
+    )
+    monkeypatch.setattr(events, "db", database)
+
+    await ChangeStreamConsumer("test", [Handler("transactions", Recorder().handle)]).run_forever()
+    assert database.resumed_after == [{"_data": "expired"}, None]
+    assert "token" not in await offsets_collection.find_one({"_id": "test"})
+
+
+async def test_a_failing_handler_does_not_stop_the_others():
+    recorder = Recorder()
+
+    async def broken(change):
+        raise RuntimeError("boom")
+
+    consumer = ChangeStreamConsumer("test", [
+        Handler("transactions", broken),
+        Handler("transactions", recorder.handle),
+        Handler("accounts", recorder.handle),
+    ])
+    await consumer.dispatch(change(1))
+    assert recorder.seen == [1]
+
+
+def test_stream_is_narrowed_to_the_handlers_collections():
+    handlers = [Handler("transactions", None, match={"operationType": "insert"}), Handler("accounts", None)]
+    assert stream_pipeline(handlers) == [{"$match": {"$or": [
+        {"$and": [{"ns.coll": "transactions"}, {"operationType": "insert"}]},
+        {"ns.coll": "accounts"},
+    ]}}]
+
+
+async def test_budget_alerts_only_mark_accounts_with_expenses_this_month():
+    alerts = BudgetAlerts()
+    current, stale, budgeted = ObjectId(), ObjectId(), ObjectId()
+    await alerts.transaction_changed({"fullDocument": {"accountId": current, "date": datetime.utcnow()}})
+    await alerts.transaction_changed({"fullDocument": {"accountId": stale, "date": datetime(2020, 1, 1)}})
+    await alerts.account_changed({"documentKey": {"_id": budgeted}})
+    assert alerts._pending == {current, budgeted}
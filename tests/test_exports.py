@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import pyarrow.parquet as pq
+import pytest
+
+import transactions.routes
+from app import config
+from transactions.exports import EXPORT_FIELDS, parquet_available
+
+
+@pytest.fixture
+def history(sync_db, make_account, monkeypatch):
+    """Five rows over several cursor batches and row groups, two sharing a date"""
+    monkeypatch.setattr(config, "EXPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(config, "EXPORT_PARQUET_ROW_GROUP", 3)
+    account = make_account()
+    rows = [
+        ("a", datetime(2024, 1, 5), "expense", 12.5, "dining", 'Dinner, "Luigi\'s"'),
+        ("b", datetime(2024, 2, 1), "income", 1000.0, "salary", "Pay\nMarch"),
+        ("c", datetime(2024, 2, 1), "expense", 3.0, "dining", None),
+        ("d", datetime(2024, 3, 9), "expense", 40.0, "groceries", "Aldi"),
+        ("e", datetime(2023, 12, 31), "expense", 8.0, "groceries", "Old"),
+    ]
+    sync_db.transactions.insert_many([
+        {"id": id, "accountId": account["_id"], "clerkUserId": "user_1", "date": date, "type": type,
+         "amount": amount, "category": category, "description": description, "isRecurring": False,
+         "createdAt": datetime(2024, 4, 1)}
+        for id, date, type, amount, category, description in rows
+    ])
+    return account
+
+
+def export(client, **params):
+    return client.get("/transactions/export/user_1/Main", params=params)
+
+
+def test_csv_is_newest_first_and_quotes_awkward_cells(client, history):
+    response = export(client)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="Main-transactions.csv"'
+
+    header, *rows = list(csv.reader(io.StringIO(response.text)))
+    assert tuple(header) == EXPORT_FIELDS
+    assert [row[0] for row in rows] == ["d", "c", "b", "a", "e"]
+    by_id = {row[0]: dict(zip(header, row)) for row in rows}
+    assert by_id["a"]["description"] == 'Dinner, "Luigi\'s"'
+    assert by_id["b"]["description"] == "Pay\nMarch"
+    assert (by_id["c"]["description"], by_id["c"]["receiptUrl"]) == ("", "")
+    assert (by_id["d"]["date"], by_id["d"]["amount"]) == ("2024-03-09T00:00:00", "40.0")
+    assert '"Dinner, ""Luigi\'s"""' in response.text
+
+
+def test_ndjson_has_one_object_per_line_with_filters_applied(client, history):
+    response = export(client, format="ndjson", category="dining", **{"from": "2024-01-01"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = response.text.splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [row["id"] for row in rows] == ["c", "a"]
+    assert rows[1] == {
+        "id": "a", "date": "2024-01-05T00:00:00", "type": "expense", "amount": 12.5, "category": "dining",
+        "description": 'Dinner, "Luigi\'s"', "isRecurring": False, "recurringInterval": None,
+        "receiptUrl": None, "createdAt": "2024-04-01T00:00:00",
+    }
+
+
+def test_parquet_body_reads_back_in_order(client, history):
+    response = export(client, format="parquet")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+
+    parquet = pq.ParquetFile(io.BytesIO(response.content))
+    assert parquet.metadata.num_row_groups == 2
+    table = parquet.read()
+    assert table.column_names == list(EXPORT_FIELDS)
+    assert table.column("id").to_pylist() == ["d", "c", "b", "a", "e"]
+    assert table.column("date").to_pylist()[0] == datetime(2024, 3, 9)
+    assert table.column("description").to_pylist()[3] == 'Dinner, "Luigi\'s"'
+
+
+def test_parquet_without_pyarrow_is_a_client_error(client, history, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    assert parquet_available() is False
+
+    monkeypatch.setattr(transactions.routes, "parquet_available", lambda: False)
+    response = export(client, format="parquet")
+    assert response.status_code == 400
+    assert "csv or ndjson" in response.json()["detail"]
+
+
+def test_unknown_account_or_format(client, history):
+    assert client.get("/transactions/export/user_1/Nope").status_code == 404
+    assert export(client, format="xlsx").status_code == 422
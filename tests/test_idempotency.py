@@ -0,0 +1,61 @@
+BODY = {"type": "expense", "amount": 42.5, "date": "2024-05-01T12:00:00", "category": "groceries"}
+
+
+def test_retry_with_the_same_key_is_replayed_not_written_twice(client, sync_db, make_account):
+    make_account()
+    headers = {"Idempotency-Key": "checkout-1"}
+    first = client.post("/transactions/transaction/user_1/Main", json=BODY, headers=headers)
+    retry = client.post("/transactions/transaction/user_1/Main", json=BODY, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert sync_db.transactions.count_documents({}) == 1
+    assert sync_db.account_rollups.find_one()["count"] == 1
+
+
+def test_retry_racing_an_unfinished_attempt_is_decided_by_the_insert(client, sync_db, make_account):
+    make_account()
+    headers = {"Idempotency-Key": "checkout-1"}
+    first = client.post("/transactions/transaction/user_1/Main", json=BODY, headers=headers).json()
+    # As if the first attempt had written the transaction but not its response yet
+    sync_db.idempotency_keys.update_many({}, {"$set": {"response": None}})
+
+    retry = client.post("/transactions/transaction/user_1/Main", json=BODY, headers=headers)
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["id"] == first["id"]
+    assert sync_db.transactions.count_documents({}) == 1
+
+
+def test_reusing_a_key_for_a_different_body_is_422(client, sync_db, make_account):
+    make_account()
+    headers = {"Idempotency-Key": "checkout-1"}
+    client.post("/transactions/transaction/user_1/Main", json=BODY, headers=headers)
+    response = client.post(
+        "/transactions/transaction/user_1/Main", json={**BODY, "amount": 99}, headers=headers
+    )
+    assert response.status_code == 422
+    assert sync_db.transactions.count_documents({}) == 1
+
+
+def test_client_id_makes_the_create_retry_safe(client, sync_db, make_account):
+    make_account()
+    body = {**BODY, "id": "client-generated-1"}
+    first = client.post("/transactions/transaction/user_1/Main", json=body)
+    retry = client.post("/transactions/transaction/user_1/Main", json=body)
+
+    assert first.json()["id"] == "client-generated-1"
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert sync_db.transactions.count_documents({"id": "client-generated-1"}) == 1
+
+
+def test_client_id_owned_by_another_account_is_409(client, sync_db, make_account):
+    make_account(clerk_user_id="user_1")
+    make_account(clerk_user_id="user_2")
+    body = {**BODY, "id": "shared-id"}
+    assert client.post("/transactions/transaction/user_1/Main", json=body).status_code == 200
+
+    response = client.post("/transactions/transaction/user_2/Main", json=body)
+    assert response.status_code == 409
+    assert sync_db.transactions.count_documents({"id": "shared-id"}) == 1
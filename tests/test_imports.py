@@ -0,0 +1,68 @@
+import json
+
+IMPORT_URL = "/transactions/import/user_1/Main"
+
+CSV_BODY = (
+    "type,amount,date,category,description\r\n"
+    "expense,12.50,2024-05-01T10:00:00,groceries,\"Tesco, high street\"\r\n"
+    "refund,3.00,2024-05-02T10:00:00,groceries,bad type\r\n"
+    "income,2000,2024-05-03T09:00:00,salary,May pay\r\n"
+    "expense,,2024-05-04T09:00:00,dining,missing amount\r\n"
+)
+
+
+def test_csv_import_inserts_valid_rows_and_reports_rejects(client, sync_db, make_account):
+    account = make_account()
+    report = client.post(IMPORT_URL, content=CSV_BODY.encode()).json()
+
+    assert (report["received"], report["inserted"], report["failed"]) == (4, 2, 2)
+    assert [error["row"] for error in report["errors"]] == [2, 4]
+    assert any("type" in message for message in report["errors"][0]["errors"])
+    assert any("amount" in message for message in report["errors"][1]["errors"])
+
+    stored = list(sync_db.transactions.find({"accountId": account["_id"]}))
+    assert sorted(txn["category"] for txn in stored) == ["groceries", "salary"]
+    assert {txn["description"] for txn in stored} == {"Tesco, high street", "May pay"}
+
+
+def test_ndjson_import_reports_unparseable_lines(client, sync_db, make_account):
+    make_account()
+    lines = [
+        json.dumps({"type": "expense", "amount": 5, "date": "2024-05-01T00:00:00", "category": "dining"}),
+        "{not json",
+        json.dumps({"type": "expense", "amount": 7, "date": "2024-05-02T00:00:00"}),
+    ]
+    report = client.post(f"{IMPORT_URL}?format=ndjson", content="\n".join(lines).encode()).json()
+
+    assert (report["received"], report["inserted"], report["failed"]) == (3, 1, 2)
+    assert [error["row"] for error in report["errors"]] == [2, 3]
+    assert any("category" in message for message in report["errors"][1]["errors"])
+    assert sync_db.transactions.count_documents({}) == 1
+
+
+def test_retried_upload_with_the_same_key_replays_the_report(client, sync_db, make_account):
+    make_account()
+    headers = {"Idempotency-Key": "export-2024-05"}
+    first = client.post(IMPORT_URL, content=CSV_BODY.encode(), headers=headers).json()
+    retry = client.post(IMPORT_URL, content=CSV_BODY.encode(), headers=headers).json()
+
+    assert retry["replayed"] is True
+    assert {k: retry[k] for k in ("received", "inserted", "failed")} == \
+        {k: first[k] for k in ("received", "inserted", "failed")}
+    assert sync_db.transactions.count_documents({}) == 2
+
+
+def test_retry_of_an_interrupted_upload_skips_rows_already_imported(client, sync_db, make_account):
+    make_account()
+    headers = {"Idempotency-Key": "export-2024-05"}
+    client.post(IMPORT_URL, content=CSV_BODY.encode(), headers=headers)
+    # The first attempt died before storing its report
+    sync_db.transaction_imports.delete_many({})
+
+    retry = client.post(IMPORT_URL, content=CSV_BODY.encode(), headers=headers).json()
+    assert (retry["inserted"], retry["duplicates"]) == (0, 2)
+    assert sync_db.transactions.count_documents({}) == 2
+
+
+def test_unknown_account_is_404(client):
+    assert client.post(IMPORT_URL, content=CSV_BODY.encode()).status_code == 404
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime
+
+from app.indexes import INDEXES, ROUTE_QUERIES, ensure_indexes, explain_queries, index_report
+
+
+def existing(sync_db, collection) -> dict:
+    return sync_db[collection].index_information()
+
+
+def test_bootstrap_creates_every_declared_index_and_is_idempotent(sync_db):
+    # conftest already ran it once for this database; run it again on top
+    assert asyncio.run(ensure_indexes()) == []
+
+    for collection, indexes in INDEXES.items():
+        info = existing(sync_db, collection)
+        assert set(info) == {"_id_"} | {options["name"] for _, options in indexes}, collection
+        for keys, options in indexes:
+            index = info[options["name"]]
+            assert index["key"] == keys
+            assert index.get("unique", False) == options.get("unique", False)
+            assert index.get("sparse", False) == options.get("sparse", False)
+            assert index.get("partialFilterExpression") == options.get("partialFilterExpression")
+
+
+def test_an_index_that_cannot_be_built_is_reported_and_skipped(sync_db):
+    sync_db.drop_collection("users")
+    sync_db.users.insert_many([{"email": "same@example.com"}, {"email": "same@example.com"}])
+
+    [(collection, name, error)] = asyncio.run(ensure_indexes())
+    assert (collection, name) == ("users", "email_unique")
+    assert "clerkUserId" in existing(sync_db, "users")
+
+
+class FakeCollection:
+    def __init__(self, stats=(), plan=None):
+        self.stats = list(stats)
+        self.plan = plan
+
+    def aggregate(self, pipeline):
+        assert pipeline == [{"$indexStats": {}}]
+        return iter(self.stats)
+
+    def find(self, query):
+        return self
+
+    def sort(self, sort):
+        return self
+
+    def explain(self):
+        return {"queryPlanner": {"winningPlan": self.plan}}
+
+
+def test_report_lists_missing_undeclared_and_unused_indexes():
+    since = {"since": datetime(2024, 1, 1)}
+    stats = [
+        {"name": "_id_", "accesses": {"ops": 0, **since}},
+        {"name": "email_unique", "accesses": {"ops": 12, **since}},
+        {"name": "email_1_name_1", "accesses": {"ops": 0, **since}},
+    ]
+    report = index_report({collection: FakeCollection(stats if collection == "users" else []) for collection in INDEXES})
+    assert report["users"] == {
+        "missing": ["clerkUserId"],
+        "undeclared": ["email_1_name_1"],
+        "unused": ["email_1_name_1 (since 2024-01-01)"],
+    }
+    assert report["accounts"]["missing"] == sorted(options["name"] for _, options in INDEXES["accounts"])
+
+
+def test_explain_flags_collection_scans_and_in_memory_sorts():
+    classic = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+    sort = {"stage": "SORT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}
+    # Slot-based plans wrap the stage tree in queryPlan
+    collscan = {"queryPlan": {"stage": "COLLSCAN"}}
+    plans = {"accounts": classic, "transactions": sort, "users": collscan}
+    sync_db = {collection: FakeCollection(plan=plans.get(collection, classic)) for collection in INDEXES}
+
+    results = {row["route"]: row for row in explain_queries(sync_db)}
+    assert len(results) == len(ROUTE_QUERIES)
+    assert (results["find_account"]["collscan"], results["find_account"]["inMemorySort"]) == (False, False)
+    assert results["get_transactions"]["inMemorySort"] is True
+    assert results["get_transactions"]["stages"] == ["FETCH", "IXSCAN", "SORT"]
+    assert results["get_user"]["collscan"] is True
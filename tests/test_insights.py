@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from app.insights import (
+    FakeLLM,
+    RateLimiter,
+    build_prompt,
+    cache_key,
+    generate_account_insights,
+    get_llm_client,
+)
+
+NOW = datetime(2024, 5, 20)
+
+
+def default_account(make_account):
+    account = make_account(budget=500.0)
+    account["rollup"] = [{
+        "income": 2000.0,
+        "expense": 640.0,
+        "categories": {"groceries": {"expense": 440.0}, "rent": {"expense": 200.0}, "salary": {"income": 2000.0}},
+    }]
+    account["user"] = [{"email": "user@example.com", "name": "Alex"}]
+    return account
+
+
+def test_fake_llm_is_configured_and_deterministic():
+    llm = get_llm_client()
+    assert isinstance(llm, FakeLLM)
+    assert llm.complete("prompt") == FakeLLM().complete("prompt")
+    assert llm.prompts == ["prompt"]
+
+
+def test_unchanged_month_is_served_from_the_cache(sync_db, make_account):
+    account = default_account(make_account)
+    sync_db.transactions.insert_one({
+        "id": "t1", "accountId": account["_id"], "clerkUserId": account["clerkUserId"],
+        "type": "expense", "amount": 200.0, "category": "rent", "date": datetime(2024, 5, 1),
+    })
+    llm = FakeLLM()
+    limiter = RateLimiter(6000)
+
+    assert generate_account_insights(sync_db, llm, limiter, account, NOW) == "generated"
+    assert generate_account_insights(sync_db, llm, limiter, account, NOW) == "cached"
+
+    assert len(llm.prompts) == 1
+    assert "Month: May 2024" in llm.prompts[0]
+    assert "2024-05-01 | 200.0 | rent" in llm.prompts[0]
+    # Both runs still mail the user, the second one with the cached text
+    emails = list(sync_db.email_outbox.find())
+    assert len(emails) == 2
+    assert emails[0]["body"] == emails[1]["body"]
+
+
+def test_changed_aggregates_are_sent_to_the_llm_again(sync_db, make_account):
+    llm = FakeLLM()
+    limiter = RateLimiter(6000)
+    account = default_account(make_account)
+    generate_account_insights(sync_db, llm, limiter, account, NOW)
+
+    account["rollup"][0]["expense"] = 700.0
+    assert generate_account_insights(sync_db, llm, limiter, account, NOW) == "generated"
+    assert len(llm.prompts) == 2
+
+
+def test_cache_key_depends_on_aggregates_and_model():
+    aggregates = {"month": "May 2024", "account": "Main", "budget": None, "income": 1, "expense": 2,
+                  "categories": {}, "largestExpenses": []}
+    assert cache_key(aggregates, "fake") == cache_key(dict(aggregates), "fake")
+    assert cache_key(aggregates, "fake") != cache_key(aggregates, "llama")
+    assert cache_key(aggregates, "fake") != cache_key({**aggregates, "expense": 3}, "fake")
+    assert "(no budget is set)" in build_prompt(aggregates)
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import jobs
+from app.jobs import JobAlreadyRunning, dispatch, get_run, job_runs_collection
+
+pytestmark = pytest.mark.anyio
+
+
+async def wait_for_status(run_id, *statuses, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while (run := await get_run(run_id))["status"] not in statuses:
+        assert time.monotonic() < deadline, f"run stayed {run['status']}"
+        await asyncio.sleep(0.02)
+    return run
+
+
+async def test_second_trigger_is_refused_until_the_first_finishes():
+    gate = threading.Event()
+
+    def body():
+        gate.wait(10)
+        return {"processed": 3}
+
+    run = await dispatch("recurring_transactions", body)
+    assert run["status"] == "queued"
+    await wait_for_status(run["_id"], "running")
+
+    with pytest.raises(JobAlreadyRunning) as refused:
+        await dispatch("recurring_transactions", body)
+    assert refused.value.run_id == run["_id"]
+
+    gate.set()
+    finished = await wait_for_status(run["_id"], "succeeded")
+    assert finished["result"] == {"processed": 3}
+    assert finished["durationSeconds"] is not None
+
+    again = await dispatch("recurring_transactions", lambda: None)
+    await wait_for_status(again["_id"], "succeeded")
+
+
+async def test_failed_body_is_recorded_and_frees_the_job():
+    def body():
+        raise RuntimeError("boom")
+
+    run = await dispatch("budget_alerts", body)
+    failed = await wait_for_status(run["_id"], "failed")
+    assert "RuntimeError: boom" in failed["error"]
+    assert await job_runs_collection.count_documents({"job": "budget_alerts", "active": True}) == 0
+
+
+async def test_a_run_whose_owner_died_is_replaced():
+    await job_runs_collection.insert_one({
+        "_id": "dead", "job": "budget_alerts", "status": "running", "active": True,
+        "lockedUntil": datetime.utcnow() - timedelta(seconds=1),
+    })
+    run = await dispatch("budget_alerts", lambda: {"ok": True})
+    await wait_for_status(run["_id"], "succeeded")
+    assert (await get_run("dead"))["status"] == "abandoned"
+
+
+async def test_scheduler_lease_blocks_a_manual_run():
+    await jobs.database.db["scheduler_jobs"].insert_one(
+        {"_id": "budget_alerts", "lockedUntil": datetime.utcnow() + timedelta(minutes=1)}
+    )
+    with pytest.raises(JobAlreadyRunning):
+        await dispatch("budget_alerts", lambda: None)
+
+
+def test_trigger_route_answers_409_with_the_running_id(client):
+    asyncio.run(job_runs_collection.insert_one({
+        "_id": "live", "job": "transaction_insights", "status": "running", "active": True,
+        "lockedUntil": datetime.utcnow() + timedelta(minutes=5),
+    }))
+
+    response = client.post("/jobs/transaction_insights")
+    assert response.status_code == 409
+    assert response.json()["runningId"] == "live"
+    assert client.post("/jobs/no_such_job").status_code == 404
+    assert client.get("/jobs/live").json()["status"] == "running"
+    assert client.get("/jobs/missing").status_code == 404
@@ -0,0 +1,209 @@
+import asyncio
+import socket
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from app import config, mailer
+from app.mailer import MailDispatcher, SMTPConnection, outbox_collection, retry_delay
+
+pytestmark = pytest.mark.anyio
+
+
+class Inbox:
+    """aiosmtpd handler recording every DATA command and the session it arrived on"""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = []
+        self.attempts = 0
+        self.reject = False
+
+    async def handle_DATA(self, server, session, envelope):
+        self.attempts += 1
+        if not any(seen is session for seen in self.sessions):
+            self.sessions.append(session)
+        if self.reject:
+            return "550 Mailbox unavailable"
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def inbox(monkeypatch):
+    handler = Inbox()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setattr(config, "EMAIL_HOST", "127.0.0.1")
+    monkeypatch.setattr(config, "EMAIL_PORT", controller.port)
+    monkeypatch.setattr(config, "EMAIL_USE_TLS", False)
+    monkeypatch.setattr(config, "EMAIL_USERNAME", None)
+    monkeypatch.setattr(config, "EMAIL_FROM", "bot@example.com")
+    yield handler
+    controller.stop()
+
+
+async def wait_until(predicate, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not await predicate():
+        assert time.monotonic() < deadline, "timed out waiting for the dispatcher"
+        await asyncio.sleep(0.05)
+
+
+async def outbox_status_is(status: str, count: int) -> bool:
+    return await outbox_collection.count_documents({"status": status}) == count
+
+
+async def test_delivers_queued_mail_over_one_reused_connection(inbox):
+    for n in range(5):
+        await mailer.enqueue_email(f"user{n}@example.com", "Hello", f"Message {n}")
+
+    dispatcher = MailDispatcher(concurrency=1, batch_size=10, poll_seconds=1)
+    dispatcher.start()
+    try:
+        await wait_until(lambda: outbox_status_is("sent", 5))
+    finally:
+        await dispatcher.stop()
+
+    assert sorted(m.rcpt_tos[0] for m in inbox.messages) == [f"user{n}@example.com" for n in range(5)]
+    assert len(inbox.sessions) == 1
+    async for doc in outbox_collection.find():
+        assert doc["attempts"] == 1
+        assert doc["sentAt"] is not None
+
+
+async def test_failed_send_is_retried_with_backoff(inbox, monkeypatch):
+    monkeypatch.setattr(config, "EMAIL_RETRY_BASE_SECONDS", 30)
+    monkeypatch.setattr(config, "EMAIL_MAX_ATTEMPTS", 5)
+    inbox.reject = True
+    await mailer.enqueue_email("user@example.com", "Hello", "Body")
+
+    dispatcher = MailDispatcher(concurrency=1, batch_size=10)
+    [doc] = await dispatcher.claim_batch()
+    connection = SMTPConnection()
+    try:
+        assert await dispatcher.deliver(connection, doc) is False
+    finally:
+        await connection.close()
+
+    doc = await outbox_collection.find_one({"_id": doc["_id"]})
+    assert doc["status"] == "pending"
+    assert doc["attempts"] == 1
+    assert "550" in doc["lastError"]
+    assert doc["nextAttemptAt"] > datetime.utcnow() + timedelta(seconds=25)
+    # Not due again until the backoff has passed
+    assert await dispatcher.claim_batch() == []
+
+
+def test_retry_delay_doubles_up_to_an_hour(monkeypatch):
+    monkeypatch.setattr(config, "EMAIL_RETRY_BASE_SECONDS", 30)
+    assert [retry_delay(n).total_seconds() for n in (1, 2, 3)] == [30, 60, 120]
+    assert retry_delay(20) == timedelta(hours=1)
+
+
+async def test_gives_up_after_max_attempts(inbox, monkeypatch):
+    monkeypatch.setattr(config, "EMAIL_RETRY_BASE_SECONDS", 0)
+    monkeypatch.setattr(config, "EMAIL_MAX_ATTEMPTS", 3)
+    inbox.reject = True
+    await mailer.enqueue_email("user@example.com", "Hello", "Body")
+
+    dispatcher = MailDispatcher(concurrency=1, batch_size=10, poll_seconds=0.05)
+    dispatcher.start()
+    try:
+        await wait_until(lambda: outbox_status_is("failed", 1))
+    finally:
+        await dispatcher.stop()
+
+    doc = await outbox_collection.find_one()
+    assert doc["attempts"] == 3
+    assert "550" in doc["lastError"]
+    assert inbox.attempts == 3
+    assert inbox.messages == []
+
+
+async def test_reclaims_messages_whose_lease_expired(inbox):
+    now = datetime.utcnow()
+    stale = mailer.outbox_document("stale@example.com", "Hello", "Body")
+    stale.update(status="sending", claim="dead-dispatcher", lockedUntil=now - timedelta(minutes=1))
+    live = mailer.outbox_document("live@example.com", "Hello", "Body")
+    live.update(status="sending", claim="live-dispatcher", lockedUntil=now + timedelta(minutes=4))
+    await outbox_collection.insert_many([stale, live])
+
+    dispatcher = MailDispatcher(concurrency=1, batch_size=10)
+    [doc] = await dispatcher.claim_batch()
+    assert doc["_id"] == stale["_id"]
+    assert doc["claim"] != "dead-dispatcher"
+
+    connection = SMTPConnection()
+    try:
+        assert await dispatcher.deliver(connection, doc) is True
+    finally:
+        await connection.close()
+
+    assert (await outbox_collection.find_one({"_id": stale["_id"]}))["status"] == "sent"
+    untouched = await outbox_collection.find_one({"_id": live["_id"]})
+    assert (untouched["status"], untouched["claim"]) == ("sending", "live-dispatcher")
+    assert [m.rcpt_tos for m in inbox.messages] == [["stale@example.com"]]
+
+
+async def test_lapsed_lease_on_an_in_flight_message_is_not_sent_twice(inbox):
+    await mailer.enqueue_email("once@example.com", "Hello", "Body")
+    await mailer.enqueue_email("slow@example.com", "Hello", "Body")
+    first = MailDispatcher(concurrency=1, batch_size=10)
+    queued = {doc["to"]: doc for doc in await first.claim_batch()}
+
+    # Both wait in the queue past their lease; another dispatcher retakes them
+    await outbox_collection.update_many({}, {"$set": {"lockedUntil": datetime.utcnow() - timedelta(seconds=1)}})
+    second = MailDispatcher(concurrency=1, batch_size=1)
+    [retaken] = await second.claim_batch()
+    assert retaken["to"] == "once@example.com"
+
+    connection = SMTPConnection()
+    try:
+        assert await first.deliver(connection, queued["once@example.com"]) is False
+        assert await second.deliver(connection, retaken) is True
+        # Lapsed but not yet retaken: renewing the lease keeps it with the first claim
+        assert await first.deliver(connection, queued["slow@example.com"]) is True
+    finally:
+        await connection.close()
+
+    assert sorted(m.rcpt_tos[0] for m in inbox.messages) == ["once@example.com", "slow@example.com"]
+    assert await outbox_status_is("sent", 2)
+
+
+async def test_sender_survives_a_failed_outbox_update(inbox, monkeypatch):
+    update_one = outbox_collection.update_one
+    failures = []
+
+    async def flaky_update_one(*args, **kwargs):
+        # Let the lease renewal through and fail recording the outcome
+        if not failures and "status" in args[1]["$set"]:
+            failures.append(args)
+            raise ConnectionError("primary stepped down")
+        return await update_one(*args, **kwargs)
+
+    monkeypatch.setattr(outbox_collection, "update_one", flaky_update_one)
+    await mailer.enqueue_email("first@example.com", "Hello", "Body")
+
+    dispatcher = MailDispatcher(concurrency=1, batch_size=10, poll_seconds=0.05)
+    dispatcher.start()
+    try:
+        await wait_until(lambda: outbox_status_is("sending", 1))
+        await mailer.enqueue_email("second@example.com", "Hello", "Body")
+        dispatcher.wake()
+        await wait_until(lambda: outbox_status_is("sent", 1))
+    finally:
+        await dispatcher.stop()
+
+    assert len(failures) == 1
+    # The first message stays claimed until its lease runs out, then is retaken
+    assert (await outbox_collection.find_one({"to": "first@example.com"}))["status"] == "sending"
+    assert [m.rcpt_tos for m in inbox.messages] == [["first@example.com"], ["second@example.com"]]
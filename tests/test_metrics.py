@@ -0,0 +1,19 @@
+from app import metrics
+
+
+def routes_seen():
+    return {labels[1] for labels in metrics.request_seconds._series}
+
+
+def test_requests_are_labelled_with_the_full_route_template(client, make_account):
+    make_account(clerk_user_id="transaction", name="Main")
+    # A path param that equals a literal segment must not change the label
+    assert client.get("/transactions/transaction/transaction/Main").status_code == 200
+    client.get("/accounts/useraccount/transaction")
+    client.get("/no/such/route")
+
+    seen = routes_seen()
+    assert "/transactions/transaction/{clerkUserId}/{account_name}" in seen
+    assert "/accounts/useraccount/{user_id}" in seen
+    assert "unmatched" in seen
+    assert not any("transaction/{clerkUserId}/{clerkUserId}" in route for route in seen)
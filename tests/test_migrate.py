@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime
+
+from transactions.migrate import migrate_embedded_transactions
+
+
+def embedded(id, amount, date=datetime(2024, 5, 3), **fields):
+    return {"id": id, "type": "expense", "amount": amount, "date": date, "category": "groceries", **fields}
+
+
+def stored(sync_db):
+    return {txn["id"]: txn for txn in sync_db.transactions.find()}
+
+
+def rollup(sync_db, account, month="2024-05"):
+    doc = sync_db.account_rollups.find_one({"accountId": account["_id"], "month": month})
+    return doc["expense"], doc["count"]
+
+
+def test_embedded_transactions_move_to_the_collection(sync_db, make_account):
+    main = make_account(name="Main", transactions=[embedded(f"m{n}", 10.0 + n) for n in range(5)])
+    legacy = {"type": "expense", "amount": 4.0, "date": "2024-05-20T09:30:00", "category": "dining"}
+    theirs = make_account(clerk_user_id="user_2", name="Theirs", transactions=[embedded("t0", 7.0), legacy])
+    empty = make_account(name="Empty", isDefault=False)
+
+    stats = asyncio.run(migrate_embedded_transactions(batch_size=2))
+    assert stats == {"accounts": 2, "transactions": 7}
+
+    txns = stored(sync_db)
+    assert len(txns) == 7
+    assert {id: (txn["accountId"], txn["clerkUserId"]) for id, txn in txns.items() if id.startswith("m")} == {
+        f"m{n}": (main["_id"], "user_1") for n in range(5)
+    }
+    assert (txns["t0"]["accountId"], txns["t0"]["clerkUserId"], txns["t0"]["amount"]) == (theirs["_id"], "user_2", 7.0)
+    [migrated] = [txn for id, txn in txns.items() if id not in {"t0"} and not id.startswith("m")]
+    assert (migrated["accountId"], migrated["date"]) == (theirs["_id"], datetime(2024, 5, 20, 9, 30))
+
+    for account in (main, theirs, empty):
+        assert "transactions" not in sync_db.accounts.find_one({"_id": account["_id"]})
+    assert rollup(sync_db, main) == (60.0, 5)
+    assert rollup(sync_db, theirs) == (11.0, 2)
+
+    # Nothing left to move: a second run changes nothing
+    assert asyncio.run(migrate_embedded_transactions(batch_size=2)) == {"accounts": 0, "transactions": 0}
+    assert stored(sync_db) == txns
+    assert rollup(sync_db, main) == (60.0, 5)
+
+
+def test_rerun_after_a_crash_neither_duplicates_nor_double_counts(sync_db, make_account):
+    rows = [embedded("a", 1.0), embedded("b", 2.0), {"type": "expense", "amount": 3.0, "date": datetime(2024, 5, 9)}]
+    account = make_account(transactions=rows)
+    asyncio.run(migrate_embedded_transactions(batch_size=10))
+    first = stored(sync_db)
+
+    # As if the process died after copying the rows but before pulling them from the account
+    sync_db.accounts.update_one({"_id": account["_id"]}, {"$set": {"transactions": rows}})
+    assert asyncio.run(migrate_embedded_transactions(batch_size=10)) == {"accounts": 1, "transactions": 3}
+
+    assert stored(sync_db) == first
+    assert rollup(sync_db, account) == (6.0, 3)
+    assert "transactions" not in sync_db.accounts.find_one({"_id": account["_id"]})
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+import base64
+
+import pytest
+from bson import ObjectId
+
+from transactions.services import build_transaction_query, decode_cursor, encode_cursor
+
+START = datetime(2024, 5, 1)
+
+
+def add_transactions(sync_db, account, count, same_date=False):
+    sync_db.transactions.insert_many([
+        {
+            "_id": ObjectId(),
+            "id": f"txn-{n:03d}",
+            "accountId": account["_id"],
+            "clerkUserId": account["clerkUserId"],
+            "type": "expense",
+            "amount": 1.0 + n,
+            "date": START if same_date else START + timedelta(days=n),
+            "category": "groceries" if n % 2 else "dining",
+        }
+        for n in range(count)
+    ])
+
+
+def all_pages(client, url, **params):
+    pages, cursor = [], None
+    while True:
+        body = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        pages.append([txn["id"] for txn in body["transactions"]])
+        cursor = body["nextCursor"]
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trips_the_last_row_position():
+    row = {"date": datetime(2024, 5, 1, 12, 30, 15, 250000), "id": "txn-7"}
+    assert decode_cursor(encode_cursor(row)) == (row["date"], "txn-7")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(b'{"date": "yesterday", "id": "x"}').decode(),
+    base64.urlsafe_b64encode(b'{"id": "x"}').decode(),
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_malformed_cursor_is_400_not_500(client, make_account):
+    make_account()
+    response = client.get("/transactions/transaction/user_1/Main", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_keyset_condition_breaks_date_ties_on_id():
+    query = build_transaction_query("acc", after=(START, "txn-5"))
+    assert query["$or"] == [
+        {"date": {"$lt": START}},
+        {"date": START, "id": {"$lt": "txn-5"}},
+    ]
+
+
+def test_pages_cover_every_row_once_in_order(client, sync_db, make_account):
+    account = make_account()
+    add_transactions(sync_db, account, 7)
+
+    pages = all_pages(client, "/transactions/transaction/user_1/Main", limit=3)
+    assert pages == [["txn-006", "txn-005", "txn-004"], ["txn-003", "txn-002", "txn-001"], ["txn-000"]]
+
+
+def test_rows_sharing_a_date_are_split_across_pages_without_overlap(client, sync_db, make_account):
+    account = make_account()
+    add_transactions(sync_db, account, 5, same_date=True)
+
+    pages = all_pages(client, "/transactions/transaction/user_1/Main", limit=2)
+    assert pages == [["txn-004", "txn-003"], ["txn-002", "txn-001"], ["txn-000"]]
+
+
+def test_filters_apply_to_every_page(client, sync_db, make_account):
+    account = make_account()
+    add_transactions(sync_db, account, 8)
+
+    pages = all_pages(
+        client, "/transactions/transaction/user_1/Main", limit=2, category="groceries",
+        **{"from": "2024-05-02T00:00:00", "to": "2024-05-07T00:00:00"},
+    )
+    assert pages == [["txn-005", "txn-003"], ["txn-001"]]
+
+
+def test_single_account_embeds_one_page_of_transactions(client, sync_db, make_account):
+    account = make_account()
+    add_transactions(sync_db, account, 5)
+    url = f"/accounts/singleaccount/{account['_id']}"
+
+    first = client.get(url, params={"limit": 2}).json()
+    assert first["name"] == "Main"
+    assert [txn["id"] for txn in first["transactions"]] == ["txn-004", "txn-003"]
+
+    second = client.get(url, params={"limit": 2, "cursor": first["nextCursor"]}).json()
+    last = client.get(url, params={"limit": 2, "cursor": second["nextCursor"]}).json()
+    assert [txn["id"] for txn in second["transactions"]] == ["txn-002", "txn-001"]
+    assert [txn["id"] for txn in last["transactions"]] == ["txn-000"]
+    assert last["nextCursor"] is None
+
+
+def test_single_account_rejects_a_malformed_cursor(client, make_account):
+    account = make_account()
+    response = client.get(f"/accounts/singleaccount/{account['_id']}", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
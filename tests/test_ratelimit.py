@@ -0,0 +1,155 @@
+import asyncio
+import json
+
+import pytest
+from starlette.requests import Request
+
+from app import coalesce, ratelimit
+from app.coalesce import single_flight
+from app.ratelimit import MemoryLimiter, parse_limits, tenant
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.keys = []
+
+    async def take(self, key, rate, burst):
+        self.keys.append(key)
+        return 0.0
+
+
+def json_request(path_params=None, body=None) -> Request:
+    payload = json.dumps(body).encode() if body is not None else b""
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    headers = [(b"content-type", b"application/json")] if body is not None else []
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": headers,
+             "path_params": path_params or {}, "client": ("10.0.0.7", 5000)}
+    return Request(scope, receive)
+
+
+def test_parse_limits_skips_unlimited_groups():
+    assert parse_limits("reads=10:20, writes=5, bulk=0:3,") == {"reads": (10.0, 20.0), "writes": (5.0, 5.0)}
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    limiter = MemoryLimiter(max_buckets=10)
+
+    async def scenario():
+        assert [await limiter.take("reads:user:a", 2, 3) for _ in range(3)] == [0, 0, 0]
+        assert await limiter.take("reads:user:a", 2, 3) == pytest.approx(0.5)
+        # Other tenants have buckets of their own
+        assert await limiter.take("reads:user:b", 2, 3) == 0
+
+        clock.now += 0.5
+        assert await limiter.take("reads:user:a", 2, 3) == 0
+        assert await limiter.take("reads:user:a", 2, 3) > 0
+        # Idle long enough and the bucket is full again, never beyond `burst`
+        clock.now += 60
+        assert [await limiter.take("reads:user:a", 2, 3) for _ in range(4)][-1] > 0
+
+    asyncio.run(scenario())
+
+
+def test_exhausted_bucket_is_429_with_retry_after(monkeypatch, clock, client, make_account):
+    make_account(clerk_user_id="user_1")
+    monkeypatch.setattr(ratelimit, "limiter", MemoryLimiter(max_buckets=10))
+    monkeypatch.setattr(ratelimit, "LIMITS", {"reads": (0.25, 2)})
+
+    assert [client.get("/accounts/useraccount/user_1").status_code for _ in range(2)] == [200, 200]
+    limited = client.get("/accounts/useraccount/user_1")
+    assert limited.status_code == 429
+    assert limited.headers["Retry-After"] == "4"
+    assert client.get("/accounts/useraccount/user_2").status_code == 200
+
+    clock.now += 4
+    assert client.get("/accounts/useraccount/user_1").status_code == 200
+
+
+def test_tenant_prefers_path_then_body_then_client_address():
+    async def scenario():
+        assert await tenant(json_request({"clerkUserId": "path-user"}, {"clerkUserId": "body-user"})) == "user:path-user"
+        assert await tenant(json_request({"transactionId": "t1"}, {"clerkId": "body-user"})) == "user:body-user"
+        assert await tenant(json_request({"transactionId": "t1"})) == "ip:10.0.0.7"
+
+    asyncio.run(scenario())
+
+
+def test_account_routes_are_charged_to_the_accounts_owner(monkeypatch, client, make_account):
+    account = make_account(clerk_user_id="owner_1")
+    recorder = RecordingLimiter()
+    monkeypatch.setattr(ratelimit, "limiter", recorder)
+    monkeypatch.setattr(ratelimit, "LIMITS", {"writes": (1, 1)})
+
+    client.post(f"/accounts/budget/{account['_id']}", json={"budget": 10})
+    client.post("/accounts/budget/000000000000000000000000", json={"budget": 10})
+    assert recorder.keys == ["writes:user:owner_1", "writes:account:000000000000000000000000"]
+
+
+def test_single_flight_shares_one_load_between_concurrent_callers():
+    calls = []
+
+    async def load(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def scenario():
+        results = await asyncio.gather(
+            single_flight("k1", lambda: load("a")),
+            single_flight("k1", lambda: load("b")),
+            single_flight("k2", lambda: load("c")),
+        )
+        assert results == ["a", "a", "c"]
+        assert calls == ["a", "c"]
+        assert coalesce._flights == {}
+
+        # A finished flight isn't reused: the next read queries again
+        assert await single_flight("k1", lambda: load("d")) == "d"
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_survives_one_caller_being_cancelled():
+    async def load():
+        await asyncio.sleep(0.02)
+        return "rows"
+
+    async def scenario():
+        first = asyncio.ensure_future(single_flight("k", load))
+        second = asyncio.ensure_future(single_flight("k", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "rows"
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_propagates_errors_to_every_caller():
+    async def load():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("primary stepped down")
+
+    async def scenario():
+        results = await asyncio.gather(single_flight("k", load), single_flight("k", load), return_exceptions=True)
+        assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+        assert coalesce._flights == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+from transactions.recurring import MAX_CATCH_UP, process_due_schedules, schedule_from_transaction
+
+NOW = datetime(2024, 5, 20, 12, 0)
+
+
+def add_schedule(sync_db, account, interval="daily", next_date=None, amount=9.99):
+    template = {
+        "id": f"template-{interval}-{amount}",
+        "accountId": account["_id"],
+        "clerkUserId": account["clerkUserId"],
+        "type": "expense",
+        "amount": amount,
+        "category": "subscriptions",
+        "description": "Streaming",
+        "date": next_date - timedelta(days=1),
+        "isRecurring": True,
+        "recurringInterval": interval,
+        "nextRecurringDate": next_date,
+    }
+    sync_db.transactions.insert_one(template)
+    schedule = schedule_from_transaction(template)
+    sync_db.recurring_schedules.insert_one(schedule)
+    return schedule
+
+
+def occurrences(sync_db):
+    return list(sync_db.transactions.find({"recurringScheduleId": {"$exists": True}}).sort("date", 1))
+
+
+def test_missed_occurrences_are_caught_up_once(sync_db, make_account):
+    account = make_account()
+    add_schedule(sync_db, account, next_date=NOW - timedelta(days=4, hours=2))
+
+    stats = process_due_schedules(sync_db, now=NOW)
+    assert stats == {"schedules": 1, "transactions": 5}
+    dates = [txn["date"] for txn in occurrences(sync_db)]
+    assert dates == [NOW - timedelta(days=n, hours=2) for n in (4, 3, 2, 1, 0)]
+
+    schedule = sync_db.recurring_schedules.find_one()
+    assert schedule["occurrence"] == 5
+    assert schedule["nextRunAt"] == NOW + timedelta(days=1) - timedelta(hours=2)
+    assert sync_db.transactions.find_one({"id": schedule["transactionId"]})["nextRecurringDate"] == schedule["nextRunAt"]
+
+    # Nothing is due any more, so a second run is a no-op
+    assert process_due_schedules(sync_db, now=NOW) == {"schedules": 0, "transactions": 0}
+    assert len(occurrences(sync_db)) == 5
+    assert sync_db.account_rollups.find_one({"month": "2024-05"})["count"] == 5
+
+
+def test_monthly_schedule_keeps_month_end_anchor(sync_db, make_account):
+    account = make_account()
+    add_schedule(sync_db, account, interval="monthly", next_date=datetime(2024, 1, 31))
+
+    process_due_schedules(sync_db, now=NOW)
+    assert [txn["date"].day for txn in occurrences(sync_db)] == [31, 29, 31, 30]
+
+
+def test_catch_up_is_capped_per_run(sync_db, make_account):
+    account = make_account()
+    add_schedule(sync_db, account, next_date=NOW - timedelta(days=MAX_CATCH_UP + 10))
+
+    assert process_due_schedules(sync_db, now=NOW)["transactions"] == MAX_CATCH_UP
+    # The schedule is still due; the next run appends the rest
+    assert sync_db.recurring_schedules.find_one()["nextRunAt"] <= NOW
+    assert process_due_schedules(sync_db, now=NOW)["transactions"] == 11
+    assert len(occurrences(sync_db)) == MAX_CATCH_UP + 11
+
+
+def test_zero_amount_schedule_does_not_stop_the_job(sync_db, make_account):
+    account = make_account()
+    add_schedule(sync_db, account, next_date=NOW - timedelta(hours=1), amount=0)
+    add_schedule(sync_db, account, next_date=NOW - timedelta(minutes=30))
+
+    assert process_due_schedules(sync_db, now=NOW) == {"schedules": 2, "transactions": 2}
+
+
+def test_editing_the_template_reaches_future_occurrences(client, sync_db, make_account):
+    account = make_account()
+    schedule = add_schedule(sync_db, account, interval="monthly", next_date=NOW - timedelta(hours=1))
+    edit = {"type": "expense", "amount": 12.5, "description": "Streaming (family plan)",
+            "date": "2024-04-20T11:00:00", "category": "subscriptions", "isRecurring": True}
+    response = client.put(f"/transactions/edittransaction/{account['_id']}/{schedule['transactionId']}", json=edit)
+    assert response.status_code == 200
+
+    process_due_schedules(sync_db, now=NOW)
+    [occurrence] = occurrences(sync_db)
+    assert (occurrence["description"], occurrence["amount"]) == ("Streaming (family plan)", 12.5)
+
+
+def test_switching_recurrence_on_creates_the_schedule(client, sync_db, make_account):
+    account = make_account()
+    created = {"id": "rent", "type": "expense", "amount": 800, "date": "2024-05-01T00:00:00", "category": "housing"}
+    assert client.post("/transactions/transaction/user_1/Main", json=created).status_code == 200
+    assert sync_db.recurring_schedules.count_documents({}) == 0
+
+    edit = {**created, "isRecurring": True, "recurringInterval": "monthly", "description": "Rent"}
+    response = client.put(f"/transactions/edittransaction/{account['_id']}/rent", json=edit)
+    assert response.status_code == 200
+
+    schedule = sync_db.recurring_schedules.find_one({"transactionId": "rent"})
+    assert (schedule["interval"], schedule["template"]["description"]) == ("monthly", "Rent")
+    assert schedule["nextRunAt"] > datetime.utcnow() + timedelta(days=27)
+    assert sync_db.transactions.find_one({"id": "rent"})["nextRecurringDate"] == schedule["nextRunAt"]
+
+    process_due_schedules(sync_db, now=schedule["nextRunAt"])
+    [occurrence] = occurrences(sync_db)
+    assert (occurrence["description"], occurrence["amount"]) == ("Rent", 800)
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from transactions.rollups import find_rollup_drift, reconcile_rollups, repair_rollup
+
+BODY = {"type": "expense", "amount": 20.1, "date": "2024-03-05T00:00:00", "category": "food.out"}
+
+
+def rollup(sync_db, month):
+    return sync_db.account_rollups.find_one({"month": month}, {"_id": 0, "accountId": 0})
+
+
+def test_reconciliation_restores_rollups_lost_to_a_crash(client, sync_db, make_account):
+    account = make_account()
+    for amount in (20.1, 0.2):
+        assert client.post("/transactions/transaction/user_1/Main", json={**BODY, "amount": amount}).status_code == 200
+    healthy = rollup(sync_db, "2024-03")
+
+    # Written, then the process died before its $inc: no rollup for April at all
+    sync_db.transactions.insert_one({
+        "id": "crashed", "accountId": account["_id"], "clerkUserId": "user_1",
+        "type": "income", "amount": 99.0, "date": datetime(2024, 4, 2), "category": None,
+    })
+    # And a month whose only transaction is gone but whose $inc -1 never landed
+    sync_db.account_rollups.insert_one({
+        "accountId": account["_id"], "month": "2024-01", "clerkUserId": "user_1",
+        "income": 0, "expense": 5.0, "count": 1, "categories": {"misc": {"expense": 5.0}},
+    })
+
+    stats = reconcile_rollups(sync_db, settle_seconds=0)
+    assert (stats["drifted"], stats["repaired"]) == (2, 2)
+    assert rollup(sync_db, "2024-03") == healthy
+    assert rollup(sync_db, "2024-04") == {
+        "month": "2024-04", "clerkUserId": "user_1", "income": 99.0, "expense": 0.0, "count": 1,
+        "categories": {"uncategorized": {"income": 99.0}},
+    }
+    assert rollup(sync_db, "2024-01")["count"] == 0
+
+    assert reconcile_rollups(sync_db, settle_seconds=0)["drifted"] == 0
+
+
+def test_dry_run_only_reports(sync_db, make_account):
+    account = make_account()
+    sync_db.transactions.insert_one({
+        "id": "crashed", "accountId": account["_id"], "clerkUserId": "user_1",
+        "type": "expense", "amount": 1.0, "date": datetime(2024, 4, 2), "category": "food",
+    })
+    assert reconcile_rollups(sync_db, settle_seconds=0, repair=False)["drifted"] == 1
+    assert sync_db.account_rollups.count_documents({}) == 0
+
+
+def test_repair_never_overwrites_a_concurrent_write(client, sync_db, make_account):
+    account = make_account()
+    client.post("/transactions/transaction/user_1/Main", json=BODY)
+    sync_db.account_rollups.update_one({"month": "2024-03"}, {"$inc": {"count": 1}})
+    [((account_id, month), (stored, expected))] = find_rollup_drift(sync_db, [account["_id"]]).items()
+
+    # A transaction write lands between the check and the repair
+    sync_db.account_rollups.update_one({"month": "2024-03"}, {"$inc": {"count": 1, "expense": 3.0}})
+    assert repair_rollup(sync_db, account_id, month, stored, expected) is False
+    assert rollup(sync_db, "2024-03")["count"] == 3
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import jobs
+from app.scheduler import JobScheduler, jobs_collection
+
+pytestmark = pytest.mark.anyio
+
+HOUR = timedelta(hours=1)
+
+
+def scheduler(func=lambda: {"done": True}):
+    return JobScheduler(jobs={"nightly": (func, HOUR)}, poll_seconds=1, lease_seconds=60)
+
+
+async def make_due(when=None):
+    await jobs_collection.update_one({"_id": "nightly"}, {"$set": {"nextRunAt": when or datetime.utcnow() - timedelta(minutes=1)}})
+
+
+async def test_register_does_not_reset_an_existing_schedule():
+    await scheduler().register()
+    due = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=5)
+    await make_due(due)
+    await scheduler().register()
+    assert (await jobs_collection.find_one({"_id": "nightly"}))["nextRunAt"] == due
+
+
+async def test_only_one_worker_holds_the_lease_until_it_expires():
+    a, b = scheduler(), scheduler()
+    await a.register()
+    assert await a.acquire("nightly") is None  # not due yet
+
+    await make_due()
+    state = await a.acquire("nightly")
+    assert state["lockedBy"] == a.owner
+    assert await b.acquire("nightly") is None
+
+    # Worker A dies without renewing; once its lease lapses B takes the job over
+    await jobs_collection.update_one({"_id": "nightly"}, {"$set": {"lockedUntil": datetime.utcnow() - timedelta(seconds=1)}})
+    taken = await b.acquire("nightly")
+    assert taken["lockedBy"] == b.owner
+
+    # A finishing late can't release or reschedule what B now holds
+    await a.run_job("nightly", state)
+    doc = await jobs_collection.find_one({"_id": "nightly"})
+    assert (doc["lockedBy"], doc.get("lastStatus")) == (b.owner, None)
+    assert doc["lockedUntil"] > datetime.utcnow()
+
+
+async def test_finished_run_keeps_its_cadence_and_releases_the_lease():
+    worker = scheduler()
+    await worker.register()
+    due = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=10)
+    await make_due(due)
+    await worker.run_job("nightly", await worker.acquire("nightly"))
+
+    doc = await jobs_collection.find_one({"_id": "nightly"})
+    assert doc["nextRunAt"] == due + HOUR
+    assert (doc["lockedUntil"], doc["lastStatus"], doc["lastError"]) == (None, "ok", None)
+
+
+async def test_after_downtime_the_next_run_is_never_in_the_past():
+    def fail():
+        raise RuntimeError("boom")
+
+    worker = scheduler(fail)
+    await worker.register()
+    await make_due(datetime.utcnow() - timedelta(days=3))
+    await worker.run_job("nightly", await worker.acquire("nightly"))
+
+    doc = await jobs_collection.find_one({"_id": "nightly"})
+    assert doc["nextRunAt"] > datetime.utcnow() + timedelta(minutes=59)
+    assert doc["lastStatus"] == "error"
+    assert "RuntimeError: boom" in doc["lastError"]
+
+
+async def test_a_live_manual_run_holds_off_the_scheduled_one():
+    worker = scheduler()
+    await worker.register()
+    await make_due()
+    await jobs.job_runs_collection.insert_one({
+        "_id": "manual", "job": "nightly", "status": "running", "active": True,
+        "lockedUntil": datetime.utcnow() + timedelta(minutes=5),
+    })
+
+    await worker.run_pending()
+    assert worker._running == {}
+    assert (await jobs_collection.find_one({"_id": "nightly"})).get("lockedBy") is None
@@ -0,0 +1,84 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from bson import Decimal128, ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app import serialization
+from app.serialization import ACCOUNT_DETAIL_FIELDS, FastJSONResponse, encode_account
+from schemas import AccountDetailResponse
+
+NOW = datetime(2024, 5, 1, 12, 30, 15, 123000)
+
+
+def account_document() -> dict:
+    """An account as stored: float and Decimal128 money, ObjectId, naive datetimes, nulls"""
+    return {
+        "_id": ObjectId("65f000000000000000000001"),
+        "clerkUserId": "user_1",
+        "name": "Main \"everyday\" ✓",
+        "type": "CURRENT",
+        "balance": 1520.1,
+        "budget": 0.3,
+        "currentBalance": Decimal128("1234.50"),
+        "isDefault": True,
+        "createdAt": NOW,
+        "updatedAt": NOW,
+        "transactionCount": 2,
+        "lastActivity": NOW,
+        "transactions": [
+            {
+                "id": "t1", "type": "expense", "amount": 12.99, "description": "Coffee, beans",
+                "date": NOW, "category": "dining", "receiptUrl": "https://receipts.example.com/r/1",
+                "isRecurring": True, "recurringInterval": "monthly", "nextRecurringDate": NOW,
+                "lastProcessed": NOW, "createdAt": NOW, "updatedAt": NOW,
+            },
+            {
+                "id": "t2", "type": "income", "amount": 1000.0, "description": None,
+                "date": NOW, "category": "salary", "receiptUrl": None,
+                "isRecurring": False, "recurringInterval": None, "nextRecurringDate": None,
+                "lastProcessed": None, "createdAt": NOW, "updatedAt": NOW,
+            },
+        ],
+    }
+
+
+def model_response(doc: dict) -> bytes:
+    """What the route returned before: the validated model through FastAPI's JSONResponse"""
+    doc = {**doc, "id": str(doc.pop("_id")), "currentBalance": doc["currentBalance"].to_decimal()}
+    return JSONResponse(jsonable_encoder(AccountDetailResponse(**doc))).body
+
+
+def test_fast_path_matches_the_model_response():
+    fast = FastJSONResponse(encode_account(account_document(), ACCOUNT_DETAIL_FIELDS)).body
+    old = model_response(account_document())
+    assert json.loads(fast) == json.loads(old)
+    body = json.loads(fast)
+    assert (body["id"], body["balance"], body["currentBalance"]) == ("65f000000000000000000001", "1520.1", "1234.50")
+    assert body["transactions"][0]["date"] == "2024-05-01T12:30:15.123000"
+
+
+def test_orjson_and_stdlib_encode_bson_types_identically(monkeypatch):
+    content = {
+        "id": ObjectId("65f000000000000000000001"),
+        "exact": Decimal("0.10"),
+        "stored": Decimal128("-1234.5600"),
+        "naive": NOW,
+        "aware": NOW.replace(tzinfo=timezone.utc),
+        "nested": [{"when": datetime(2024, 1, 1), "amount": Decimal("3")}, None, 1.5, "é"],
+    }
+    assert serialization.orjson is not None
+    fast = FastJSONResponse(content).body
+    monkeypatch.setattr(serialization, "orjson", None)
+    stdlib = FastJSONResponse(content).body
+
+    assert json.loads(fast) == json.loads(stdlib) == {
+        "id": "65f000000000000000000001",
+        "exact": "0.10",
+        "stored": "-1234.5600",
+        "naive": "2024-05-01T12:30:15.123000",
+        "aware": "2024-05-01T12:30:15.123000+00:00",
+        "nested": [{"when": "2024-01-01T00:00:00", "amount": "3"}, None, 1.5, "é"],
+    }
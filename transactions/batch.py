@@ -0,0 +1,158 @@
+"""Batch edits, deletes and moves of transactions.
+
+A batch reads only the rows it touches (one indexed $in query for the rollup
+fields), then writes every change with one bulk_write on `transactions`, one on
+`account_rollups` and one on `recurring_schedules`. Each operation gets its own
+result. With `atomic=True` the whole batch runs inside a MongoDB transaction
+and is rolled back unless every operation succeeds.
+"""
+from decimal import Decimal
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import database
+from database import accounts_collection, transactions_collection
+from transactions.recurring import TEMPLATE_FIELDS, schedules_collection
+from transactions.rollups import ROLLUP_FIELDS, apply_rollups
+
+BATCH_FIELDS = {**ROLLUP_FIELDS, "isRecurring": 1}
+
+
+class BatchAborted(Exception):
+    """Raised inside an atomic batch so the transaction rolls back"""
+
+    def __init__(self, results):
+        super().__init__("batch aborted")
+        self.results = results
+
+
+def _object_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _changes(operation) -> dict:
+    changes = operation.set.model_dump(exclude_unset=True) if operation.set else {}
+    if isinstance(changes.get("amount"), Decimal):
+        changes["amount"] = float(changes["amount"])
+    return changes
+
+
+async def run_batch(clerk_user_id: str, operations, session=None):
+    """Apply operations; returns (per-operation results, ids of the accounts touched)"""
+    results = [
+        {"index": i, "op": op.op, "transactionId": op.transactionId, "status": "ok"}
+        for i, op in enumerate(operations)
+    ]
+
+    def fail(i, status, error=None):
+        results[i]["status"] = status
+        if error:
+            results[i]["error"] = error
+
+    # Ownership: every referenced account must belong to the caller
+    referenced = {op.accountId for op in operations} | {op.toAccountId for op in operations if op.toAccountId}
+    object_ids = {value: _object_id(value) for value in referenced}
+    owned = {
+        doc["_id"] for doc in await accounts_collection.find(
+            {"_id": {"$in": [oid for oid in object_ids.values() if oid]}, "clerkUserId": clerk_user_id},
+            {"_id": 1},
+            session=session,
+        ).to_list(None)
+    }
+
+    seen = set()
+    for i, op in enumerate(operations):
+        if op.transactionId in seen:
+            fail(i, "invalid", "transaction appears more than once in the batch")
+        elif object_ids[op.accountId] not in owned:
+            fail(i, "forbidden", "account not found")
+        elif op.op == "move" and (not op.toAccountId or object_ids[op.toAccountId] not in owned):
+            fail(i, "forbidden", "target account not found")
+        elif op.op == "move" and op.toAccountId == op.accountId:
+            fail(i, "invalid", "transaction is already in that account")
+        elif op.op == "update" and not _changes(op):
+            fail(i, "invalid", "nothing to update")
+        seen.add(op.transactionId)
+
+    pending = [i for i, result in enumerate(results) if result["status"] == "ok"]
+    current = {}
+    if pending:
+        for txn in await transactions_collection.find(
+            {"id": {"$in": [operations[i].transactionId for i in pending]},
+             "accountId": {"$in": list(owned)}},
+            BATCH_FIELDS,
+            session=session,
+        ).to_list(None):
+            current[(txn["accountId"], txn["id"])] = txn
+
+    writes, planned = [], []
+    for i in pending:
+        op = operations[i]
+        account_id = object_ids[op.accountId]
+        before = current.get((account_id, op.transactionId))
+        if before is None:
+            fail(i, "not_found")
+            continue
+        key = {"accountId": account_id, "id": op.transactionId}
+        if op.op == "delete":
+            writes.append(DeleteOne(key))
+            planned.append((i, before, None))
+            continue
+        changes = _changes(op)
+        if op.op == "move":
+            changes["accountId"] = object_ids[op.toAccountId]
+        writes.append(UpdateOne(key, {"$set": changes}))
+        planned.append((i, before, {**before, **changes}))
+
+    if writes:
+        try:
+            await transactions_collection.bulk_write(writes, ordered=False, session=session)
+        except BulkWriteError as e:
+            for err in e.details["writeErrors"]:
+                fail(planned[err["index"]][0], "error", err["errmsg"])
+
+    if session is not None and any(result["status"] != "ok" for result in results):
+        raise BatchAborted(results)
+
+    applied = [(i, before, after) for i, before, after in planned if results[i]["status"] == "ok"]
+    await apply_rollups([before for _, before, _ in applied], sign=-1, session=session)
+    await apply_rollups([after for _, _, after in applied if after], session=session)
+    await apply_schedule_changes(applied, session)
+
+    touched = {object_ids[op.accountId] for op in operations if object_ids[op.accountId] in owned}
+    touched |= {object_ids[op.toAccountId] for op in operations if op.toAccountId and object_ids[op.toAccountId] in owned}
+    return results, touched
+
+
+async def apply_schedule_changes(applied, session=None):
+    """Mirror deletes, template edits and moves onto the recurring schedules"""
+    writes = []
+    for _, before, after in applied:
+        if not before.get("isRecurring"):
+            continue
+        key = {"transactionId": before["id"]}
+        if after is None or after.get("isRecurring") is False:
+            writes.append(DeleteOne(key))
+            continue
+        changes = {f"template.{field}": after[field] for field in TEMPLATE_FIELDS
+                   if field in after and after[field] != before.get(field)}
+        if after["accountId"] != before["accountId"]:
+            changes["accountId"] = after["accountId"]
+        if changes:
+            writes.append(UpdateOne(key, {"$set": changes}))
+    if writes:
+        await schedules_collection.bulk_write(writes, ordered=False, session=session)
+
+
+async def run_atomic_batch(clerk_user_id: str, operations):
+    async with await database.client.start_session() as session:
+        # with_transaction retries the whole batch on transient transaction errors
+        return await session.with_transaction(
+            lambda session: run_batch(clerk_user_id, operations, session=session)
+        )
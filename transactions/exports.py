@@ -0,0 +1,137 @@
+"""Streaming export of an account's transactions.
+
+Rows come straight off a MongoDB cursor (served by the accountId + date index)
+and are encoded EXPORT_BATCH_SIZE at a time, so a worker holds one batch in
+memory however long the history is. CSV and NDJSON are encoded on the loop;
+Parquet row groups are built in a worker thread so they don't stall other
+requests. Parquet needs the optional `pyarrow` package.
+"""
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+
+from app import config
+from database import transactions_collection
+from transactions.services import TRANSACTION_SORT
+
+EXPORT_FIELDS = (
+    "id", "date", "type", "amount", "category", "description",
+    "isRecurring", "recurringInterval", "receiptUrl", "createdAt",
+)
+
+EXPORT_PROJECTION = {"_id": 0, **{field: 1 for field in EXPORT_FIELDS}}
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def iter_batches(query: dict):
+    cursor = transactions_collection.find(query, EXPORT_PROJECTION) \
+        .sort(TRANSACTION_SORT).batch_size(config.EXPORT_BATCH_SIZE)
+    batch = []
+    async for txn in cursor:
+        batch.append(txn)
+        if len(batch) >= config.EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+async def stream_csv(query: dict):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue().encode()
+    async for batch in iter_batches(query):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_cell(txn.get(field)) for field in EXPORT_FIELDS] for txn in batch)
+        yield buffer.getvalue().encode()
+
+
+async def stream_ndjson(query: dict):
+    async for batch in iter_batches(query):
+        yield "".join(
+            json.dumps({field: txn.get(field) for field in EXPORT_FIELDS}, default=_cell) + "\n"
+            for txn in batch
+        ).encode()
+
+
+class ParquetEncoder:
+    """Writes row groups into a reusable buffer and hands back the bytes written so far"""
+
+    def __init__(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ("id", pa.string()),
+            ("date", pa.timestamp("ms")),
+            ("type", pa.string()),
+            ("amount", pa.float64()),
+            ("category", pa.string()),
+            ("description", pa.string()),
+            ("isRecurring", pa.bool_()),
+            ("recurringInterval", pa.string()),
+            ("receiptUrl", pa.string()),
+            ("createdAt", pa.timestamp("ms")),
+        ])
+        self.buffer = io.BytesIO()
+        self.writer = pq.ParquetWriter(self.buffer, self.schema, compression=config.EXPORT_PARQUET_COMPRESSION)
+
+    def _take(self) -> bytes:
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def write(self, rows) -> bytes:
+        columns = {field: [txn.get(field) for txn in rows] for field in EXPORT_FIELDS}
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+        return self._take()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self._take()
+
+
+async def stream_parquet(query: dict):
+    encoder = await asyncio.to_thread(ParquetEncoder)
+    rows = []
+    async for batch in iter_batches(query):
+        rows.extend(batch)
+        # Row groups larger than a cursor batch compress far better
+        if len(rows) >= config.EXPORT_PARQUET_ROW_GROUP:
+            yield await asyncio.to_thread(encoder.write, rows)
+            rows = []
+    if rows:
+        yield await asyncio.to_thread(encoder.write, rows)
+    yield await asyncio.to_thread(encoder.close)
+
+
+STREAMS = {"csv": stream_csv, "ndjson": stream_ndjson, "parquet": stream_parquet}
+
+
+def export_stream(query: dict, fmt: str):
+    return STREAMS[fmt](query)
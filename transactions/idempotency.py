@@ -0,0 +1,67 @@
+"""Retry-safe transaction creation.
+
+A client retrying createtransaction sends the same `Idempotency-Key` header, or
+the same client-chosen transaction `id`. The stored transaction id comes from
+that key, so the unique `id` index turns the insert itself into the atomic
+check: however many retries race, only one row is written.
+
+The key store (`idempotency_keys`, expiring after IDEMPOTENCY_TTL_HOURS)
+remembers each request's fingerprint and response. A completed retry gets the
+original response back without touching `transactions`, and reusing a key for
+a different request is rejected.
+"""
+import hashlib
+import json
+import uuid
+from datetime import datetime
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app import config
+from database import db
+
+idempotency_collection = db["idempotency_keys"]
+
+IDEMPOTENCY_INDEXES = [
+    ([("createdAt", ASCENDING)], {"name": "createdAt_ttl",
+                                  "expireAfterSeconds": config.IDEMPOTENCY_TTL_HOURS * 3600}),
+]
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body"""
+
+
+def request_fingerprint(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def key_transaction_id(clerk_user_id: str, idempotency_key: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{clerk_user_id}:{idempotency_key}"))
+
+
+async def begin(scope: str, fingerprint: str, transaction_id: str):
+    """Record the key; returns the response of an earlier completed request with it, if any"""
+    try:
+        await idempotency_collection.insert_one({
+            "_id": scope,
+            "fingerprint": fingerprint,
+            "transactionId": transaction_id,
+            "response": None,
+            "createdAt": datetime.utcnow(),
+        })
+        return None
+    except DuplicateKeyError:
+        existing = await idempotency_collection.find_one({"_id": scope})
+
+    if existing is None:  # expired in between
+        return None
+    if existing["fingerprint"] != fingerprint:
+        raise IdempotencyConflict(scope)
+    # None while the first attempt is still running (or died); the insert then decides
+    return existing["response"]
+
+
+async def complete(scope: str, response: dict):
+    await idempotency_collection.update_one({"_id": scope}, {"$set": {"response": response}})
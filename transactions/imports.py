@@ -0,0 +1,182 @@
+"""Streaming bulk import of transactions from CSV or NDJSON uploads.
+
+The request body is consumed chunk by chunk; complete records are validated
+against TransactionCreate and written with one insert_many per
+IMPORT_CHUNK_SIZE rows, so memory stays flat however large the upload is.
+
+With an idempotency key every row gets an id derived from (account, key, row
+number) and the finished report is stored in `transaction_imports`: a retried
+upload returns the stored report, and a retry of an interrupted upload skips
+the rows that already made it in (duplicate ids) instead of inserting them twice.
+"""
+import codecs
+import csv
+import json
+import uuid
+from datetime import datetime
+
+from pydantic import ValidationError
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from app import config
+from database import db
+from schemas import TransactionCreate
+from transactions.recurring import is_schedulable, schedule_from_transaction, schedules_collection
+from transactions.rollups import apply_rollups
+from transactions.services import link_transaction, new_transaction
+
+imports_collection = db["transaction_imports"]
+
+IMPORT_INDEXES = [
+    ([("createdAt", ASCENDING)], {"name": "createdAt_ttl",
+                                  "expireAfterSeconds": config.IMPORT_IDEMPOTENCY_TTL_DAYS * 86400}),
+]
+
+CSV_FIELDS = set(TransactionCreate.model_fields)
+
+
+async def ensure_import_indexes():
+    for keys, options in IMPORT_INDEXES:
+        await imports_collection.create_index(keys, **options)
+
+
+async def iter_records(chunks, fmt: str):
+    """Yield raw records from an async byte stream: dicts for NDJSON, lists for CSV"""
+    # Incremental so a multi-byte character split across chunks decodes correctly
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    record = ""
+
+    async def lines():
+        pending = ""
+        async for chunk in chunks:
+            pending += decoder.decode(chunk)
+            *complete, pending = pending.split("\n")
+            for line in complete:
+                yield line.rstrip("\r")
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending.rstrip("\r")
+
+    async for line in lines():
+        if fmt == "ndjson":
+            if line.strip():
+                yield line
+            continue
+        # A quoted CSV field may contain newlines: keep joining until the quotes balance
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2 == 0:
+            if record.strip():
+                yield next(csv.reader([record]))
+            record = ""
+    if record:
+        yield next(csv.reader([record]))
+
+
+def parse_record(raw, fmt: str, header):
+    if fmt == "ndjson":
+        return json.loads(raw)
+    row = {}
+    for name, value in zip(header, raw):
+        if name in CSV_FIELDS and value != "":
+            row[name] = value
+    return row
+
+
+class ImportReport:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row: int, message):
+        self.failed += 1
+        if len(self.errors) < config.IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "errors": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errorsTruncated": self.failed > len(self.errors),
+        }
+
+
+async def write_chunk(docs, rows, report: ImportReport):
+    """Insert one chunk; `rows` holds the upload row number of each doc for error reporting"""
+    if not docs:
+        return
+    try:
+        await db.transactions.insert_many(docs, ordered=False)
+        inserted = docs
+    except BulkWriteError as e:
+        failed = set()
+        for err in e.details["writeErrors"]:
+            failed.add(err["index"])
+            if err["code"] == 11000:
+                report.duplicates += 1  # already imported by an earlier attempt with this key
+            else:
+                report.error(rows[err["index"]], [err["errmsg"]])
+        inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+
+    report.inserted += len(inserted)
+    await apply_rollups(inserted)
+    schedules = [schedule_from_transaction(doc) for doc in inserted if is_schedulable(doc)]
+    if schedules:
+        try:
+            await schedules_collection.insert_many(schedules, ordered=False)
+        except BulkWriteError:
+            pass  # schedule already exists for that transaction
+
+
+async def import_transactions(account: dict, chunks, fmt: str, idempotency_key: str = None) -> dict:
+    if idempotency_key:
+        import_id = f"{account['_id']}:{idempotency_key}"
+        previous = await imports_collection.find_one({"_id": import_id, "status": "completed"})
+        if previous:
+            return {**previous["report"], "importId": idempotency_key, "replayed": True}
+
+    report = ImportReport()
+    header = None
+    docs, rows = [], []
+    row = 0
+    async for raw in iter_records(chunks, fmt):
+        if fmt == "csv" and header is None:
+            header = [name.strip() for name in raw]
+            continue
+        row += 1
+        report.received += 1
+        try:
+            data = TransactionCreate.model_validate(parse_record(raw, fmt, header))
+        except ValidationError as e:
+            report.error(row, [f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors()])
+            continue
+        except ValueError as e:
+            report.error(row, [str(e)])
+            continue
+
+        transaction_id = (
+            str(uuid.uuid5(uuid.NAMESPACE_OID, f"{account['_id']}:{idempotency_key}:{row}"))
+            if idempotency_key else None
+        )
+        docs.append(link_transaction(new_transaction(data, transaction_id), account))
+        rows.append(row)
+        if len(docs) >= config.IMPORT_CHUNK_SIZE:
+            await write_chunk(docs, rows, report)
+            docs, rows = [], []
+    await write_chunk(docs, rows, report)
+
+    result = report.as_dict()
+    if idempotency_key:
+        await imports_collection.replace_one(
+            {"_id": import_id},
+            {"status": "completed", "report": result, "createdAt": datetime.utcnow()},
+            upsert=True,
+        )
+    return {**result, "importId": idempotency_key}
+
@@ -0,0 +1,100 @@
+"""Move embedded `accounts.transactions` arrays into the transactions collection.
+
+Run with:  python -m transactions.migrate [--batch-size 500]
+
+The migration is online and resumable: each account is drained in slices of
+`batch_size`, every slice is upserted into the collection by transaction id and
+only then pulled from the account, so re-running after a crash never loses or
+duplicates a transaction and concurrent API traffic keeps working.
+"""
+import argparse
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime
+
+import bson
+from pymongo import UpdateOne
+
+from database import accounts_collection, transactions_collection
+from transactions.rollups import apply_rollups, ensure_rollup_indexes
+from transactions.services import ensure_transaction_indexes, link_transaction
+
+
+def _stable_id(account_id, txn: dict) -> str:
+    # Legacy rows without an id get one derived from their content so a retried
+    # batch maps to the same document instead of inserting a duplicate.
+    digest = hashlib.sha1(str(account_id).encode() + bson.encode(txn)).digest()
+    return str(uuid.UUID(bytes=digest[:16]))
+
+
+def _normalise(txn: dict, account: dict) -> dict:
+    doc = link_transaction(txn, account)
+    if not doc.get("id"):
+        doc["id"] = _stable_id(account["_id"], txn)
+    if isinstance(doc.get("date"), str):
+        try:
+            doc["date"] = datetime.fromisoformat(doc["date"])
+        except ValueError:
+            pass
+    return doc
+
+
+async def migrate_account(account_id, batch_size: int) -> int:
+    moved = 0
+    while True:
+        account = await accounts_collection.find_one(
+            {"_id": account_id},
+            {"clerkUserId": 1, "transactions": {"$slice": batch_size}},
+        )
+        batch = (account or {}).get("transactions") or []
+        if not batch:
+            break
+
+        docs = [_normalise(txn, account) for txn in batch]
+        result = await transactions_collection.bulk_write(
+            [UpdateOne({"id": doc["id"]}, {"$setOnInsert": doc}, upsert=True) for doc in docs],
+            ordered=False,
+        )
+        # Only rows inserted by this batch count towards the rollups, so a retry can't double count
+        await apply_rollups([docs[i] for i in result.upserted_ids])
+        # Pull exactly the elements that were copied; anything appended meanwhile stays
+        await accounts_collection.update_one(
+            {"_id": account_id},
+            {"$pull": {"transactions": {"$in": batch}}},
+        )
+        moved += len(batch)
+
+    await accounts_collection.update_one(
+        {"_id": account_id, "transactions": {"$size": 0}},
+        {"$unset": {"transactions": ""}},
+    )
+    return moved
+
+
+async def migrate_embedded_transactions(batch_size: int = 500):
+    await ensure_transaction_indexes()
+    await ensure_rollup_indexes()
+
+    accounts = 0
+    moved = 0
+    cursor = accounts_collection.find({"transactions.0": {"$exists": True}}, {"_id": 1})
+    async for account in cursor:
+        count = await migrate_account(account["_id"], batch_size)
+        accounts += 1
+        moved += count
+        print(f"✅ Migrated {count} transactions for account {account['_id']}")
+
+    print(f"🏁 Done: {moved} transactions moved from {accounts} accounts")
+    return {"accounts": accounts, "transactions": moved}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(migrate_embedded_transactions(args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
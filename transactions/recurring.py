@@ -0,0 +1,218 @@
+"""Recurring transaction schedules.
+
+Every recurring transaction created through the API gets one document in
+`recurring_schedules`, indexed on `nextRunAt`. The daily job only reads the
+schedules that are due, appends one transaction per missed occurrence and
+moves the schedule forward. Occurrence ids are derived from the schedule and
+the occurrence number, so re-running after a crash never duplicates. The rerun
+doesn't re-apply the rollup and balance $inc of an occurrence that was written
+just before the crash; the rollup and balance reconciliation jobs repair those.
+
+Schedules for recurring transactions that predate this collection are created with:
+
+    python -m transactions.recurring
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+from pymongo import ASCENDING, UpdateOne
+
+from accounts.balances import balance_updates
+from database import db
+from transactions.rollups import rollup_updates
+
+schedules_collection = db["recurring_schedules"]
+
+SCHEDULE_INDEXES = [
+    ([("nextRunAt", ASCENDING)], {"name": "nextRunAt"}),
+    ([("transactionId", ASCENDING)], {"name": "transactionId_unique", "unique": True}),
+]
+
+INTERVALS = {
+    "daily": lambda n: timedelta(days=n),
+    "weekly": lambda n: timedelta(weeks=n),
+    "monthly": lambda n: relativedelta(months=n),
+    "yearly": lambda n: relativedelta(years=n),
+}
+
+# Fields copied from the template transaction onto every occurrence
+TEMPLATE_FIELDS = ("type", "amount", "description", "category", "receiptUrl")
+
+# Upper bound of occurrences appended per schedule per run; the rest follow next run
+MAX_CATCH_UP = 366
+
+
+async def ensure_schedule_indexes():
+    for keys, options in SCHEDULE_INDEXES:
+        await schedules_collection.create_index(keys, **options)
+
+
+def occurrence_date(anchor: datetime, interval: str, n: int) -> datetime:
+    # Always step from the anchor so month-end dates don't drift (Jan 31 -> Feb 28 -> Mar 31)
+    return anchor + INTERVALS[interval](n)
+
+
+def schedule_from_transaction(txn: dict) -> dict:
+    return {
+        "transactionId": txn["id"],
+        "accountId": txn["accountId"],
+        "clerkUserId": txn["clerkUserId"],
+        "interval": txn["recurringInterval"],
+        "template": {field: txn.get(field) for field in TEMPLATE_FIELDS},
+        "anchorDate": txn["nextRecurringDate"],
+        "occurrence": 0,
+        "nextRunAt": txn["nextRecurringDate"],
+        "lastRunAt": None,
+    }
+
+
+def is_schedulable(txn: dict) -> bool:
+    return bool(
+        txn.get("isRecurring")
+        and txn.get("recurringInterval") in INTERVALS
+        and txn.get("nextRecurringDate")
+    )
+
+
+async def upsert_schedule(txn: dict):
+    if is_schedulable(txn):
+        await schedules_collection.update_one(
+            {"transactionId": txn["id"]},
+            {"$setOnInsert": schedule_from_transaction(txn)},
+            upsert=True,
+        )
+
+
+async def update_schedule_template(transaction_id: str, fields: dict, is_recurring: bool):
+    if not is_recurring:
+        await schedules_collection.delete_one({"transactionId": transaction_id})
+        return
+    template = {f"template.{field}": value for field, value in fields.items() if field in TEMPLATE_FIELDS}
+    result = await schedules_collection.update_one({"transactionId": transaction_id}, {"$set": template})
+    if not result.matched_count:
+        # Recurrence was just switched on
+        await start_schedule(transaction_id)
+
+
+async def start_schedule(transaction_id: str, now: datetime = None):
+    """Schedule an existing transaction, first occurrence one interval from now"""
+    now = now or datetime.utcnow()
+    txn = await db.transactions.find_one(
+        {"id": transaction_id, "recurringInterval": {"$in": list(INTERVALS)}}, {"_id": 0}
+    )
+    if txn is None:
+        return  # no interval to recur at
+    if not txn.get("nextRecurringDate") or txn["nextRecurringDate"] <= now:
+        # Occurrences from before recurrence was switched on aren't caught up
+        txn["nextRecurringDate"] = occurrence_date(now, txn["recurringInterval"], 1)
+        await db.transactions.update_one(
+            {"id": transaction_id}, {"$set": {"nextRecurringDate": txn["nextRecurringDate"]}}
+        )
+    await upsert_schedule(txn)
+
+
+async def delete_schedules(transaction_ids):
+    await schedules_collection.delete_many({"transactionId": {"$in": list(transaction_ids)}})
+
+
+def occurrence_transaction(schedule: dict, n: int, date: datetime, now: datetime) -> dict:
+    return {
+        **schedule["template"],
+        "id": str(uuid.uuid5(uuid.NAMESPACE_OID, f"{schedule['transactionId']}:{n}")),
+        "accountId": schedule["accountId"],
+        "clerkUserId": schedule["clerkUserId"],
+        "date": date,
+        "isRecurring": True,
+        "recurringInterval": schedule["interval"],
+        "recurringScheduleId": schedule["_id"],
+        "nextRecurringDate": None,
+        "lastProcessed": now,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+
+
+def process_schedule(sync_db, schedule: dict, now: datetime) -> int:
+    """Append every occurrence of `schedule` due by `now`; returns how many were new"""
+    interval = schedule["interval"]
+    n = schedule["occurrence"]
+    run_at = schedule["nextRunAt"]
+    created = 0
+
+    while run_at <= now and n - schedule["occurrence"] < MAX_CATCH_UP:
+        txn = occurrence_transaction(schedule, n, run_at, now)
+        result = sync_db.transactions.update_one(
+            {"id": txn["id"]}, {"$setOnInsert": txn}, upsert=True
+        )
+        if result.upserted_id is not None:
+            # A zero amount moves nothing, and bulk_write refuses an empty list
+            rollups = rollup_updates([txn])
+            if rollups:
+                sync_db.account_rollups.bulk_write(rollups)
+            balances = balance_updates([txn])
+            if balances:
+                sync_db.accounts.bulk_write(balances)
+            created += 1
+        n += 1
+        run_at = occurrence_date(schedule["anchorDate"], interval, n)
+
+    # Guarded on the occurrence we started from so an overlapping run can't move it twice
+    sync_db.recurring_schedules.update_one(
+        {"_id": schedule["_id"], "occurrence": schedule["occurrence"]},
+        {"$set": {"occurrence": n, "nextRunAt": run_at, "lastRunAt": now}},
+    )
+    sync_db.transactions.update_one(
+        {"id": schedule["transactionId"]},
+        {"$set": {"nextRecurringDate": run_at, "lastProcessed": now}},
+    )
+    return created
+
+
+def process_due_schedules(sync_db, now: datetime = None, batch_size: int = 500):
+    now = now or datetime.utcnow()
+    stats = {"schedules": 0, "transactions": 0}
+    # Stream due schedules; advanced ones move past `now` and drop out of the range
+    due = sync_db.recurring_schedules.find({"nextRunAt": {"$lte": now}}) \
+        .sort("nextRunAt", ASCENDING).batch_size(batch_size)
+    for schedule in due:
+        if schedule.get("interval") not in INTERVALS:
+            print(f"⚠️ Unknown interval ({schedule.get('interval')}), skipping...")
+            continue
+        stats["schedules"] += 1
+        stats["transactions"] += process_schedule(sync_db, schedule, now)
+    return stats
+
+
+async def backfill_schedules(batch_size: int = 500):
+    """Create schedules for recurring transactions that are still pending"""
+    await ensure_schedule_indexes()
+    start_of_today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    cursor = db.transactions.find({
+        "isRecurring": True,
+        "recurringScheduleId": {"$exists": False},
+        "nextRecurringDate": {"$gte": start_of_today},
+    }).batch_size(batch_size)
+
+    batch = []
+    created = 0
+    async for txn in cursor:
+        if is_schedulable(txn):
+            batch.append(UpdateOne(
+                {"transactionId": txn["id"]},
+                {"$setOnInsert": schedule_from_transaction(txn)},
+                upsert=True,
+            ))
+        if len(batch) >= batch_size:
+            created += (await schedules_collection.bulk_write(batch, ordered=False)).upserted_count
+            batch = []
+    if batch:
+        created += (await schedules_collection.bulk_write(batch, ordered=False)).upserted_count
+
+    print(f"✅ {created} recurring schedules created")
+    return created
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_schedules())
@@ -0,0 +1,310 @@
+"""Per-account monthly rollups of income, expense, transaction count and per-category totals.
+
+One document per (accountId, month) in `account_rollups`, kept current by
+$inc deltas from every transaction write. Those $inc writes follow the
+transaction write rather than sharing its atomicity, so a process dying in
+between leaves the month short, and a retried or re-run write finds the
+transaction already there and never applies it. The daily
+`rollup_reconciliation` job recomputes the months of every account from the
+transactions collection and repairs any that drifted; run it by hand, or
+rebuild everything from scratch, with:
+
+    python -m transactions.rollups --reconcile [--batch-size 200] [--dry-run]
+    python -m transactions.rollups [--account-id <id>]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from accounts.balances import apply_balances, to_decimal
+from app import config
+from database import db, get_sync_db
+
+rollups_collection = db["account_rollups"]
+
+# Transaction fields needed to compute a rollup delta
+ROLLUP_FIELDS = {"_id": 0, "id": 1, "accountId": 1, "clerkUserId": 1,
+                 "type": 1, "amount": 1, "date": 1, "category": 1}
+
+ROLLUP_INDEXES = [
+    ([("accountId", ASCENDING), ("month", ASCENDING)], {"name": "accountId_month", "unique": True}),
+    ([("clerkUserId", ASCENDING), ("month", ASCENDING)], {"name": "clerkUserId_month"}),
+]
+
+
+async def ensure_rollup_indexes():
+    for keys, options in ROLLUP_INDEXES:
+        await rollups_collection.create_index(keys, **options)
+
+
+def month_key(date: datetime) -> str:
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    return date.strftime("%Y-%m")
+
+
+def category_key(category) -> str:
+    # Category names become field names inside `categories`
+    return str(category or "uncategorized").replace(".", "_").replace("$", "_")
+
+
+def rollup_updates(transactions, sign: int = 1):
+    """Build upserting $inc operations that add (sign=1) or remove (sign=-1) transactions"""
+    deltas = {}
+    for txn in transactions:
+        if not isinstance(txn.get("date"), datetime) or txn.get("type") not in ("income", "expense"):
+            continue
+        amount = sign * float(txn.get("amount") or 0)
+        key = (txn["accountId"], month_key(txn["date"]))
+        inc = deltas.setdefault(key, ({}, txn.get("clerkUserId")))[0]
+        for field in (txn["type"], f"categories.{category_key(txn.get('category'))}.{txn['type']}"):
+            inc[field] = inc.get(field, 0) + amount
+        inc["count"] = inc.get("count", 0) + sign
+
+    return [
+        UpdateOne(
+            {"accountId": account_id, "month": month},
+            {"$inc": inc, "$set": {"clerkUserId": clerk_user_id}},
+            upsert=True,
+        )
+        for (account_id, month), (inc, clerk_user_id) in deltas.items()
+    ]
+
+
+async def apply_rollups(transactions, sign: int = 1, session=None):
+    """Move the monthly rollups and the owning accounts' running balances by the transactions.
+
+    Not atomic with the transaction write itself; the reconciliation jobs
+    (reconcile_rollups, accounts.balances.reconcile_balances) repair the gap.
+    """
+    updates = rollup_updates(transactions, sign)
+    if updates:
+        await rollups_collection.bulk_write(updates, ordered=False, session=session)
+    await apply_balances(transactions, sign, session=session)
+
+
+async def get_month_rollup(account_id, month: str):
+    return await rollups_collection.find_one(
+        {"accountId": account_id, "month": month}, {"_id": 0}
+    )
+
+
+def rebuild_pipeline(match: dict, rebuild_id: str):
+    sanitized_category = {"$replaceAll": {
+        "input": {"$replaceAll": {
+            "input": {"$ifNull": ["$category", "uncategorized"]},
+            "find": ".", "replacement": "_",
+        }},
+        "find": "$", "replacement": "_",
+    }}
+    income = {"$cond": [{"$eq": ["$type", "income"]}, "$amount", 0]}
+    expense = {"$cond": [{"$eq": ["$type", "expense"]}, "$amount", 0]}
+    return [
+        {"$match": {**match, "date": {"$type": "date"}}},
+        {"$group": {
+            "_id": {
+                "accountId": "$accountId",
+                "month": {"$dateToString": {"format": "%Y-%m", "date": "$date"}},
+                "category": sanitized_category,
+            },
+            "clerkUserId": {"$first": "$clerkUserId"},
+            "income": {"$sum": income},
+            "expense": {"$sum": expense},
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {"accountId": "$_id.accountId", "month": "$_id.month"},
+            "clerkUserId": {"$first": "$clerkUserId"},
+            "income": {"$sum": "$income"},
+            "expense": {"$sum": "$expense"},
+            "count": {"$sum": "$count"},
+            "categories": {"$push": {
+                "k": "$_id.category",
+                "v": {"income": "$income", "expense": "$expense"},
+            }},
+        }},
+        {"$project": {
+            "_id": 0,
+            "accountId": "$_id.accountId",
+            "month": "$_id.month",
+            "clerkUserId": 1,
+            "income": 1,
+            "expense": 1,
+            "count": 1,
+            "categories": {"$arrayToObject": "$categories"},
+            "rebuildId": {"$literal": rebuild_id},
+        }},
+        {"$merge": {
+            "into": rollups_collection.name,
+            "on": ["accountId", "month"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+async def rebuild_rollups(account_id=None):
+    """Recompute rollups from the transactions collection, entirely server-side"""
+    await ensure_rollup_indexes()
+
+    match = {"accountId": account_id} if account_id else {}
+    rebuild_id = uuid.uuid4().hex
+    await db.transactions.aggregate(rebuild_pipeline(match, rebuild_id)).to_list(None)
+
+    # Months that no longer have any transactions were not rewritten above
+    stale = await rollups_collection.delete_many({**match, "rebuildId": {"$ne": rebuild_id}})
+    print(f"✅ Rollups rebuilt, {stale.deleted_count} stale months removed")
+
+
+def expected_rollups_pipeline(account_ids):
+    # Grouped by raw category; names are sanitised with category_key, as on writes
+    income = {"$cond": [{"$eq": ["$type", "income"]}, "$amount", 0]}
+    expense = {"$cond": [{"$eq": ["$type", "expense"]}, "$amount", 0]}
+    return [
+        {"$match": {
+            "accountId": {"$in": account_ids},
+            "date": {"$type": "date"},
+            "type": {"$in": ["income", "expense"]},
+        }},
+        {"$group": {
+            "_id": {
+                "accountId": "$accountId",
+                "month": {"$dateToString": {"format": "%Y-%m", "date": "$date"}},
+                "category": "$category",
+            },
+            "clerkUserId": {"$first": "$clerkUserId"},
+            "income": {"$sum": income},
+            "expense": {"$sum": expense},
+            "count": {"$sum": 1},
+        }},
+    ]
+
+
+def expected_rollups(sync_db, account_ids) -> dict:
+    """(accountId, month) -> the rollup the transactions add up to"""
+    expected = {}
+    for row in sync_db.transactions.aggregate(expected_rollups_pipeline(account_ids)):
+        key = (row["_id"]["accountId"], row["_id"]["month"])
+        rollup = expected.setdefault(key, {
+            "clerkUserId": row["clerkUserId"], "income": 0.0, "expense": 0.0, "count": 0, "categories": {},
+        })
+        income, expense = float(to_decimal(row["income"])), float(to_decimal(row["expense"]))
+        rollup["income"] += income
+        rollup["expense"] += expense
+        rollup["count"] += row["count"]
+        category = rollup["categories"].setdefault(category_key(row["_id"].get("category")), {})
+        for field, amount in (("income", income), ("expense", expense)):
+            if amount:
+                category[field] = category.get(field, 0.0) + amount
+    return expected
+
+
+def _totals(rollup) -> dict:
+    """Every amount of a rollup by field path, zeros dropped"""
+    rollup = rollup or {}
+    totals = {field: rollup.get(field) or 0 for field in ("income", "expense", "count")}
+    for name, category in (rollup.get("categories") or {}).items():
+        for field in ("income", "expense"):
+            if category.get(field):
+                totals[f"{name}.{field}"] = category[field]
+    return totals
+
+
+def _same_totals(stored, expected) -> bool:
+    # $inc and $sum add the same floats in a different order; only cents matter
+    stored, expected = _totals(stored), _totals(expected)
+    return all(abs(stored.get(key, 0) - expected.get(key, 0)) < 0.005 for key in stored.keys() | expected.keys())
+
+
+def find_rollup_drift(sync_db, account_ids) -> dict:
+    """(accountId, month) -> (stored rollup or None, expected rollup) for every mismatch"""
+    expected = expected_rollups(sync_db, account_ids)
+    stored = {
+        (doc["accountId"], doc["month"]): doc
+        for doc in sync_db.account_rollups.find({"accountId": {"$in": account_ids}})
+    }
+    empty = {"income": 0.0, "expense": 0.0, "count": 0, "categories": {}}
+    drift = {}
+    for key in stored.keys() | expected.keys():
+        want = expected.get(key) or {**empty, "clerkUserId": stored[key].get("clerkUserId")}
+        if not _same_totals(stored.get(key), want):
+            drift[key] = (stored.get(key), want)
+    return drift
+
+
+def repair_rollup(sync_db, account_id, month: str, stored, expected) -> bool:
+    """Overwrite one month with `expected`, unless a write moved it since it was read"""
+    update = {"$set": {field: expected[field] for field in ("clerkUserId", "income", "expense", "count", "categories")}}
+    if stored is None:
+        try:
+            result = sync_db.account_rollups.update_one(
+                {"accountId": account_id, "month": month, "count": {"$exists": False}}, update, upsert=True)
+        except DuplicateKeyError:
+            return False  # a transaction write created the month meanwhile; next run looks again
+        return bool(result.upserted_id or result.modified_count)
+    result = sync_db.account_rollups.update_one(
+        {"_id": stored["_id"], **{field: stored.get(field) for field in ("income", "expense", "count")}}, update)
+    return bool(result.modified_count)
+
+
+def reconcile_rollups(sync_db, batch_size: int = None, settle_seconds: float = None, repair: bool = True):
+    """Verify every account's monthly rollups against its transactions and repair drift.
+
+    Works like accounts.balances.reconcile_balances: a mismatch is re-checked
+    after `settle_seconds` so in-flight writes can land, and only repaired if
+    the stored month hasn't changed, by a compare-and-set on its totals.
+    """
+    started = time.monotonic()
+    batch_size = batch_size or config.ROLLUP_RECONCILE_BATCH_SIZE
+    settle_seconds = config.ROLLUP_RECONCILE_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    stats = {"accounts": 0, "drifted": 0, "repaired": 0}
+
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        account_ids = [acc["_id"] for acc in sync_db.accounts.find(query, {"_id": 1}).sort("_id", ASCENDING).limit(batch_size)]
+        if not account_ids:
+            break
+        last_id = account_ids[-1]
+        stats["accounts"] += len(account_ids)
+
+        drift = find_rollup_drift(sync_db, account_ids)
+        if drift and settle_seconds:
+            time.sleep(settle_seconds)
+            again = find_rollup_drift(sync_db, list({account_id for account_id, _ in drift}))
+            drift = {key: values for key, values in again.items() if key in drift and values[0] == drift[key][0]}
+        stats["drifted"] += len(drift)
+
+        for (account_id, month), (stored, expected) in drift.items():
+            print(f"⚠️ Rollup drift on account {account_id} {month}: "
+                  f"stored {_totals(stored)}, expected {_totals(expected)}")
+            if repair and repair_rollup(sync_db, account_id, month, stored, expected):
+                stats["repaired"] += 1
+
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    print(f"✅ Rollup reconciliation finished: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or reconcile per-account monthly rollups")
+    parser.add_argument("--account-id", help="only rebuild this account")
+    parser.add_argument("--reconcile", action="store_true", help="repair only the months that drifted")
+    parser.add_argument("--batch-size", type=int, default=None, help="accounts per batch with --reconcile")
+    parser.add_argument("--dry-run", action="store_true", help="with --reconcile, report drift without repairing it")
+    args = parser.parse_args()
+
+    if args.reconcile:
+        reconcile_rollups(get_sync_db(), batch_size=args.batch_size, repair=not args.dry_run)
+    else:
+        asyncio.run(rebuild_rollups(ObjectId(args.account_id) if args.account_id else None))
+
+
+if __name__ == "__main__":
+    main()
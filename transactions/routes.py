@@ -1,18 +1,37 @@
-from ast import List
-from fastapi import APIRouter, HTTPException,Body
-from schemas import TransactionCreate
+from fastapi import APIRouter, HTTPException,Body, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from schemas import BatchMutationRequest, TransactionCreateRequest
 from database import db
-from datetime import datetime, timedelta
+from datetime import datetime
 from bson import ObjectId
-from dateutil.relativedelta import relativedelta
-from typing import List, Optional
+from typing import List, Optional, Literal
 
 
 
-from decimal import Decimal
-import uuid
+import csv
 from pydantic import BaseModel
-from typing import Dict, Any
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app import config
+from transactions.services import (
+    TRANSACTION_PROJECTION,
+    build_transaction_query,
+    decode_cursor,
+    find_account,
+    get_transactions_page,
+    link_transaction,
+    new_transaction,
+)
+from transactions.batch import BatchAborted, run_atomic_batch, run_batch
+from transactions.exports import MEDIA_TYPES, export_stream, parquet_available
+from transactions.idempotency import IdempotencyConflict, begin, complete, key_transaction_id, request_fingerprint
+from transactions.imports import import_transactions
+from transactions.rollups import ROLLUP_FIELDS, apply_rollups
+from transactions.recurring import delete_schedules, update_schedule_template, upsert_schedule
+from app.cache import account_tag, invalidate, user_tag, versioned_key
+from app.coalesce import single_flight
+from app.ratelimit import limited
+from app.serialization import FastJSONResponse
 
 class DeleteTransactionsRequest(BaseModel):
     transactionIds: List[str]
@@ -28,158 +47,272 @@ class Transaction(BaseModel):
     date: datetime
     category: str
     isRecurring: bool
+    # Needed when switching on recurrence for a transaction created without one
+    recurringInterval: Optional[Literal["daily", "weekly", "monthly", "yearly"]] = None
     
 
 router = APIRouter()
 
-@router.post("/transaction/{clerkUserId}/{account_name}")
-async def createtransaction(data: TransactionCreate, clerkUserId: str, account_name: str):
-    data_dict = data.model_dump()
-    random_id = str(uuid.uuid4()) 
-    data_dict["id"] = random_id
-
-    # Convert Decimal to float to make MongoDB happy
-    if isinstance(data_dict.get("amount"), Decimal):
-        data_dict["amount"] = float(data_dict["amount"])
-
-    data_dict["createdAt"] = datetime.utcnow()
-    data_dict["updatedAt"] = datetime.utcnow()
-    data_dict["lastProcessed"] = datetime.utcnow()
-
-    if data.recurringInterval is None:
-        data_dict["nextRecurringDate"] = None
-    else:
-        now = datetime.utcnow()
-        if data.recurringInterval == "daily":
-            data_dict["nextRecurringDate"] = now + timedelta(days=1)
-        elif data.recurringInterval == "weekly":
-            data_dict["nextRecurringDate"] = now + timedelta(weeks=1)
-        elif data.recurringInterval == "monthly":
-            data_dict["nextRecurringDate"] = now + relativedelta(months=1)
-        elif data.recurringInterval == "yearly":
-            data_dict["nextRecurringDate"] = now + relativedelta(years=1)
-
-    # Now push to transactions array of matching account
-    result = await db.accounts.update_one(
-        {"clerkUserId": clerkUserId, "name": account_name},
-        {"$push": {"transactions": data_dict}}
-    )
-
-    if result.modified_count == 0:
+@router.post("/transaction/{clerkUserId}/{account_name}", dependencies=limited("writes"))
+async def createtransaction(
+    data: TransactionCreateRequest,
+    clerkUserId: str,
+    account_name: str,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+):
+    account = await find_account(clerkUserId, account_name)
+    if not account:
         raise HTTPException(status_code=404, detail="Account not found or update failed")
 
-    return {"message": "Transaction created successfully"}
+    # Retries with the same Idempotency-Key or client id map to the same transaction id
+    scope = transaction_id = None
+    if idempotency_key or data.id:
+        scope = f"{clerkUserId}:key:{idempotency_key}" if idempotency_key else f"{clerkUserId}:id:{data.id}"
+        transaction_id = data.id or key_transaction_id(clerkUserId, idempotency_key)
+        fingerprint = request_fingerprint({"account": account_name, **data.model_dump(mode="json")})
+        try:
+            stored = await begin(scope, fingerprint, transaction_id)
+        except IdempotencyConflict:
+            raise HTTPException(status_code=422, detail="Idempotency key was already used for a different request")
+        if stored:
+            response.headers["Idempotent-Replayed"] = "true"
+            return stored
+
+    transaction = link_transaction(new_transaction(data, transaction_id), account)
+    result = {"message": "Transaction created successfully", "id": transaction["id"]}
+    try:
+        await db.transactions.insert_one(transaction)
+    except DuplicateKeyError:
+        if scope is None:
+            raise
+        # An earlier attempt already wrote it (the unique id index makes this the atomic check)
+        existing = await db.transactions.find_one({"id": transaction_id}, {"accountId": 1})
+        if existing and existing["accountId"] != account["_id"]:
+            raise HTTPException(status_code=409, detail="Transaction id is already in use")
+        response.headers["Idempotent-Replayed"] = "true"
+        return result
+
+    await apply_rollups([transaction])
+    await upsert_schedule(transaction)
+    await invalidate(account_tag(account["_id"]), user_tag(account["clerkUserId"]))
+
+    if scope:
+        await complete(scope, result)
+    return result
+
+@router.get("/transaction/{clerkUserId}/{account_name}", dependencies=limited("reads"))
+async def get_transactions(
+    clerkUserId: str,
+    account_name: str,
+    limit: int = Query(config.TRANSACTIONS_PAGE_SIZE, ge=1, le=config.TRANSACTIONS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    type: Optional[Literal["income", "expense"]] = None,
+    category: Optional[List[str]] = Query(None),
+):
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    async def load():
+        account = await find_account(clerkUserId, account_name)
+        if not account:
+            return None
+        query = build_transaction_query(
+            account["_id"], from_date, to_date, type, category, after
+        )
+        return await get_transactions_page(query, limit)
+
+    # Concurrent identical polls share one account lookup and one page query
+    vary = repr((account_name, limit, cursor, from_date, to_date, type, category))
+    page = await single_flight(await versioned_key("get_transactions", [user_tag(clerkUserId)], vary), load)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    transactions, next_cursor = page
 
-@router.get("/transaction/{clerkUserId}/{account_name}")
-async def get_transactions(clerkUserId: str, account_name: str):
-    account = await db.accounts.find_one(
-        {"clerkUserId": clerkUserId, "name": account_name},
-        {"transactions": 1}
+    return FastJSONResponse({"transactions": transactions, "nextCursor": next_cursor})
+
+
+@router.get("/export/{clerkUserId}/{account_name}", dependencies=limited("bulk"))
+async def export_transactions(
+    clerkUserId: str,
+    account_name: str,
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    type: Optional[Literal["income", "expense"]] = None,
+    category: Optional[List[str]] = Query(None),
+):
+    account = await find_account(clerkUserId, account_name)
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export is not available here (needs pyarrow); use csv or ndjson")
+
+    query = build_transaction_query(account["_id"], from_date, to_date, type, category)
+    filename = f"{account_name}-transactions.{format}"
+    return StreamingResponse(
+        export_stream(query, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
+
+
+@router.post("/import/{clerkUserId}/{account_name}", dependencies=limited("bulk"))
+async def import_transactions_bulk(
+    request: Request,
+    clerkUserId: str,
+    account_name: str,
+    format: Literal["csv", "ndjson"] = "csv",
+    idempotency_key: Optional[str] = Header(None),
+):
+    """Stream a CSV (with header row) or NDJSON body of TransactionCreate rows into the account"""
+    account = await find_account(clerkUserId, account_name)
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
 
-    return {"transactions": account["transactions"]}
+    try:
+        report = await import_transactions(account, request.stream(), format, idempotency_key)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Upload must be UTF-8 encoded")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Malformed CSV: {e}")
 
+    if report["inserted"]:
+        await invalidate(account_tag(account["_id"]), user_tag(account["clerkUserId"]))
+    return report
 
 
-@router.post("/deletebulk/{accountId}")
+
+@router.post("/deletebulk/{accountId}", dependencies=limited("writes"))
 async def delete_transactions_bulk(accountId:str,
     transaction_ids: List[str] = Body(...)
 ):
-    print(transaction_ids)
     if not transaction_ids:
         raise HTTPException(status_code=400, detail="No transaction IDs provided")
 
-    # Step 1: Find the account by clerkUserId + name
-    account = await db.accounts.find_one({
-        "_id": ObjectId(accountId)
-    })
-
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
-
-    # Step 2: Match transaction IDs to delete
-    db_transaction_ids = [t["id"] for t in account.get("transactions", []) if "id" in t]
-    matching_ids = list(set(transaction_ids).intersection(set(db_transaction_ids)))
+    # Step 1: Match transaction IDs to delete (served from the accountId index)
+    query = {"accountId": ObjectId(accountId), "id": {"$in": transaction_ids}}
+    matching = await db.transactions.find(query, ROLLUP_FIELDS).to_list(None)
+    matching_ids = [t["id"] for t in matching]
 
     if not matching_ids:
         raise HTTPException(status_code=404, detail="No matching transactions found")
 
-    # Step 3: Pull matching transactions
-    result = await db.accounts.update_one(
-        {
-            "_id": ObjectId(accountId)
-        },
-        {
-            "$pull": {
-                "transactions": {
-                    "id": {"$in": matching_ids}
-                }
-            }
-        }
+    # Step 2: Delete matching transactions and take them out of the rollups
+    result = await db.transactions.delete_many(
+        {"accountId": ObjectId(accountId), "id": {"$in": matching_ids}}
     )
+    await apply_rollups(matching, sign=-1)
+    await delete_schedules(matching_ids)
+    await invalidate(account_tag(accountId), user_tag(matching[0]["clerkUserId"]))
 
     return {
         "message": "Transactions deleted successfully",
         "deleted_ids": matching_ids,
-        "modified_count": result.modified_count
+        "modified_count": result.deleted_count
     }
 
 
-@router.post("/deletetransaction/{transactionId}")
+@router.post("/deletetransaction/{transactionId}", dependencies=limited("writes"))
 async def delete_transaction(transactionId: str,data:DeleteTransactionRequest):
-    result = await db.accounts.update_one(
-        {"clerkUserId": data.clerkId, "name": data.accountName},
-        {"$pull": {"transactions": {"id": transactionId}}}
+    account = await find_account(data.clerkId, data.accountName)
+    if not account:
+        raise HTTPException(status_code=404, detail="Transaction not found or deletion failed")
+
+    deleted = await db.transactions.find_one_and_delete(
+        {"accountId": account["_id"], "id": transactionId},
+        projection=ROLLUP_FIELDS
     )
 
-    if result.modified_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Transaction not found or deletion failed")
 
+    await apply_rollups([deleted], sign=-1)
+    await delete_schedules([transactionId])
+    await invalidate(account_tag(account["_id"]), user_tag(account["clerkUserId"]))
+
     return {"message": "Transaction deleted successfully"}
 
-@router.post("/gettransaction/{transactionId}")
+@router.post("/gettransaction/{transactionId}", dependencies=limited("reads"))
 async def gettransaction(transactionId: str, data: DeleteTransactionRequest):
-    data1 = await db.accounts.find_one(
-        {"clerkUserId": data.clerkId, "name": data.accountName},
-        {"transactions": {"$elemMatch": {"id": transactionId}}}
-    )
-
-    if not data1 or "transactions" not in data1 or not data1["transactions"]:
+    account = await find_account(data.clerkId, data.accountName)
+    if not account:
         raise HTTPException(status_code=404, detail="Transaction not found")
 
-    data1["id"] = str(data1["_id"])  # convert ObjectId to string
+    transaction = await db.transactions.find_one(
+        {"accountId": account["_id"], "id": transactionId},
+        TRANSACTION_PROJECTION
+    )
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
 
     return {
-        "transaction": data1["transactions"][0],  # since $elemMatch returns one match
-        "id": data1["id"]
+        "transaction": transaction,
+        "id": str(account["_id"])  # convert ObjectId to string
     }
 
-@router.put("/edittransaction/{accountId}/{transactionId}")
+@router.put("/edittransaction/{accountId}/{transactionId}", dependencies=limited("writes"))
 async def edit_transaction(
     accountId: str,
     transactionId: str,
     data: Transaction  # ✅ Expect flat transaction data
 ):
-    update_result = await db.accounts.update_one(
+    changes = {
+        "type": data.type,
+        "amount": data.amount,
+        "description": data.description,
+        "date": data.date,
+        "category": data.category,
+        "isRecurring": data.isRecurring,
+    }
+    if data.recurringInterval:
+        changes["recurringInterval"] = data.recurringInterval
+    # Return the previous version so the rollups can move the old amount out
+    previous = await db.transactions.find_one_and_update(
         {
-            "_id": ObjectId(accountId),
-            "transactions.id": transactionId
+            "accountId": ObjectId(accountId),
+            "id": transactionId
         },
-        {
-            "$set": {
-                "transactions.$.type": data.type,
-                "transactions.$.amount": data.amount,
-                "transactions.$.description": data.description,
-                "transactions.$.date": data.date,
-                "transactions.$.category": data.category,
-                "transactions.$.isRecurring": data.isRecurring,
-            }
-        }
+        {"$set": changes},
+        projection=ROLLUP_FIELDS,
+        return_document=ReturnDocument.BEFORE
     )
 
-    if update_result.modified_count == 0:
+    if not previous:
         raise HTTPException(status_code=404, detail="Transaction not found or update failed")
 
+    await apply_rollups([previous], sign=-1)
+    await apply_rollups([{**previous, **changes}])
+    # Every edited field, so future occurrences pick up e.g. a new description too
+    await update_schedule_template(transactionId, changes, data.isRecurring)
+    await invalidate(account_tag(accountId), user_tag(previous["clerkUserId"]))
+
     return {"message": "Transaction updated successfully"}
+
+
+@router.post("/batch", dependencies=limited("bulk"))
+async def batch_mutate_transactions(data: BatchMutationRequest):
+    """Apply many edits, deletes and moves between the caller's accounts in one round of writes"""
+    if len(data.operations) > config.BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {config.BATCH_MAX_OPERATIONS} operations per batch")
+
+    try:
+        if data.atomic:
+            results, touched = await run_atomic_batch(data.clerkUserId, data.operations)
+        else:
+            results, touched = await run_batch(data.clerkUserId, data.operations)
+    except BatchAborted as e:
+        raise HTTPException(status_code=409, detail={"applied": False, "results": e.results})
+
+    await invalidate(*(account_tag(account_id) for account_id in touched), user_tag(data.clerkUserId))
+
+    return {
+        "applied": True,
+        "succeeded": sum(result["status"] == "ok" for result in results),
+        "failed": sum(result["status"] != "ok" for result in results),
+        "results": results,
+    }
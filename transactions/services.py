@@ -0,0 +1,127 @@
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from pymongo import ASCENDING, DESCENDING
+
+from database import accounts_collection, transactions_collection
+
+
+# Storage-only fields that are not part of the transaction API shape
+TRANSACTION_PROJECTION = {"_id": 0, "accountId": 0, "clerkUserId": 0}
+
+# Newest first, matching the accountId_date_id index
+TRANSACTION_SORT = [("date", DESCENDING), ("id", DESCENDING)]
+
+TRANSACTION_INDEXES = [
+    # `id` breaks ties between same-date rows so keyset pages never need an in-memory sort
+    ([("accountId", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {"name": "accountId_date_id"}),
+    ([("clerkUserId", ASCENDING), ("date", DESCENDING)], {"name": "clerkUserId_date"}),
+    ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+]
+
+
+async def ensure_transaction_indexes():
+    for keys, options in TRANSACTION_INDEXES:
+        await transactions_collection.create_index(keys, **options)
+
+
+NEXT_RECURRING = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+    "monthly": relativedelta(months=1),
+    "yearly": relativedelta(years=1),
+}
+
+
+def new_transaction(data, transaction_id: str = None) -> dict:
+    """Storage document for a validated TransactionCreate"""
+    data_dict = data.model_dump()
+    data_dict["id"] = transaction_id or str(uuid.uuid4())
+
+    # Convert Decimal to float and URL objects to str to make MongoDB happy
+    if isinstance(data_dict.get("amount"), Decimal):
+        data_dict["amount"] = float(data_dict["amount"])
+    if data_dict.get("receiptUrl") is not None:
+        data_dict["receiptUrl"] = str(data_dict["receiptUrl"])
+
+    now = datetime.utcnow()
+    data_dict["createdAt"] = now
+    data_dict["updatedAt"] = now
+    data_dict["lastProcessed"] = now
+
+    if data.recurringInterval is None:
+        data_dict["nextRecurringDate"] = None
+    else:
+        data_dict["nextRecurringDate"] = now + NEXT_RECURRING[data.recurringInterval]
+    return data_dict
+
+
+def link_transaction(txn: dict, account: dict) -> dict:
+    """Return a copy of txn carrying the owning account's lookup keys"""
+    doc = dict(txn)
+    doc["accountId"] = account["_id"]
+    doc["clerkUserId"] = account["clerkUserId"]
+    return doc
+
+
+async def find_account(clerk_user_id: str, account_name: str):
+    return await accounts_collection.find_one(
+        {"clerkUserId": clerk_user_id, "name": account_name},
+        {"_id": 1, "clerkUserId": 1},
+    )
+
+
+def month_range(year: int, month: int):
+    """Return [start, end) datetimes for a calendar month, rolling December into January"""
+    start = datetime(year, month, 1)
+    return start, start + relativedelta(months=1)
+
+
+def encode_cursor(txn: dict) -> str:
+    raw = json.dumps({"date": txn["date"].isoformat(), "id": txn["id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Return the (date, id) position encoded by encode_cursor; ValueError if malformed"""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["date"]), str(raw["id"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def build_transaction_query(account_id, from_date=None, to_date=None, type=None,
+                            categories=None, after=None) -> dict:
+    query = {"accountId": account_id}
+    if from_date or to_date:
+        query["date"] = {}
+        if from_date:
+            query["date"]["$gte"] = from_date
+        if to_date:
+            query["date"]["$lte"] = to_date
+    if type:
+        query["type"] = type
+    if categories:
+        query["category"] = {"$in": categories}
+    if after:
+        # Keyset condition: strictly older than the last row of the previous page
+        after_date, after_id = after
+        query["$or"] = [
+            {"date": {"$lt": after_date}},
+            {"date": after_date, "id": {"$lt": after_id}},
+        ]
+    return query
+
+
+async def get_transactions_page(query: dict, limit: int):
+    """Fetch one page plus a look-ahead row to know whether another page exists"""
+    rows = await transactions_collection.find(query, TRANSACTION_PROJECTION) \
+        .sort(TRANSACTION_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from schemas import UserCreate, UserResponse
 from database import db
+from pymongo.errors import DuplicateKeyError
+from app.cache import cached_json, email_tag, invalidate
 
 router = APIRouter()
 
@@ -15,7 +17,11 @@ async def createUser(data: UserCreate):
 
 
 
-    result = await db.users.insert_one(user_data)
+    try:
+        result = await db.users.insert_one(user_data)
+    except DuplicateKeyError:  # unique email index
+        raise HTTPException(status_code=400, detail="User already exists")
+    await invalidate(email_tag(data.email))
 
     # Set _id for response
     user_data["id"] = str(result.inserted_id)
@@ -23,10 +29,13 @@ async def createUser(data: UserCreate):
     return UserResponse(**user_data)
 
 @router.get("/user/{user_email}", response_model=UserResponse)
-async def get_user(user_email: str):
-    user = await db.users.find_one({"email": user_email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    user["id"] = str(user["_id"])  # Convert _id to string
-    del user["_id"]                # Remove original Mongo _id
-    return UserResponse(**user)
+async def get_user(user_email: str, request: Request):
+    async def build():
+        user = await db.users.find_one({"email": user_email})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user["id"] = str(user["_id"])  # Convert _id to string
+        del user["_id"]                # Remove original Mongo _id
+        return UserResponse(**user)
+
+    return await cached_json(request, "get_user", [email_tag(user_email)], build)